@@ -1,8 +1,11 @@
 from __future__ import annotations  
 from mechanics.position import Position
-import random
+from mechanics.conditions import CONDITION, DAMAGE, FlagSet
+from mechanics.dice import roll_die
 
 class Character:
+    is_troop = False  # see characters.troop
+
     def __init__(self, name, ability_scores, ac, initiative, speed, hitpoints, size, weapon, combat_style, flying_speed=0):
         from mechanics.combat import opportunity_attack  # Delayed import to avoid circular import issues
         
@@ -25,17 +28,23 @@ class Character:
         
         # Status Tracking
         self.conditions = set()
+        self.condition_saves = {}  # condition -> (ability, dc) of the save that ends it
         self.resistances = set()
         self.immunities = set()
         self.position = None  # Assigned later
+        self.battle_map = None  # mechanics.battle_map.BattleMap, None for open ground
         
         # Combat Mechanics
         self.is_surprised = False
         self.can_be_opportunity_attacked = True
         self.dicoTemporalite = {}
+        self.scheduler = None  # mechanics.scheduler.CombatScheduler while in a combat
         self.reactions = {}  
         self.reactions["Opportunity Attack"] = opportunity_attack
         self.has_used_reaction = False
+        self.action_table = None  # Compiled from self.actions on first use
+        self.bonus_action_table = None
+        self.attack_row = None  # mechanics.attack_matrix.AttackRow, built on first use
         
     def can_take_reaction(self) -> bool:
         """Determines if this character can take a reaction this round."""
@@ -60,7 +69,7 @@ class Character:
         
         self.fall_distance = min(self.fall_distance + 500, self.position.z)
         if self.position.z - self.fall_distance <= 0:
-            fall_damage = (self.fall_distance // 10) * random.randint(1, 6)  # 1d6 per 10 ft
+            fall_damage = (self.fall_distance // 10) * roll_die(6)  # 1d6 per 10 ft
             # subtract from current hit points
             self.hitpoints_current = max(self.hitpoints_current - fall_damage, 0)
             stats["damage_dealt"].setdefault(self.name, 0)
@@ -69,22 +78,62 @@ class Character:
             self.fall_distance = 0
             self.position.z = 0
 
-    def move_towards_target(self, target):
+    # conditions, resistances and immunities are interned bitmask sets
+    # (mechanics.conditions.FlagSet); assigning any iterable of names converts it
+
+    @property
+    def conditions(self):
+        return self._conditions
+
+    @conditions.setter
+    def conditions(self, names):
+        self._conditions = FlagSet(CONDITION, names)
+
+    @property
+    def resistances(self):
+        return self._resistances
+
+    @resistances.setter
+    def resistances(self, names):
+        self._resistances = FlagSet(DAMAGE, names)
+
+    @property
+    def immunities(self):
+        return self._immunities
+
+    @immunities.setter
+    def immunities(self, names):
+        self._immunities = FlagSet(DAMAGE, names)
+
+    def on_battle_map(self):
+        """Whether movement follows the battle map (flyers ignore ground obstacles)."""
+        return self.battle_map is not None and not self.is_flying
+
+    def move_towards_target(self, target, occupied=()):
         """Moves towards the target if out of melee range.
 
         The character will stop once it is within weapon range of the target so
-        it does not accidentally move _through_ the opponent.
+        it does not accidentally move _through_ the opponent.  On a battle map
+        it follows the target's flow field and does not stop in ``occupied``
+        cells.
         """
         if self.combat_style == "melee" and self.position.distance_to(target.position) > self.weapon["range"]:
+            if self.on_battle_map():
+                self.battle_map.move_towards(self.position, target.position, self.speed,
+                                             min_dist=self.weapon["range"], occupied=occupied)
+                return
             self.position.move_towards(
                 target.position,
                 self.flying_speed if self.is_flying else self.speed,
                 min_dist=self.weapon["range"],
             )
 
-    def move_away_from_target(self, target):
+    def move_away_from_target(self, target, occupied=()):
         """Moves away from the target if ranged."""
         if self.combat_style == "ranged":
+            if self.on_battle_map():
+                self.battle_map.move_away(self.position, target.position, self.speed, occupied=occupied)
+                return
             self.position.move_away(
                 target.position,
                 self.flying_speed if self.is_flying else self.speed,
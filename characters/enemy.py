@@ -8,8 +8,13 @@ if TYPE_CHECKING:
 class Enemy(Character):
     def __init__(self, name, ability_scores, ac, initiative, speed, hitpoints, saving_throws, proficiency_bonus, 
                  features_traits=None, actions=None, size="Medium", weapon=None, combat_style="melee", 
-                 multiattack=False, attack_count=1, flying_speed=0):
-        """Initializes an Enemy character with combat attributes."""
+                 multiattack=False, attack_count=1, flying_speed=0, legendary_actions=0, lair_action=None):
+        """Initializes an Enemy character with combat attributes.
+
+        legendary_actions is the number of legendary actions per round (each a
+        single weapon attack) and lair_action an optional callable
+        ``(creature, entities, stats)`` run on initiative count 20.
+        """
         super().__init__(name, ability_scores, ac, initiative, speed, hitpoints, size, weapon, combat_style, flying_speed)
         
         self.saving_throws = saving_throws
@@ -18,6 +23,9 @@ class Enemy(Character):
         self.actions = actions if actions else []
         self.multiattack = multiattack
         self.attack_count = max(1, attack_count)  # Ensures at least 1 attack
+        self.legendary_actions = legendary_actions
+        self.legendary_remaining = legendary_actions  # regained at the start of its turn
+        self.lair_action = lair_action
         
     def get_attack_count(self) -> int:
         """Returns the number of attacks an enemy can make in one turn."""
@@ -29,6 +29,12 @@ class PartyMember(Character):
         self.known_spells = []
         self.prepared_spells = []
         self.cantrips_known = 0
+        self.spell_policy = "random"  # see mechanics.spellbook.SPELL_POLICIES
+        self.spellbook = None
+
+        # Hit dice, spent during short rests (see simulation.adventuring_day)
+        self.hit_die = 8
+        self.hit_dice_remaining = level
         
         self._initialize_spellcasting()
     
@@ -37,6 +43,9 @@ class PartyMember(Character):
         class_data = self._load_class_data()
         if not class_data:
             return
+
+        if 'hd' in class_data:
+            self.hit_die = class_data['hd']['faces']
             
         # Set spellcasting ability
         if 'spellcastingAbility' in class_data:
@@ -86,7 +95,7 @@ class PartyMember(Character):
         else:
             slots = []
         
-        self.spell_slots = slots
+        self.spell_slots = list(slots)  # own copy: casting spends slots in place
     
     def can_cast_spells(self) -> bool:
         """Check if character can cast spells."""
@@ -94,10 +103,11 @@ class PartyMember(Character):
     
     def _initialize_default_spells(self):
         """Initialize some default spells for testing purposes."""
-        from mechanics.spells import CLASS_SPELL_LISTS, SPELL_DATA
+        from mechanics.spells import CLASS_SPELL_LISTS, load_spells
         max_spell_level = len(self.spell_slots) if self.spell_slots else 0
         class_spells = CLASS_SPELL_LISTS.get(self.char_class, [])
-        self.known_spells = [spell['name'] for spell in SPELL_DATA if spell['name'] in class_spells and spell['level'] <= max_spell_level]
+        names = [spell['name'] for spell in load_spells() if spell['name'] in class_spells and spell['level'] <= max_spell_level]
+        self.known_spells = list(dict.fromkeys(names))
     
     def get_class_info(self) -> str:
         """Returns a formatted string of the character's class and subclass."""
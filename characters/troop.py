@@ -0,0 +1,54 @@
+from __future__ import annotations
+import math
+from characters.enemy import Enemy
+from characters.party_member import PartyMember
+
+
+class TroopMixin:
+    """N identical creatures fighting as one unit (see mechanics.mass_combat).
+
+    ``hitpoints`` is per member; the unit's hitpoints_current and
+    hitpoints_maximum are the pool of all members, and every member whose
+    share of the pool is gone is a casualty, so damage takes members off in
+    bulk.  Members attack together, resolved as one multinomial draw.
+    """
+
+    is_troop = True
+
+    def _init_troop(self, count, member_hitpoints, attacks_per_member, frontage):
+        self.member_hitpoints = member_hitpoints
+        self.attacks_per_member = attacks_per_member
+        self.frontage = frontage  # members able to attack one Medium foe in melee
+
+    @property
+    def members(self) -> int:
+        """Members still standing."""
+        if self.hitpoints_current <= 0:
+            return 0
+        return math.ceil(self.hitpoints_current / self.member_hitpoints)
+
+    def formation_radius(self) -> float:
+        """Half the side of the square block the members stand in, in feet."""
+        return 5 * math.sqrt(self.members) / 2
+
+
+class Troop(TroopMixin, Enemy):
+    """A unit of identical enemies (a goblin warband, a siege company)."""
+
+    def __init__(self, name, count, ability_scores, ac, initiative, speed, hitpoints, saving_throws,
+                 proficiency_bonus, size="Medium", weapon=None, combat_style="melee", attack_count=1,
+                 frontage=8):
+        super().__init__(name, ability_scores, ac, initiative, speed, hitpoints * count, saving_throws,
+                         proficiency_bonus, size=size, weapon=weapon, combat_style=combat_style)
+        self._init_troop(count, hitpoints, attack_count, frontage)
+
+
+class PartyTroop(TroopMixin, PartyMember):
+    """A unit of identical allies fighting on the party's side (soldiers, militia)."""
+
+    def __init__(self, name, count, ability_scores, ac, initiative, speed, hitpoints, saving_throws,
+                 proficiency_bonus, size="Medium", weapon=None, combat_style="melee", attack_count=1,
+                 frontage=8):
+        super().__init__(name, "Troop", "", 1, ability_scores, ac, initiative, speed, hitpoints * count,
+                         saving_throws, proficiency_bonus, size=size, weapon=weapon, combat_style=combat_style)
+        self._init_troop(count, hitpoints, attack_count, frontage)
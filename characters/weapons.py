@@ -0,0 +1,41 @@
+"""Weapons of the GUI forms and the service payloads, by name."""
+
+WEAPONS = {
+    "Club": {"damage_dice": "1d4", "modifier": "STR", "damage_type": "bludgeoning", "range": 5},
+    "Dagger": {"damage_dice": "1d4", "modifier": "DEX", "damage_type": "piercing", "range": 5},
+    "Greatclub": {"damage_dice": "1d8", "modifier": "DEX", "damage_type": "bludgeoning", "range": 5},
+    "Handaxe": {"damage_dice": "1d6", "modifier": "DEX", "damage_type": "slashing", "range": 5},
+    "Javelin": {"damage_dice": "1d6", "modifier": "STR", "damage_type": "piercing", "range": 5},
+    "Light hammer": {"damage_dice": "1d4", "modifier": "STR", "damage_type": "bludgeoning", "range": 5},
+    "Mace": {"damage_dice": "1d6", "modifier": "STR", "damage_type": "bludgeoning", "range": 5},
+    "Quarterstaff": {"damage_dice": "1d6", "modifier": "DEX", "damage_type": "bludgeoning", "range": 5},
+    "Sickle": {"damage_dice": "1d4", "modifier": "DEX", "damage_type": "slashing", "range": 5},
+    "Spear": {"damage_dice": "1d6", "modifier": "STR", "damage_type": "piercing", "range": 5},
+    "Crossbow, light": {"damage_dice": "1d8", "modifier": "STR", "damage_type": "piercing", "range": 80},
+    "Dart": {"damage_dice": "1d14", "modifier": "DEX", "damage_type": "piercing", "range": 20},
+    "Shortbow": {"damage_dice": "1d6", "modifier": "DEX", "damage_type": "piercing", "range": 80},
+    "Sling": {"damage_dice": "1d4", "modifier": "DEX", "damage_type": "bludgeoning", "range": 30},
+    "Battleaxe": {"damage_dice": "1d8", "modifier": "STR", "damage_type": "slashing", "range": 5},
+    "Flail": {"damage_dice": "1d8", "modifier": "STR", "damage_type": "bludgeoning", "range": 5},
+    "Glaive": {"damage_dice": "1d10", "modifier": "STR", "damage_type": "slashing", "range": 10},
+    "Greataxe": {"damage_dice": "1d12", "modifier": "DEX", "damage_type": "slashing", "range": 5},
+    "Greatsword": {"damage_dice": "2d6", "modifier": "DEX", "damage_type": "slashing", "range": 5},
+    "Halberd": {"damage_dice": "1d10", "modifier": "STR", "damage_type": "slashing", "range": 10},
+    "Lance": {"damage_dice": "1d12", "modifier": "STR", "damage_type": "piercing", "range": 10},
+    "Longsword": {"damage_dice": "1d8", "modifier": "STR", "damage_type": "slashing", "range": 5},
+    "Maul": {"damage_dice": "2d6", "modifier": "DEX", "damage_type": "bludgeoning", "range": 5},
+    "Morningstar": {"damage_dice": "1d8", "modifier": "DEX", "damage_type": "piercing", "range": 5},
+    "Pike": {"damage_dice": "1d10", "modifier": "STR", "damage_type": "piercing", "range": 10},
+    "Rapier": {"damage_dice": "1d8", "modifier": "DEX", "damage_type": "piercing", "range": 5},
+    "Scimitar": {"damage_dice": "1d6", "modifier": "DEX", "damage_type": "slashing", "range": 5},
+    "Shortsword": {"damage_dice": "1d6", "modifier": "DEX", "damage_type": "piercing", "range": 5},
+    "Trident": {"damage_dice": "1d6", "modifier": "DEX", "damage_type": "piercing", "range": 5},
+    "War pick": {"damage_dice": "1d8", "modifier": "STR", "damage_type": "piercing", "range": 5},
+    "Warhammer": {"damage_dice": "1d8", "modifier": "STR", "damage_type": "bludgeoning", "range": 5},
+    "Whip": {"damage_dice": "1d4", "modifier": "DEX", "damage_type": "slashing", "range": 10},
+    "Blowgun": {"damage_dice": "1d1", "modifier": "DEX", "damage_type": "piercing", "range": 25},
+    "Crossbow, hand": {"damage_dice": "1d6", "modifier": "DEX", "damage_type": "piercing", "range": 30},
+    "Crossbow, heavy": {"damage_dice": "1d10", "modifier": "STR", "damage_type": "piercing", "range": 100},
+    "Longbow": {"damage_dice": "1d8", "modifier": "STR", "damage_type": "piercing", "range": 150},
+    "ClawsWyvern": {"damage_dice": "2d6", "modifier": "STR", "damage_type": "slashing", "range": 5},
+}
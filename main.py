@@ -1,9 +1,14 @@
 from characters.party_member import PartyMember
 from characters.enemy import Enemy
+from characters.weapons import WEAPONS
 from mechanics.combat import assign_default_actions
-from simulation.bulk_runner import analyze_combat_results_global, run_bulk_simulations, analyze_combat_results_per_entity
+from simulation.bulk_runner import run_bulk_simulations, distribution_figure_jobs
+from simulation.analysis import analyze_results
 import pandas as pd
-from utils.visualization import generate_combat_report
+from utils.visualization import combat_report_job, REPORT_METRICS
+from utils.report_jobs import render_artifacts
+from simulation.scenario_cache import ScenarioCache, SCENARIO_CACHE
+from simulation.results_store import WINNER_CODES
 from mechanics.position import initialize_positions
 import os
 from utils.regressionanalysis import RegressionAnalysis
@@ -11,47 +16,6 @@ from utils.montecarlo import MonteCarloSimulation
 import tkinter as tk
 from tkinter import ttk, messagebox
 
-# Define weapons as a dictionary for easy access
-WEAPONS = {
-    "Club": {"damage_dice": "1d4", "modifier": "STR", "damage_type": "bludgeoning", "range": 5},
-    "Dagger": {"damage_dice": "1d4", "modifier": "DEX", "damage_type": "piercing", "range": 5},
-    "Greatclub": {"damage_dice": "1d8", "modifier": "DEX", "damage_type": "bludgeoning", "range": 5},
-    "Handaxe": {"damage_dice": "1d6", "modifier": "DEX", "damage_type": "slashing", "range": 5},
-    "Javelin": {"damage_dice": "1d6", "modifier": "STR", "damage_type": "piercing", "range": 5},
-    "Light hammer": {"damage_dice": "1d4", "modifier": "STR", "damage_type": "bludgeoning", "range": 5},
-    "Mace": {"damage_dice": "1d6", "modifier": "STR", "damage_type": "bludgeoning", "range": 5},
-    "Quarterstaff": {"damage_dice": "1d6", "modifier": "DEX", "damage_type": "bludgeoning", "range": 5},
-    "Sickle": {"damage_dice": "1d4", "modifier": "DEX", "damage_type": "slashing", "range": 5},
-    "Spear": {"damage_dice": "1d6", "modifier": "STR", "damage_type": "piercing", "range": 5},
-    "Crossbow, light": {"damage_dice": "1d8", "modifier": "STR", "damage_type": "piercing", "range": 80},
-    "Dart": {"damage_dice": "1d14", "modifier": "DEX", "damage_type": "piercing", "range": 20},
-    "Shortbow": {"damage_dice": "1d6", "modifier": "DEX", "damage_type": "piercing", "range": 80},
-    "Sling": {"damage_dice": "1d4", "modifier": "DEX", "damage_type": "bludgeoning", "range": 30},
-    "Battleaxe": {"damage_dice": "1d8", "modifier": "STR", "damage_type": "slashing", "range": 5},
-    "Flail": {"damage_dice": "1d8", "modifier": "STR", "damage_type": "bludgeoning", "range": 5},
-    "Glaive": {"damage_dice": "1d10", "modifier": "STR", "damage_type": "slashing", "range": 10},
-    "Greataxe": {"damage_dice": "1d12", "modifier": "DEX", "damage_type": "slashing", "range": 5},
-    "Greatsword": {"damage_dice": "2d6", "modifier": "DEX", "damage_type": "slashing", "range": 5},
-    "Halberd": {"damage_dice": "1d10", "modifier": "STR", "damage_type": "slashing", "range": 10},
-    "Lance": {"damage_dice": "1d12", "modifier": "STR", "damage_type": "piercing", "range": 10},
-    "Longsword": {"damage_dice": "1d8", "modifier": "STR", "damage_type": "slashing", "range": 5},
-    "Maul": {"damage_dice": "2d6", "modifier": "DEX", "damage_type": "bludgeoning", "range": 5},
-    "Morningstar": {"damage_dice": "1d8", "modifier": "DEX", "damage_type": "piercing", "range": 5},
-    "Pike": {"damage_dice": "1d10", "modifier": "STR", "damage_type": "piercing", "range": 10},
-    "Rapier": {"damage_dice": "1d8", "modifier": "DEX", "damage_type": "piercing", "range": 5},
-    "Scimitar": {"damage_dice": "1d6", "modifier": "DEX", "damage_type": "slashing", "range": 5},
-    "Shortsword": {"damage_dice": "1d6", "modifier": "DEX", "damage_type": "piercing", "range": 5},
-    "Trident": {"damage_dice": "1d6", "modifier": "DEX", "damage_type": "piercing", "range": 5},
-    "War pick": {"damage_dice": "1d8", "modifier": "STR", "damage_type": "piercing", "range": 5},
-    "Warhammer": {"damage_dice": "1d8", "modifier": "STR", "damage_type": "bludgeoning", "range": 5},
-    "Whip": {"damage_dice": "1d4", "modifier": "DEX", "damage_type": "slashing", "range": 10},
-    "Blowgun": {"damage_dice": "1d1", "modifier": "DEX", "damage_type": "piercing", "range": 25},
-    "Crossbow, hand": {"damage_dice": "1d6", "modifier": "DEX", "damage_type": "piercing", "range": 30},
-    "Crossbow, heavy": {"damage_dice": "1d10", "modifier": "STR", "damage_type": "piercing", "range": 100},
-    "Longbow": {"damage_dice": "1d8", "modifier": "STR", "damage_type": "piercing", "range": 150},
-    "ClawsWyvern": {"damage_dice": "2d6", "modifier": "STR", "damage_type": "slashing", "range": 5},
-}
-
 # ---------- UI + entity creation ----------
 
 ABILITY_KEYS = ["STR", "DEX", "CON", "INT", "WIS", "CHA"]
@@ -59,10 +23,12 @@ SIZE_OPTIONS = ["Tiny", "Small", "Medium", "Large", "Huge", "Gargantuan"]
 STYLE_OPTIONS = ["melee", "ranged"]
 
 
-def parse_csv_list(text):
+def parse_csv_list(text, upper=False):
+    """Splits a comma-separated field; saving throws are upper-cased ("DEX"),
+    damage types are kept as typed (they are matched case-insensitively)."""
     if not text.strip():
         return []
-    return [item.strip().upper() for item in text.split(",") if item.strip()]
+    return [item.strip().upper() if upper else item.strip() for item in text.split(",") if item.strip()]
 
 
 def build_party_member(data):
@@ -78,7 +44,7 @@ def build_party_member(data):
         int(data["initiative"].get()),
         int(data["speed"].get()),
         int(data["hp"].get()),
-        parse_csv_list(data["saving_throws"].get()),
+        parse_csv_list(data["saving_throws"].get(), upper=True),
         int(data["proficiency_bonus"].get()),
         [],
         [],
@@ -103,7 +69,7 @@ def build_enemy(data):
         int(data["initiative"].get()),
         int(data["speed"].get()),
         int(data["hp"].get()),
-        parse_csv_list(data["saving_throws"].get()),
+        parse_csv_list(data["saving_throws"].get(), upper=True),
         int(data["proficiency_bonus"].get()),
         [],
         [],
@@ -120,65 +86,139 @@ def build_enemy(data):
     return enemy
 
 
-def run_pipeline(party, enemies, num_simulations):
-    for entity in party + enemies:
-        assign_default_actions(entity)
+def _load_history(path):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return pd.DataFrame()
+    df = pd.read_csv(path)
+    if 'winner' in df.columns:
+        # draws (round cap) stay in the history and count as non-wins, as in memory
+        df = df[df['winner'].isin(WINNER_CODES)]
+    return df
 
-    initialize_positions(party, enemies)
 
-    csv_file = "combat_stats.csv"
-    combat_results = run_bulk_simulations(party + enemies, num_simulations=num_simulations)
+REPORT_MODES = ("now", "deferred", "none")
 
-    if combat_results is not None and not combat_results.empty:
-        combat_results = combat_results.dropna(axis=1, how='all')
 
-        if "combat_nbr" not in combat_results.columns:
-            combat_results.insert(0, "combat_nbr", range(1, len(combat_results) + 1))
+def run_pipeline(party, enemies, num_simulations, reports="now", seed=0, cache_dir=SCENARIO_CACHE):
+    """Simulates, analyses and reports on an encounter.
 
-        def _load_clean(path):
-            if not os.path.exists(path) or os.path.getsize(path) == 0:
-                return pd.DataFrame()
-            df = pd.read_csv(path)
-            if 'winner' in df.columns:
-                df = df[df['winner'].isin(['party', 'enemies'])]
-            return df
-
-        existing = _load_clean(csv_file)
-        if existing.empty:
-            combat_results.to_csv(csv_file, index=False)
-        else:
-            combined = pd.concat([existing, combat_results], ignore_index=True)
-            combined = combined.dropna(axis=1, how='all')
-            combined.to_csv(csv_file, index=False)
+    reports="now" renders every figure and PDF (in parallel, reusing unchanged
+    ones), "deferred" returns the pending ArtifactJobs for the caller to pass
+    to render_artifacts later, and "none" skips them for batch jobs.
+
+    Positions and combats are seeded, so the same party, enemies and seed
+    always give the same results.  With a cache_dir (see
+    simulation.scenario_cache) a repeated request reuses the scenario's own
+    results, a larger num_simulations only plays the extra combats, and only
+    combats not played before are appended to combat_stats.csv.  The Monte
+    Carlo and regression analyses cover the whole CSV history, which other
+    scenarios add to, so they are always recomputed.
+
+    Returns (combined_results, pending_jobs).
+    """
+    if reports not in REPORT_MODES:
+        raise ValueError(f"Invalid reports mode: {reports}")
+
+    for entity in party + enemies:
+        assign_default_actions(entity)
+
+    initialize_positions(party, enemies, seed=seed)
 
-    analysism = MonteCarloSimulation(csv_file)
-    mc_summary = analysism.run_analysis()
+    csv_file = "combat_stats.csv"
+    cache = ScenarioCache(cache_dir) if cache_dir else None
+    fingerprint = cache.fingerprint(party + enemies, seed) if cache else None
+    cached = cache.load_summary(fingerprint, num_simulations) if cache else None
+    if cached is not None:
+        scenario_results, jobs = cached
+        history = _load_history(csv_file)
+    else:
+        scenario_results, jobs, history = _run_scenario(party + enemies, num_simulations, seed, csv_file,
+                                                        cache, fingerprint)
+
+    # one analysis pass over the history for the metrics both analyses ask for
+    history_metrics = set(MonteCarloSimulation.REQUIRED_METRICS) | set(RegressionAnalysis.REQUIRED_METRICS)
+    history_aggregates = analyze_results(history, history_metrics) or {}
+
+    # fixed seed so unchanged aggregates reproduce the same (cached) plot
+    analysism = MonteCarloSimulation(csv_file, seed=0)
+    mc_summary = analysism.run_analysis(aggregates=history_aggregates, render=False)
 
     analysis = RegressionAnalysis(csv_file)
-    reg_summary = analysis.run_analysis()
-
-    analysis_results1 = analyze_combat_results_per_entity(combat_results)
-    analysis_results = analyze_combat_results_global(combat_results)
-
-    spell_effectiveness_report = {}
-    from simulation.bulk_runner import get_spell_effectiveness_data, compute_spell_effectiveness
-    spell_effectiveness_data = get_spell_effectiveness_data()
-    if spell_effectiveness_data:
-        spell_effectiveness_report = compute_spell_effectiveness(spell_effectiveness_data)
-
-    combined_results = {}
-    if isinstance(analysis_results1, dict):
-        combined_results.update(analysis_results1)
-    if isinstance(analysis_results, dict):
-        combined_results.update(analysis_results)
+    reg_summary = analysis.run_analysis(aggregates=history_aggregates, render=False)
+
+    combined_results = dict(scenario_results)
+    jobs = list(jobs)
     if mc_summary:
         combined_results["Monte Carlo Analysis"] = mc_summary
+        jobs += analysism.artifact_jobs()
     if reg_summary:
         combined_results["Regression Analysis"] = reg_summary
-    if spell_effectiveness_report:
-        combined_results["Spell Effectiveness Analysis"] = spell_effectiveness_report
+        jobs += analysis.artifact_jobs(reg_summary)
+    jobs.append(combat_report_job(combined_results, "combat_simulation_report.pdf"))
+    return _finish_reports(combined_results, jobs, reports)
+
+
+def _run_scenario(entities, num_simulations, seed, csv_file, cache, fingerprint):
+    """Plays the scenario, appends its new combats to the CSV history and analyses them.
+
+    Returns (scenario_results, figure_jobs, history); the first two are what
+    the scenario cache keeps.
+    """
+    if cache:
+        already_played = cache.cached_combats(fingerprint)
+        combat_results = run_bulk_simulations(entities, num_simulations=num_simulations, seed=seed,
+                                              checkpoint_path=cache.checkpoint_path(fingerprint))
+    else:
+        already_played = 0
+        combat_results = run_bulk_simulations(entities, num_simulations=num_simulations, seed=seed)
+
+    # every row on disk, kept in memory so the analyses never re-read the CSV
+    if combat_results is not None and not combat_results.empty:
+        combat_results = combat_results.dropna(axis=1, how='all')
+
+        if "combat_nbr" not in combat_results.columns:
+            combat_results.insert(0, "combat_nbr", range(1, len(combat_results) + 1))
 
-    generate_combat_report(combined_results, "combat_simulation_report.pdf")
+        # combats played by an earlier request are already in the CSV
+        new_results = combat_results.iloc[already_played:]
+        existing = _load_history(csv_file)
+        if new_results.empty:
+            history = existing
+        elif existing.empty:
+            history = new_results
+        else:
+            history = pd.concat([existing, new_results], ignore_index=True)
+            history = history.dropna(axis=1, how='all')
+        if not new_results.empty:
+            history.to_csv(csv_file, index=False)
+    else:
+        history = _load_history(csv_file)
+
+    # one pass over this run's results for everything the report shows
+    run_aggregates = analyze_results(combat_results, REPORT_METRICS)
+
+    from simulation.bulk_runner import get_run_aggregates
+    streamed = get_run_aggregates()
+    scenario_results = dict(run_aggregates or {})
+    if streamed:
+        spell_effectiveness_report = streamed.spell_report()
+        if spell_effectiveness_report:
+            scenario_results["Spell Effectiveness Analysis"] = spell_effectiveness_report
+    jobs = distribution_figure_jobs(run_aggregates, streamed)
+
+    if cache:
+        cache.save_summary(fingerprint, num_simulations, (scenario_results, jobs))
+    return scenario_results, jobs, history
+
+
+def _finish_reports(combined_results, jobs, reports):
+    """Renders, defers or drops the report jobs according to ``reports``."""
+    if reports == "none":
+        return combined_results, []
+    if reports == "deferred":
+        return combined_results, jobs
+    render_artifacts(jobs)
+    return combined_results, []
 
 
 def make_labeled_entry(parent, row, label, default=""):
@@ -282,8 +322,13 @@ class CombatApp:
         self.num_simulations = tk.StringVar(value="100")
         ttk.Entry(top, textvariable=self.num_simulations, width=8).grid(row=0, column=5, padx=5, pady=5)
 
-        ttk.Button(top, text="Generate forms", command=self.generate_forms).grid(row=0, column=6, padx=10, pady=5)
-        ttk.Button(top, text="Run simulation", command=self.run_simulation).grid(row=0, column=7, padx=10, pady=5)
+        # same scenario and seed reuse the cached combats; change the seed for a fresh sample
+        ttk.Label(top, text="Seed").grid(row=0, column=6, padx=5, pady=5, sticky="w")
+        self.seed = tk.StringVar(value="0")
+        ttk.Entry(top, textvariable=self.seed, width=10).grid(row=0, column=7, padx=5, pady=5)
+
+        ttk.Button(top, text="Generate forms", command=self.generate_forms).grid(row=0, column=8, padx=10, pady=5)
+        ttk.Button(top, text="Run simulation", command=self.run_simulation).grid(row=0, column=9, padx=10, pady=5)
 
         self.canvas = tk.Canvas(root, height=700)
         self.scrollbar = ttk.Scrollbar(root, orient="vertical", command=self.canvas.yview)
@@ -333,11 +378,13 @@ class CombatApp:
             num_simulations = int(self.num_simulations.get())
             if num_simulations < 1:
                 raise ValueError
+            seed = int(self.seed.get())
 
             party = [build_party_member(form) for form in self.party_forms]
             enemies = [build_enemy(form) for form in self.enemy_forms]
 
-            run_pipeline(party, enemies, num_simulations)
+            # a repeated run of the same scenario and seed is served (and topped up) from the cache
+            run_pipeline(party, enemies, num_simulations, seed=seed)
 
             messagebox.showinfo(
                 "Done",
@@ -0,0 +1,132 @@
+from __future__ import annotations
+import random
+from bisect import bisect_right
+
+# Requirement bits an action may declare.  An action is only eligible when
+# every bit it requires is present in the mask of satisfied conditions.
+NEEDS_TARGET = 1
+NEEDS_SLOTS = 2
+
+ACTION = "action"
+BONUS_ACTION = "bonus"
+
+
+def action_requirements(action):
+    """Returns the requirement mask declared by an action dictionary."""
+    mask = 0
+    if action.get("target_required"):
+        mask |= NEEDS_TARGET
+    if action.get("slots_required"):
+        mask |= NEEDS_SLOTS
+    return mask
+
+
+class ActionTable:
+    """Weighted action sampler compiled from a character's action list.
+
+    Cumulative weight arrays are precomputed for every combination of the
+    requirement bits used by the actions, so picking an action is a single
+    ``random.random()`` plus a bisect, and actions whose requirements are not
+    met (no target, no spell slots) can never be drawn.
+    """
+
+    def __init__(self, actions, kind=ACTION):
+        self.source = actions
+        self.source_len = len(actions)
+        self.kind = kind
+        self.entries = [
+            a for a in actions
+            if a.get("type", ACTION) == kind and callable(a.get("mechanic")) and a.get("weight", 1) > 0
+        ]
+
+        used_bits = 0
+        for action in self.entries:
+            used_bits |= action_requirements(action)
+        self.used_bits = used_bits
+
+        # enumerate every subset of the used bits and precompute its table
+        self._tables = {}
+        subset = used_bits
+        while True:
+            self._tables[subset] = self._build(subset)
+            if subset == 0:
+                break
+            subset = (subset - 1) & used_bits
+
+    def _build(self, satisfied):
+        """Builds (cumulative weights, actions) for a satisfied-requirement mask."""
+        cumulative = []
+        eligible = []
+        total = 0
+        for action in self.entries:
+            if action_requirements(action) & ~satisfied:
+                continue
+            total += action.get("weight", 1)
+            cumulative.append(total)
+            eligible.append(action)
+        return cumulative, eligible
+
+    def is_stale(self, actions):
+        """True if the table no longer reflects the given action list."""
+        return actions is not self.source or len(actions) != self.source_len
+
+    def probabilities(self, satisfied):
+        """Returns [(action, probability)] for the eligible actions."""
+        cumulative, eligible = self._tables[satisfied & self.used_bits]
+        if not eligible:
+            return []
+        total = cumulative[-1]
+        previous = 0
+        result = []
+        for action, running in zip(eligible, cumulative):
+            result.append((action, (running - previous) / total))
+            previous = running
+        return result
+
+    def pick(self, satisfied):
+        """Draws an eligible action, or returns None if none is eligible."""
+        cumulative, eligible = self._tables[satisfied & self.used_bits]
+        if not eligible:
+            return None
+        r = random.random() * cumulative[-1]
+        return eligible[bisect_right(cumulative, r)]
+
+
+def compile_action_tables(character):
+    """Compiles and caches the action and bonus action tables of a character."""
+    actions = character.actions
+    character.action_table = ActionTable(actions, ACTION)
+    character.bonus_action_table = ActionTable(actions, BONUS_ACTION)
+
+
+def get_action_table(character, kind=ACTION):
+    """Returns the compiled table of the requested kind, rebuilding it if stale."""
+    attr = "action_table" if kind == ACTION else "bonus_action_table"
+    table = getattr(character, attr, None)
+    if table is None or table.is_stale(character.actions):
+        compile_action_tables(character)
+        table = getattr(character, attr)
+    return table
+
+
+def satisfied_requirements(character, target):
+    """Computes the mask of requirements currently met for a character."""
+    mask = 0
+    if target is not None:
+        mask |= NEEDS_TARGET
+    if hasattr(character, "can_cast_spells") and character.can_cast_spells():
+        if target is None:
+            mask |= NEEDS_SLOTS
+        else:
+            # only when a spell can actually be cast at this target
+            from mechanics.spellbook import get_spellbook
+            if get_spellbook(character).castable(character, target):
+                mask |= NEEDS_SLOTS
+    return mask
+
+
+def perform_action(character, action, target, stats):
+    """Dispatches directly to the callable stored in the action."""
+    if action.get("target_required"):
+        return action["mechanic"](character, target, stats)
+    return action["mechanic"](character)
@@ -0,0 +1,110 @@
+"""Area-of-effect templates and spatial queries.
+
+Templates are the four 5e shapes.  A sphere is centred on its origin; a
+cone, line or cube starts at its origin (usually the caster) and points
+towards an aim point.  A cone is as wide as it is far from its origin, a
+line is 5 ft wide and a cube is axis-aligned.  A creature is caught when
+the template covers any part of its space, so every test allows half a
+5-ft square of slack around the creature's position.
+
+All queries are vectorised: k candidate placements are tested against n
+creatures in one (k, n) numpy mask.
+"""
+import numpy as np
+
+SHAPES = ("sphere", "cone", "line", "cube")
+LINE_WIDTH = 5
+CREATURE_RADIUS = 2.5
+
+
+def positions_array(creatures):
+    return np.array([[c.position.x, c.position.y, c.position.z] for c in creatures], dtype=float).reshape(-1, 3)
+
+
+def area_masks(shape, size, origins, aims, points):
+    """(k, n) mask of which of the n ``points`` each of the k placements covers.
+
+    ``origins`` and ``aims`` are (k, 3) arrays; aims are ignored for spheres
+    and for cubes centred on their origin (``aims`` of None).
+    """
+    origins = np.asarray(origins, dtype=float).reshape(-1, 3)
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    if shape == "sphere":
+        offsets = points[None, :, :] - origins[:, None, :]
+        return np.linalg.norm(offsets, axis=2) <= size + CREATURE_RADIUS
+
+    if shape == "cube" and aims is None:
+        centres = origins
+    else:
+        directions = np.asarray(aims, dtype=float).reshape(-1, 3) - origins
+        norms = np.linalg.norm(directions, axis=1, keepdims=True)
+        directions = np.divide(directions, norms, out=np.zeros_like(directions), where=norms > 0)
+        if shape == "cube":
+            # the cube's near face touches its origin
+            centres = origins + directions * size / 2
+        else:
+            offsets = points[None, :, :] - origins[:, None, :]
+            along = np.einsum("knd,kd->kn", offsets, directions)
+            across = np.linalg.norm(offsets - along[:, :, None] * directions[:, None, :], axis=2)
+            half_width = along / 2 if shape == "cone" else LINE_WIDTH / 2
+            return (along > 0) & (along <= size + CREATURE_RADIUS) & (across <= half_width + CREATURE_RADIUS)
+
+    offsets = np.abs(points[None, :, :] - centres[:, None, :])
+    return np.all(offsets <= size / 2 + CREATURE_RADIUS, axis=2)
+
+
+def best_placement(area, caster, foes, allies=(), max_range=0):
+    """Template placement that catches the most foes for the fewest allies.
+
+    ``area`` comes from mechanics.spells.get_spell_area.  Templates with a
+    "self" origin start at the caster and are aimed at each foe in turn;
+    "point" templates are centred on a foe or between two foes, within
+    ``max_range`` feet of the caster.  The caster counts as an ally for
+    point templates only, since self templates spare their origin.
+
+    Returns:
+        (origin, aim, foes_hit, allies_hit) with the hit lists, or None if
+        no placement catches more foes than allies.
+    """
+    if not foes:
+        return None
+    foe_points = positions_array(foes)
+    caster_point = positions_array([caster])[0]
+    shape, size = area["shape"], area["size"]
+
+    if area["origin"] == "self":
+        if shape == "sphere":
+            origins, aims = caster_point[None, :], None
+        else:
+            aims = foe_points
+            origins = np.repeat(caster_point[None, :], len(aims), axis=0)
+        friends = [a for a in allies if a is not caster]
+    else:
+        pairs = [(foe_points[i] + foe_points[j]) / 2
+                 for i in range(len(foes)) for j in range(i + 1, len(foes))]
+        origins = np.vstack([foe_points] + pairs) if pairs else foe_points
+        if max_range:
+            origins = origins[np.linalg.norm(origins - caster_point, axis=1) <= max_range]
+        if not len(origins):
+            return None
+        aims = None
+        friends = list(allies) if caster in allies else [caster] + list(allies)
+
+    foes_mask = area_masks(shape, size, origins, aims, foe_points)
+    if friends:
+        allies_mask = area_masks(shape, size, origins, aims, positions_array(friends))
+    else:
+        allies_mask = np.zeros((len(origins), 0), dtype=bool)
+    foes_hit = foes_mask.sum(axis=1)
+    allies_hit = allies_mask.sum(axis=1)
+    # most foes net of allies; ties go to the placement sparing more allies
+    best = int(np.lexsort((allies_hit, -(foes_hit - allies_hit)))[0])
+    if foes_hit[best] <= allies_hit[best]:
+        return None
+    aim = None if aims is None else aims[best]
+    return (
+        origins[best],
+        aim,
+        [f for f, hit in zip(foes, foes_mask[best]) if hit],
+        [a for a, hit in zip(friends, allies_mask[best]) if hit],
+    )
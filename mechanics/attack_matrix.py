@@ -0,0 +1,118 @@
+"""Precomputed weapon attacks for every attacker/target pair.
+
+A swing used to look up the attack modifier, add up advantage from both
+creatures and their conditions, compare against AC, parse the damage dice
+and check resistances.  Now each attacker has an AttackRow: the attack
+bonus and parsed damage dice, plus one AttackEntry per (target, melee or
+not) with the d20 needed to hit, the advantage, the crit rule and the
+damage multiplier.  A swing is an entry lookup and a roll.
+
+An entry is stamped with the state it was computed from (the target's AC,
+both creatures' advantage and conditions, the target's resistances and
+immunities) and is recomputed only when that state has changed.  The
+attacker side (weapon, attacking ability score and proficiency) is the
+row's key: rows are shared by deep copies of their creature, so entries
+carry over between the combats of a run, and a copy whose weapon or scores
+were changed afterwards gets a row of its own on its next swing.
+"""
+from mechanics.conditions import advantage, condition_effects, damage_bit
+from mechanics.dice import roll_die, roll_dice
+
+FULL, HALF, NONE = 1, 2, 0  # damage multipliers: normal, resisted, immune
+
+
+def attacker_key(attacker):
+    """Everything about the attacker an AttackRow is computed from."""
+    weapon = attacker.weapon
+    return (sorted(weapon.items()), attacker.ability_scores.get(weapon.get("modifier")),
+            attacker.proficiency_bonus)
+
+
+class AttackEntry:
+    """What one swing of an attacker at a target needs, for a given state."""
+
+    def __init__(self, row, attacker, target, melee, stamp):
+        from mechanics.combat import resolve_attack_roll
+        self.stamp = stamp
+        bonus = row.bonus(attacker)
+        # lowest natural roll that hits (21: nothing does)
+        self.threshold = next((n for n in range(1, 21) if resolve_attack_roll(n, bonus, target)[0]), 21)
+        score = attacker.attack_advantage + target.defense_advantage + advantage(attacker, target, melee)
+        self.advantage = (score > 0) - (score < 0)
+        # hits from within 5 feet on a paralyzed or unconscious creature are crits
+        self.autocrit = melee and condition_effects(target.conditions.mask).melee_autocrit
+        if target.immunities.mask & row.damage_bit:
+            self.multiplier = NONE
+        elif target.resistances.mask & row.damage_bit:
+            self.multiplier = HALF
+        else:
+            self.multiplier = FULL
+
+    def roll_d20(self):
+        if self.advantage > 0:
+            return max(roll_die(20), roll_die(20))  # Advantage
+        if self.advantage < 0:
+            return min(roll_die(20), roll_die(20))  # Disadvantage
+        return roll_die(20)
+
+    def mitigate(self, damage):
+        """Damage left after the target's immunity or resistance (as mitigate_damage)."""
+        if damage <= 0 or self.multiplier == NONE:
+            return 0
+        if self.multiplier == HALF:
+            return max(1, damage // 2)
+        return damage
+
+
+class AttackRow:
+    """An attacker's weapon attack against each target it has swung at."""
+
+    def __init__(self, attacker):
+        weapon = attacker.weapon
+        self.key = attacker_key(attacker)
+        self.num_dice, self.die = map(int, weapon["damage_dice"].split('d'))
+        self.damage_type = weapon["damage_type"]
+        self.damage_bit = damage_bit(self.damage_type)
+        self._bonus = None
+        self.entries = {}
+        self.entries_built = 0
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def bonus(self, attacker):
+        # computed on first use: creatures that never attack may lack the ability
+        if self._bonus is None:
+            from mechanics.combat import attack_bonus
+            self._bonus = attack_bonus(attacker)
+        return self._bonus
+
+    def entry(self, attacker, target, melee):
+        stamp = (target.ac, target.defense_advantage, target.conditions.mask, target.resistances.mask,
+                 target.immunities.mask, attacker.attack_advantage, attacker.conditions.mask)
+        key = (target.name, melee)
+        entry = self.entries.get(key)
+        if entry is None or entry.stamp != stamp:
+            entry = self.entries[key] = AttackEntry(self, attacker, target, melee, stamp)
+            self.entries_built += 1
+        return entry
+
+    def roll_damage(self):
+        return roll_dice(self.num_dice, self.die)
+
+
+def build_attack_row(attacker):
+    attacker.attack_row = AttackRow(attacker) if attacker.weapon else None
+    return attacker.attack_row
+
+
+def get_attack_row(attacker):
+    """The attacker's row, built on first use for creatures set up without assign_default_actions.
+
+    Rebuilt when the attacker's weapon, ability scores or proficiency no
+    longer match the row, e.g. a copy modified after assign_default_actions.
+    """
+    row = attacker.attack_row
+    if row is None or row.key != attacker_key(attacker):
+        row = build_attack_row(attacker)
+    return row
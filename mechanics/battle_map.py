@@ -0,0 +1,183 @@
+"""Grid battle map with obstacles, terrain costs and shared flow fields.
+
+The map is a grid of 5-ft cells.  Obstacles cannot be entered and terrain
+multiplies the cost of entering a cell (2 for difficult terrain).  Moving
+diagonally costs the same as moving orthogonally, as in the 5e default rule.
+
+Instead of searching a path per mover, the map computes one distance field
+per goal cell (a Dijkstra over the whole grid, run in C by
+scipy.sparse.csgraph) and caches it.  Every creature heading for the same
+foe descends the same field, and a fleeing creature climbs its threat's
+field, so a round costs at most one field per target.
+
+A map is shared, not copied, when combatants are deep-copied for each
+combat, so its cached fields carry over between combats.
+"""
+from collections import OrderedDict
+import math
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+CELL_SIZE = 5
+DIFFICULT_TERRAIN = 2
+NEIGHBOURS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+
+
+class BattleMap:
+    """A ``width`` x ``height`` cell grid.
+
+    Args:
+        width, height: size in cells.
+        obstacles: iterable of impassable (cx, cy) cells.
+        terrain: dict of (cx, cy) -> movement cost multiplier.
+        cell_size: feet per cell.
+        max_cached_fields: distance fields kept (least recently used dropped).
+    """
+
+    def __init__(self, width, height, obstacles=(), terrain=None, cell_size=CELL_SIZE, max_cached_fields=256):
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.max_cached_fields = max_cached_fields
+        self.cost = np.ones((width, height))
+        for cell, multiplier in (terrain or {}).items():
+            if self.in_bounds(cell):
+                self.cost[cell] = multiplier
+        self.passable = np.ones((width, height), dtype=bool)
+        for cell in obstacles:
+            if self.in_bounds(cell):
+                self.passable[cell] = False
+        self._graph = self._build_graph()
+        self._fields = OrderedDict()
+        self.fields_computed = 0
+
+    @classmethod
+    def around(cls, entities, margin=10, **kwargs):
+        """A map large enough for the entities' positions plus a margin of cells."""
+        width = max(int(e.position.x // CELL_SIZE) for e in entities) + margin + 1
+        height = max(int(e.position.y // CELL_SIZE) for e in entities) + margin + 1
+        return cls(width, height, **kwargs)
+
+    def __deepcopy__(self, memo):
+        # shared by every copy of the combatants: the map itself never changes
+        return self
+
+    def describe(self):
+        """JSON-able layout of the map (for scenario fingerprints)."""
+        blocked = np.argwhere(~self.passable).tolist()
+        terrain = [[x, y, float(self.cost[x, y])] for x, y in np.argwhere(self.cost != 1).tolist()]
+        return {"size": [self.width, self.height, self.cell_size], "obstacles": blocked, "terrain": terrain}
+
+    def _index(self, cell):
+        return cell[0] * self.height + cell[1]
+
+    def _build_graph(self):
+        """Sparse graph whose edge weights are the cost of entering the destination."""
+        xs, ys = np.meshgrid(np.arange(self.width), np.arange(self.height), indexing="ij")
+        sources, targets, weights = [], [], []
+        for dx, dy in NEIGHBOURS:
+            nx, ny = xs + dx, ys + dy
+            valid = (nx >= 0) & (nx < self.width) & (ny >= 0) & (ny < self.height)
+            sx, sy, tx, ty = xs[valid], ys[valid], nx[valid], ny[valid]
+            ok = self.passable[sx, sy] & self.passable[tx, ty]
+            sources.append(sx[ok] * self.height + sy[ok])
+            targets.append(tx[ok] * self.height + ty[ok])
+            weights.append(self.cost[tx[ok], ty[ok]] * self.cell_size)
+        size = self.width * self.height
+        return csr_matrix(
+            (np.concatenate(weights), (np.concatenate(sources), np.concatenate(targets))), shape=(size, size)
+        )
+
+    def in_bounds(self, cell):
+        return 0 <= cell[0] < self.width and 0 <= cell[1] < self.height
+
+    def is_passable(self, cell):
+        return self.in_bounds(cell) and bool(self.passable[cell])
+
+    def cell_of(self, position):
+        cell = (int(round(position.x / self.cell_size)), int(round(position.y / self.cell_size)))
+        return (min(max(cell[0], 0), self.width - 1), min(max(cell[1], 0), self.height - 1))
+
+    def place(self, position, cell):
+        """Moves a Position to the centre of a cell (keeping its altitude)."""
+        position.x = cell[0] * self.cell_size
+        position.y = cell[1] * self.cell_size
+
+    def snap(self, position, occupied=()):
+        """Moves a position to the nearest free, passable cell."""
+        start = self.cell_of(position)
+        best = min(
+            ((cx, cy) for cx in range(self.width) for cy in range(self.height)
+             if self.passable[cx, cy] and (cx, cy) not in occupied),
+            key=lambda c: (c[0] - start[0]) ** 2 + (c[1] - start[1]) ** 2,
+            default=start,
+        )
+        self.place(position, best)
+        return best
+
+    def distance_field(self, goal):
+        """Movement cost in feet from every cell to ``goal`` (inf if unreachable)."""
+        if goal in self._fields:
+            self._fields.move_to_end(goal)
+            return self._fields[goal]
+        # distances *to* the goal are distances from it on the reversed graph
+        field = dijkstra(self._graph.T, directed=True, indices=self._index(goal)).reshape(self.width, self.height)
+        self.fields_computed += 1
+        self._fields[goal] = field
+        if len(self._fields) > self.max_cached_fields:
+            self._fields.popitem(last=False)
+        return field
+
+    def _walk(self, start, field, speed, sign, stop, occupied):
+        """Greedy walk down (sign 1) or up (sign -1) a field; returns the last free cell reached."""
+        path = [start]
+        cell = start
+        budget = speed
+        while not stop(cell):
+            candidates = []
+            for dx, dy in NEIGHBOURS:
+                nxt = (cell[0] + dx, cell[1] + dy)
+                # unreachable cells (inf) are never stepped into, even when fleeing
+                if self.is_passable(nxt) and np.isfinite(field[nxt]) and sign * field[nxt] < sign * field[cell]:
+                    candidates.append(nxt)
+            if not candidates:
+                break
+            # prefer the best field value, then the straightest step
+            nxt = min(candidates, key=lambda c: (sign * field[c], abs(c[0] - cell[0]) + abs(c[1] - cell[1])))
+            step = self.cost[nxt] * self.cell_size
+            if step > budget:
+                break
+            budget -= step
+            cell = nxt
+            path.append(cell)
+        # creatures may pass through each other but not end their move together
+        while len(path) > 1 and path[-1] in occupied:
+            path.pop()
+        return path[-1]
+
+    def move_towards(self, position, goal, speed, min_dist=0, occupied=()):
+        """Moves ``position`` along the goal's field until within ``min_dist`` feet of it."""
+        field = self.distance_field(self.cell_of(goal))
+
+        def within_reach(cell):
+            dx = cell[0] * self.cell_size - goal.x
+            dy = cell[1] * self.cell_size - goal.y
+            return math.sqrt(dx * dx + dy * dy + (position.z - goal.z) ** 2) <= min_dist
+
+        cell = self._walk(self.cell_of(position), field, speed, 1, within_reach, occupied)
+        self.place(position, cell)
+
+    def move_away(self, position, threat, speed, occupied=()):
+        """Moves ``position`` up the threat's field, i.e. away from it along real paths."""
+        field = self.distance_field(self.cell_of(threat))
+        cell = self._walk(self.cell_of(position), field, speed, -1, lambda c: False, occupied)
+        self.place(position, cell)
+
+
+def assign_battle_map(entities, battle_map):
+    """Puts every combatant on the map, snapping each onto its own free cell."""
+    occupied = set()
+    for entity in entities:
+        entity.battle_map = battle_map
+        occupied.add(battle_map.snap(entity.position, occupied))
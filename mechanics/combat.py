@@ -2,6 +2,12 @@ from __future__ import annotations
 import random
 from mechanics.position import Position
 from mechanics.position import closest_enemy, distance
+from mechanics.attack_matrix import build_attack_row, get_attack_row
+from mechanics.conditions import condition_effects, damage_bit, repeat_saves
+from mechanics.reactions import SHIELD_AC, are_foes, react_to_hit
+from mechanics.dice import roll_dice
+from mechanics import event_log
+from mechanics.actions import BONUS_ACTION, compile_action_tables, get_action_table, perform_action, satisfied_requirements
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
@@ -10,6 +16,11 @@ if TYPE_CHECKING:
 
 # runtime imports are placed inside functions to avoid circular import problems
 
+MAX_ROUNDS = 100  # safety cap: a fight where everyone flees never ends on its own
+# bump whenever a rule change alters combat outcomes, so stored results keyed
+# on a scenario fingerprint are not reused across engine versions
+ENGINE_VERSION = 12
+
 ### ---- COMBAT SETUP ---- ###
 
 def roll_initiative(entities):
@@ -30,7 +41,8 @@ def execute_turn(entity, entities, stats):
 
     Movement now favors the closest foe while attack selection will ideally
     hit the lowest‑HP adversary in range.  Creatures with low health attempt to
-    flee and use Disengage, and overlapping positions are prevented.
+    flee and use Disengage, and overlapping positions are prevented.  With a
+    battle map, ground movement follows its flow fields around obstacles.
     """
     # import here to resolve circular reference issues
     from characters.party_member import PartyMember
@@ -48,6 +60,16 @@ def execute_turn(entity, entities, stats):
 
     checkTime(entity)
     stats["turns_survived"][entity.name] += 1
+
+    effects = condition_effects(entity.conditions.mask)
+    if effects.skip_turn:
+        # incapacitated: no movement, action or reaction this turn
+        repeat_saves(entity)
+        return
+    if "prone" in entity.conditions and not effects.speed_zero:
+        entity.conditions.discard("prone")  # stand up
+        if event_log.active is not None:
+            event_log.active.record(event_log.CONDITION, entity.name, label="prone")
             
     if isinstance(entity, PartyMember):
         valid_targets = [e for e in entities if isinstance(e, Enemy) and e.hitpoints_current > 0]
@@ -58,21 +80,46 @@ def execute_turn(entity, entities, stats):
 
     prev_position = Position(entity.position.x, entity.position.y, entity.position.z)
     has_moved = False
+    # cells a move on the battle map must not end in
+    occupied = ()
+    if entity.on_battle_map():
+        occupied = {entity.battle_map.cell_of(e.position) for e in entities
+                    if e is not entity and e.hitpoints_current > 0 and e.position.z == 0}
+
+    if entity.is_troop:
+        # a whole unit acts at once and fights to the last member
+        from mechanics.mass_combat import troop_turn
+        troop_turn(entity, valid_targets, stats, occupied)
+        if entity.scheduler is not None:
+            entity.scheduler.reactions.moved(entity)
+        if event_log.active is not None and entity.position.distance_to(prev_position) > 0:
+            log_move(entity)
+        repeat_saves(entity)
+        checkTime(entity)
+        return
 
     # flee if low on HP: move away from nearest foe and force Disengage
     fled = False
-    if entity.hitpoints_current <= entity.hitpoints_maximum * LOW_HP_RATIO and valid_targets:
+    if entity.hitpoints_current <= entity.hitpoints_maximum * LOW_HP_RATIO and valid_targets and not effects.speed_zero:
         nearest = closest_enemy(entity, valid_targets)
         # retreat by full speed
-        entity.position.move_away(nearest.position, entity.speed)
+        if entity.on_battle_map():
+            entity.battle_map.move_away(entity.position, nearest.position, entity.speed, occupied)
+        else:
+            entity.position.move_away(nearest.position, entity.speed)
         has_moved = True
         fled = True
+        if entity.scheduler is not None:
+            entity.scheduler.reactions.moved(entity)
+        if event_log.active is not None:
+            log_move(entity)
         # immediately take disengage action and finish turn
         disengage(entity)
         # track the action
         stats["actions_used"].setdefault(entity.name, {}).setdefault("Disengage", 0)
         stats["actions_used"][entity.name]["Disengage"] += 1
         entity.has_used_reaction = False
+        repeat_saves(entity)
         checkTime(entity)
         return
 
@@ -93,15 +140,15 @@ def execute_turn(entity, entities, stats):
             target = movement_target
 
         # movement logic based on combat style and distance to movement_target
-        if movement_target:
+        if movement_target and not effects.speed_zero:
             if entity.combat_style == "melee":
                 if entity.position.distance_to(movement_target.position) > entity.weapon["range"]:
-                    entity.move_towards_target(movement_target)
+                    entity.move_towards_target(movement_target, occupied)
                     has_moved = True
             elif entity.combat_style == "ranged":
                 # maintain at least weapon range
                 if entity.position.distance_to(movement_target.position) < entity.weapon["range"]:
-                    entity.move_away_from_target(movement_target)
+                    entity.move_away_from_target(movement_target, occupied)
                     has_moved = True
 
     # collision prevention: don't occupy the same square
@@ -116,115 +163,158 @@ def execute_turn(entity, entities, stats):
                 has_moved = False
                 break
 
+    if has_moved and entity.scheduler is not None:
+        entity.scheduler.reactions.moved(entity)
+    if has_moved and event_log.active is not None:
+        log_move(entity)
+
     if has_moved:
         # always check reactions from all other entities
         process_reactions(entity, entities, stats, prev_position)
     
-    # if we fled we already chose action
-    if not fled:
-        action = random.choices(entity.actions, weights=[a.get("weight", 1) for a in entity.actions], k=1)[0]
-    
-    # Perform action, ensure attack has a target
-    while True:
-        if action["name"] == "Attack":
-            if target is not None:
-                attack(entity, target, stats)
-                break
-            else:
-                # pick another action if no valid target
-                action = random.choices(entity.actions, weights=[a.get("weight", 1) for a in entity.actions], k=1)[0]
-                continue
-        elif action["name"] == "Dodge":
-            dodge(entity)
-            break
-        elif action["name"] == "Disengage":
-            disengage(entity)
-            break
-        elif action["name"] == "Dash":
-            dash(entity)
-            break
-        elif action["name"] == "Magic":
-            if target is not None:
-                magic(entity, target, stats)
-                break
-            else:
-                # pick another action if no valid target
-                action = random.choices(entity.actions, weights=[a.get("weight", 1) for a in entity.actions], k=1)[0]
-                continue
-        else:
-            action = random.choices(entity.actions, weights=[a.get("weight", 1) for a in entity.actions], k=1)[0]
-            continue
-    
+    # draw from the compiled table; actions needing a target or spell slots
+    # are masked out up front so no re-sampling is required
+    satisfied = satisfied_requirements(entity, target)
+    action = get_action_table(entity).pick(satisfied)
+    if action is not None:
+        perform_action(entity, action, target, stats)
+
     if has_moved:
         # always check reactions from all other entities
         process_reactions(entity, entities, stats, prev_position)
-            
+
+    bonus_action = get_action_table(entity, BONUS_ACTION).pick(satisfied_requirements(entity, target))
+    if bonus_action is not None:
+        perform_action(entity, bonus_action, target, stats)
+
     # Ensure actions are properly tracked
-    if entity.name not in stats["actions_used"]:
-        stats["actions_used"][entity.name] = {}
-    if action["name"] not in stats["actions_used"][entity.name]:
-        stats["actions_used"][entity.name][action["name"]] = 0
-    stats["actions_used"][entity.name][action["name"]] += 1
+    for used in (action, bonus_action):
+        if used is None:
+            continue
+        stats["actions_used"].setdefault(entity.name, {}).setdefault(used["name"], 0)
+        stats["actions_used"][entity.name][used["name"]] += 1
     
     entity.has_used_reaction = False  # Reset reaction usage
+    repeat_saves(entity)
     checkTime(entity)
 
 
-def simulate_combat(entities, stats):
-    """ Runs combat simulation until one side is eliminated and collects statistical data. """
+def simulate_combat(entities, stats, max_rounds=MAX_ROUNDS):
+    """ Runs combat simulation until one side is eliminated and collects statistical data.
+
+    Turns follow rolled initiative and are driven by a
+    mechanics.scheduler.CombatScheduler, which also times effect expiry,
+    legendary actions and lair actions.  A fight still undecided after
+    ``max_rounds`` rounds (typically because every survivor is fleeing)
+    ends with winner "draw".
+    """
     from characters.party_member import PartyMember  
     from characters.enemy import Enemy  
-    
+    from mechanics.scheduler import CombatScheduler, EXPIRE, LAIR, LEGENDARY, ROUND_START, TURN
+
     # keep original order/names to report hp_end
     original_names = [e.name for e in entities]
 
-    for entity in entities:
-        stats["initiative_order"][entity.name] = entities.index(entity)
-    
-    while True:
-        stats["rounds"] += 1
-        # reset per-round damage counter
-        stats["damage_this_round"] = 0
+    scheduler = CombatScheduler(entities)
+    for order, entity in enumerate(scheduler.turn_order()):
+        stats["initiative_order"][entity.name] = order
+        entity.legendary_remaining = getattr(entity, "legendary_actions", 0)
+    log = event_log.active
+    if log is not None:
+        log.record(event_log.COMBAT_START, a=len(entities))
+        for entity in entities:
+            log.record(event_log.ENTITY, entity.name, flags=event_log.PARTY if isinstance(entity, PartyMember) else 0,
+                       a=entity.hitpoints_current, b=entity.position.x, c=entity.position.y)
 
-        entities = [e for e in entities if e.hitpoints_current > 0]  # Remove dead entities
+    for kind, creature, data in scheduler.events():
+        if kind == EXPIRE:
+            end_effect(creature, data)
+            continue
+        # creatures may have died or joined since the last event
+        combatants = [e for e in scheduler.creatures if e.hitpoints_current > 0]
+        stats["combatants"] = combatants  # for area spells
+        if kind == TURN:
+            if creature.name not in original_names:
+                # joined mid-combat
+                original_names.append(creature.name)
+                stats["turns_survived"].setdefault(creature.name, 0)
+            creature.legendary_remaining = getattr(creature, "legendary_actions", 0)
+            if log is not None:
+                log.record(event_log.TURN_START, creature.name, a=creature.hitpoints_current,
+                           b=creature.position.x, c=creature.position.y)
+            execute_turn(creature, combatants, stats)
+        elif kind == LEGENDARY:
+            legendary_action(creature, combatants, stats)
+        elif kind == LAIR:
+            creature.lair_action(creature, combatants, stats)
+        elif kind == ROUND_START:
+            stats["rounds"] += 1
+            if log is not None:
+                log.round = stats["rounds"]
+            # reset per-round damage counter
+            stats["damage_this_round"] = 0
+            # record survival at start of round (optional)
+            for name in original_names:
+                alive = any(e.name == name for e in combatants)
+                stats.setdefault("survival_sequence", {}).setdefault(name, []).append(alive)
+        else:  # end of round
+            if stats.get("damage_this_round", 0) == 0:
+                stats["turns_no_damage"] += 1
+
+            alive_party = [e for e in combatants if isinstance(e, PartyMember)]
+            alive_enemies = [e for e in combatants if isinstance(e, Enemy)]
+            if not alive_party:
+                winner = "enemies"
+            elif not alive_enemies:
+                winner = "party"
+            elif max_rounds is not None and stats["rounds"] >= max_rounds:
+                winner = "draw"
+            else:
+                continue
+            break
 
-        # record survival at start of round (optional)
-        for name in original_names:
-            alive = any(e.name == name and e.hitpoints_current > 0 for e in entities)
-            stats.setdefault("survival_sequence", {}).setdefault(name, []).append(alive)
+    # record hp_end for all
+    for name in original_names:
+        found = next((e for e in combatants if e.name == name), None)
+        stats["hp_end"][name] = found.hitpoints_current if found else 0
+    for entity in list(scheduler.creatures):
+        scheduler.leave(entity)
+    stats.pop("combatants", None)
+    if log is not None:
+        log.record(event_log.COMBAT_END, label=winner, a=stats["rounds"])
+    return {**stats, "winner": winner}
 
-        for entity in entities:
-            execute_turn(entity, entities, stats)
 
-        if stats.get("damage_this_round", 0) == 0:
-            stats["turns_no_damage"] += 1
+def legendary_action(creature, entities, stats):
+    """Spends a legendary action, if any are left, on one weapon attack against the weakest foe in reach."""
+    from characters.party_member import PartyMember
 
-        alive_party = [e for e in entities if isinstance(e, PartyMember) and e.hitpoints_current > 0]
-        alive_enemies = [e for e in entities if isinstance(e, Enemy) and e.hitpoints_current > 0]
-        if not alive_party:
-            # record hp_end for all
-            for name in original_names:
-                found = next((e for e in entities if e.name == name), None)
-                stats["hp_end"][name] = found.hitpoints_current if found else 0
-            return {**stats, "winner": "enemies"}
-        if not alive_enemies:
-            for name in original_names:
-                found = next((e for e in entities if e.name == name), None)
-                stats["hp_end"][name] = found.hitpoints_current if found else 0
-            return {**stats, "winner": "party"}
+    if creature.legendary_remaining <= 0:
+        return
+    side = isinstance(creature, PartyMember)
+    in_reach = [e for e in entities if isinstance(e, PartyMember) != side and e.hitpoints_current > 0
+                and creature.position.distance_to(e.position) <= creature.weapon.get("range", 0)]
+    if not in_reach:
+        return
+    creature.legendary_remaining -= 1
+    attack(creature, min(in_reach, key=lambda t: t.hitpoints_current), stats, num_attacks=1)
+    stats["actions_used"].setdefault(creature.name, {}).setdefault("Legendary Action", 0)
+    stats["actions_used"][creature.name]["Legendary Action"] += 1
 
 
 ### ---- COMBAT ACTIONS ---- ###
 
-def attack(attacker, target, stats):
+def attack(attacker, target, stats, num_attacks=None):
     """Executes an attack, considering hit chance, damage, and resistances.
 
     Also updates various combat statistics (attack counts, crits, round damage).
+    ``num_attacks`` defaults to the attacker's full (multi)attack.  Hit
+    threshold, advantage, crit rule and damage multiplier come from the
+    attacker's precomputed row (see mechanics.attack_matrix).
     """
-    weapon = attacker.weapon
-    ability_mod = attacker.calculate_modifier(weapon["modifier"])
-    proficiency_bonus = attacker.proficiency_bonus
-    num_attacks = attacker.get_attack_count() if hasattr(attacker, "get_attack_count") else 1
+    row = get_attack_row(attacker)
+    if num_attacks is None:
+        num_attacks = attacker.get_attack_count() if hasattr(attacker, "get_attack_count") else 1
 
     # initialize counters for attacker if needed
     stats["attack_count"].setdefault(attacker.name, 0)
@@ -232,70 +322,126 @@ def attack(attacker, target, stats):
 
     for _ in range(num_attacks):
         stats["attack_count"][attacker.name] += 1
-        # Determine attack roll based on advantage/disadvantage system
-        advantage_score = attacker.attack_advantage + target.defense_advantage
-
-        if advantage_score > 0:
-            attack_roll = max(random.randint(1, 20), random.randint(1, 20))  # Advantage
-        elif advantage_score < 0:
-            attack_roll = min(random.randint(1, 20), random.randint(1, 20))  # Disadvantage
-        else:
-            attack_roll = random.randint(1, 20)  # Normal roll
-
-        attack_roll += ability_mod + proficiency_bonus
-
-        hit = attack_roll >= target.ac
-        critical_hit = attack_roll == 20
+        melee = attacker.position.distance_to(target.position) <= 5
+        entry = row.entry(attacker, target, melee)
+        natural = entry.roll_d20()
+
+        hit = natural >= entry.threshold
+        critical_hit = natural == 20
+        if hit and not critical_hit and react_to_hit(target, attacker, natural + row.bonus(attacker), stats):
+            entry = row.entry(attacker, target, melee)  # e.g. Shield raised its AC
+            hit = natural >= entry.threshold
+        critical_hit = critical_hit or (hit and entry.autocrit)
+        if event_log.active is not None:
+            event_log.active.record(event_log.ATTACK, attacker.name, target.name,
+                                    flags=(event_log.HIT if hit else 0) | (event_log.CRIT if critical_hit else 0),
+                                    a=natural, b=natural + row.bonus(attacker), c=target.ac)
         if critical_hit:
             stats["crit_count"][attacker.name] += 1
             stats["total_crits"] += 1
-        damage = calculate_damage(weapon["damage_dice"]) * (2 if critical_hit else 1) if hit else 0
+        if hit:
+            damage = entry.mitigate(row.roll_damage() * (2 if critical_hit else 1))
+            if target.is_troop:
+                # one swing hits one member: the excess does not spill onto the next
+                from mechanics.mass_combat import cap_member_damage
+                damage = cap_member_damage(target, damage)
+            deal_damage(target, damage, stats, attacker.name)
+
+def attack_bonus(attacker):
+    """Ability modifier plus proficiency added to the attacker's weapon rolls."""
+    return attacker.calculate_modifier(attacker.weapon["modifier"]) + attacker.proficiency_bonus
+
+def resolve_attack_roll(natural, bonus, target):
+    """Returns (hit, critical_hit) for a natural d20 roll plus an attack bonus.
+
+    A natural 20 always hits and is a critical hit; a natural 1 always misses.
+    """
+    if natural == 20:
+        return True, True
+    if natural == 1:
+        return False, False
+    return natural + bonus >= target.ac, False
+
+def start_effect(character, name, duration, att_bonus=0, def_bonus=0):
+    """Starts or renews a temporary effect lasting ``duration`` checkTime ticks.
+
+    The advantage bonuses are applied only when the effect is new, so a
+    renewed effect does not stack.  In a scheduled combat the expiry is an
+    event rather than a countdown.  Returns True if the effect is new.
+    """
+    new = name not in character.dicoTemporalite
+    if new:
+        character.dicoTemporalite[name] = [0, att_bonus, def_bonus]
+        character.attack_advantage += att_bonus
+        character.defense_advantage += def_bonus
+    character.dicoTemporalite[name][0] = duration
+    if character.scheduler is not None:
+        character.scheduler.expire_after(character, name, duration)
+    return new
+
+def end_effect(character, name):
+    """Ends a temporary effect, undoing what it did."""
+    values = character.dicoTemporalite.pop(name, None)
+    if values is None:
+        return
+    _, att_bonus, def_bonus = values
+    character.attack_advantage -= att_bonus
+    character.defense_advantage -= def_bonus
 
-        apply_damage(target, damage, weapon["damage_type"], stats, attacker.name)
+    if name == 'dash':
+        character.speed -= character.base_speed
+    if name == 'disengage':
+        character.can_be_opportunity_attacked = True
+    if name == 'shield':
+        character.ac -= SHIELD_AC
 
 def dodge(character):
     """ Performs the Dodge action, imposing disadvantage on attacks. """
-    if 'dodge' not in character.dicoTemporalite:
-        character.dicoTemporalite['dodge'] = [0, 0, -1]
-    character.defense_advantage -= 1
-    character.dicoTemporalite['dodge'][0] = 2
+    start_effect(character, 'dodge', 2, def_bonus=-1)
 
 def dash(character):
     """ Performs the Dash action, doubling movement speed. """
-    if 'dash' not in character.dicoTemporalite:
-        character.dicoTemporalite['dash'] = [0, 0, 0]
-    character.speed += character.base_speed
-    character.dicoTemporalite['dash'][0] = 1
+    if start_effect(character, 'dash', 1):
+        character.speed += character.base_speed
 
 def disengage(character):
     """ Performs the Disengage action, avoiding opportunity attacks. """
-    if 'disengage' not in character.dicoTemporalite:
-        character.dicoTemporalite['disengage'] = [0, 0, 0]
+    start_effect(character, 'disengage', 1)
     character.can_be_opportunity_attacked = False
-    character.dicoTemporalite['disengage'][0] = 1
 
 def magic(character, target, stats):
-    """ Performs the Magic action, casting a random spell at the target. """
+    """ Performs the Magic action, casting a spell chosen by the caster's spell book.
+
+    Only spells in range of the target with a slot left can be picked (see
+    mechanics.spellbook), so the action is not wasted on a rejected cast.  An
+    area spell with no placement catching more foes than allies is not cast;
+    the caster falls back to a single-target spell castable at the target.
+    """
     if not hasattr(character, 'can_cast_spells') or not character.can_cast_spells():
         return  # Not a spellcaster
-    
-    # Choose a random spell from known/prepared spells
-    available_spells = getattr(character, 'prepared_spells', []) + getattr(character, 'known_spells', [])
-    if not available_spells:
-        # Default to a basic cantrip if no spells known
-        available_spells = ['fire bolt', 'shocking grasp', 'acid splash']
-    
-    spell_name = random.choice(available_spells)
-    
+
+    from mechanics.spellbook import get_spellbook
+    book = get_spellbook(character)
+    entry = book.pick(character, target)
+    if entry is None:
+        return
+
     # Import and cast spell
-    from mechanics.spells import cast_spell
-    cast_spell(character, spell_name, target, stats)
+    from mechanics.spells import cast_spell, get_spell_program
+    if cast_spell(character, entry.name, target, stats):
+        return
+    for fallback in book.castable(character, target):
+        if fallback is not entry and not get_spell_program(fallback.name).area:
+            if cast_spell(character, fallback.name, target, stats):
+                return
 
 def opportunity_attack(attacker, target, stats):
     """Executes an opportunity attack when a target moves out of melee range."""
     if attacker.combat_style != "melee" or attacker.has_used_reaction:
         return  # Only melee attackers can make opportunity attacks and must have a reaction available
 
+    if event_log.active is not None:
+        event_log.active.record(event_log.REACTION, attacker.name, target.name, label="Opportunity Attack")
     attack(attacker, target, stats)
     
     # Mark reaction as used
@@ -319,13 +465,31 @@ def assign_default_actions(character):
     
     # Add Magic action for spellcasters
     if hasattr(character, 'can_cast_spells') and character.can_cast_spells():
-        character.actions.append({"name": "Magic", "mechanic": magic, "weight": 50, "target_required": True})
+        character.actions.append({"name": "Magic", "mechanic": magic, "weight": 50, "target_required": True, "slots_required": True})
+        from mechanics.spellbook import build_spellbook
+        from mechanics.reactions import assign_reaction_spells
+        build_spellbook(character)  # built once here, copied with the caster
+        assign_reaction_spells(character)
+
+    compile_action_tables(character)
+    build_attack_row(character)
 
 def process_reactions(moving_entity, entities, stats, previous_position):
-    """ Checks and triggers opportunity attacks."""
+    """ Checks and triggers opportunity attacks against a moving creature.
+
+    Only melee foes whose reach the mover left can react, and not after it
+    Disengaged.  In a scheduled combat the candidates are the creatures the
+    reaction index lists as threatening the cell it left, not everyone.
+    """
+    if not moving_entity.can_be_opportunity_attacked:
+        return
+    if moving_entity.scheduler is not None:
+        entities = moving_entity.scheduler.reactions.threatening(previous_position)
     for entity in entities:
-        if entity == moving_entity or entity.hitpoints_current <= 0:
+        if entity is moving_entity or entity.hitpoints_current <= 0 or not are_foes(entity, moving_entity):
             continue
+        if entity.combat_style != "melee":
+            continue  # as in the reaction index, ranged creatures make no opportunity attacks
         
         if entity.can_take_reaction() and distance(previous_position, entity.position) <= entity.weapon["range"] and distance(moving_entity.position, entity.position) > entity.weapon["range"]:
             if "Opportunity Attack" in entity.reactions:
@@ -336,18 +500,31 @@ def process_reactions(moving_entity, entities, stats, previous_position):
 def calculate_damage(damage_dice):
     """ Rolls damage dice. """
     num, die = map(int, damage_dice.split('d'))
-    return sum(random.randint(1, die) for _ in range(num))
+    return roll_dice(num, die)
+
+def mitigate_damage(target, damage, damage_type):
+    """Returns the damage left after the target's immunities and resistances."""
+    if damage <= 0:
+        return 0
+    bit = damage_bit(damage_type)
+    if target.immunities.mask & bit:
+        return 0
+    if target.resistances.mask & bit:
+        # halved damage but at least 1 if original >0
+        return max(1, damage // 2)
+    return damage
 
 def apply_damage(target, damage, damage_type, stats, attacker_name):
     """Applies damage, considering resistances and immunities."""
     if damage <= 0:
         return  # no damage to apply
 
-    if damage_type in target.immunities:
-        damage = 0
-    elif damage_type in target.resistances:
-        # halved damage but at least 1 if original >0
-        damage = max(1, damage // 2)
+    deal_damage(target, mitigate_damage(target, damage, damage_type), stats, attacker_name)
+
+def deal_damage(target, damage, stats, attacker_name):
+    """Subtracts already mitigated damage and records it."""
+    if damage <= 0:
+        return
 
     # Subtract HP and track stats
     target.hitpoints_current = max(target.hitpoints_current - damage, 0)
@@ -360,25 +537,67 @@ def apply_damage(target, damage, damage_type, stats, attacker_name):
     if attacker_name not in stats["damage_dealt"]:
         stats["damage_dealt"][attacker_name] = 0
     stats["damage_dealt"][attacker_name] += damage
+    if event_log.active is not None:
+        event_log.active.record(event_log.DAMAGE, attacker_name, target.name, a=damage, b=target.hitpoints_current)
+
+def log_move(entity):
+    """Records where a creature's move ended in the active event log."""
+    position = entity.position
+    event_log.active.record(event_log.MOVE, entity.name, a=position.x, b=position.y, c=position.z)
 
 def checkTime(characters):
-    """Update temporal effects counters on a character."""
+    """Update temporal effects counters on a character.
+
+    Only used outside a scheduled combat: the scheduler queues each
+    effect's expiry instead, so turns do not scan the active effects.
+    """
+    if characters.scheduler is not None:
+        return
     # dicoTemporalite maps effect names to [duration, attk_adv, def_adv]
     for name, values in list(characters.dicoTemporalite.items()):
-        duration, att_bonus, def_bonus = values
-        if duration > 0:
-            duration -= 1
-            characters.dicoTemporalite[name][0] = duration
+        if values[0] > 0:
+            values[0] -= 1
+        if values[0] == 0:
+            # effect expired, remove it
+            end_effect(characters, name)
 
-        if duration == 0:
-            characters.attack_advantage -= att_bonus
-            characters.defense_advantage -= def_bonus
 
-            if name == 'dash':
-                characters.speed -= characters.base_speed
-            if name == 'disengage':
-                characters.can_be_opportunity_attacked = True
+### ---- EXACT OUTCOME DISTRIBUTIONS ---- ###
+# Closed-form counterparts of attack() used by the exact solver; they share
+# the attack matrix entries (see mechanics.attack_matrix) with the dice path.
 
-            # effect expired, remove it
-            del characters.dicoTemporalite[name]
+def d20_distribution(advantage_score):
+    """Probabilities of each natural d20 result (index 0 is a roll of 1)."""
+    if advantage_score > 0:
+        return [(k * k - (k - 1) ** 2) / 400 for k in range(1, 21)]
+    if advantage_score < 0:
+        return [((21 - k) ** 2 - (20 - k) ** 2) / 400 for k in range(1, 21)]
+    return [1 / 20] * 20
 
+def dice_distribution(damage_dice):
+    """Exact distribution {total: probability} of a dice string like '2d6'."""
+    num, die = map(int, damage_dice.split('d'))
+    dist = {0: 1.0}
+    for _ in range(num):
+        nxt = {}
+        for total, p in dist.items():
+            for face in range(1, die + 1):
+                nxt[total + face] = nxt.get(total + face, 0) + p / die
+        dist = nxt
+    return dist
+
+def attack_damage_distribution(attacker, target, advantage_score):
+    """Exact distribution {damage: probability} of a single melee weapon attack."""
+    entry = get_attack_row(attacker).entry(attacker, target, True)
+    dice = dice_distribution(attacker.weapon["damage_dice"])
+    outcome = {}
+    for natural, p in enumerate(d20_distribution(advantage_score), start=1):
+        hit = natural >= entry.threshold
+        if not hit:
+            outcome[0] = outcome.get(0, 0) + p
+            continue
+        critical_hit = natural == 20 or entry.autocrit
+        for rolled, q in dice.items():
+            damage = entry.mitigate(rolled * (2 if critical_hit else 1))
+            outcome[damage] = outcome.get(damage, 0) + p * q
+    return outcome
@@ -0,0 +1,203 @@
+"""Interned bitmask sets for conditions and damage types, and condition effects.
+
+Every condition or damage type name is interned to one bit the first time
+it is seen (names are lower-cased, so "FIRE" and "fire" are the same bit).
+A FlagSet behaves like a set of names but stores an int mask, so
+resistance checks and condition lookups are integer operations.
+
+CONDITION_EFFECTS gives the mechanical effect of each condition; the
+combined effect of a whole condition mask is computed once and cached.
+"""
+from collections.abc import MutableSet
+from mechanics import event_log
+from mechanics.dice import roll_die
+
+DAMAGE_TYPES = ("acid", "bludgeoning", "cold", "fire", "force", "lightning", "necrotic",
+                "piercing", "poison", "psychic", "radiant", "slashing", "thunder")
+CONDITIONS = ("blinded", "charmed", "deafened", "frightened", "grappled", "incapacitated", "invisible",
+              "paralyzed", "petrified", "poisoned", "prone", "restrained", "stunned", "unconscious", "falling")
+
+DAMAGE = "damage"
+CONDITION = "condition"
+_BITS = {DAMAGE: {}, CONDITION: {}}
+_NAMES = {DAMAGE: [], CONDITION: []}
+
+
+def flag(kind, name):
+    """Bit of a name in a registry, interning it if new."""
+    bits = _BITS[kind]
+    bit = bits.get(name)
+    if bit is None:
+        key = name.strip().lower()
+        bit = bits.get(key)
+        if bit is None:
+            bit = bits[key] = 1 << len(_NAMES[kind])
+            _NAMES[kind].append(key)
+        bits[name] = bit  # the spelling as given, for the fast path
+    return bit
+
+
+for _name in DAMAGE_TYPES:
+    flag(DAMAGE, _name)
+for _name in CONDITIONS:
+    flag(CONDITION, _name)
+
+
+def damage_bit(damage_type):
+    return flag(DAMAGE, damage_type)
+
+
+def condition_bit(condition):
+    return flag(CONDITION, condition)
+
+
+class FlagSet(MutableSet):
+    """Set of interned names stored as an int ``mask``."""
+
+    def __init__(self, kind, items=()):
+        self.kind = kind
+        self.mask = 0
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, name):
+        return isinstance(name, str) and bool(self.mask & flag(self.kind, name))
+
+    def __reduce__(self):
+        # pickled by name: bits of names interned at runtime differ between processes
+        return (FlagSet, (self.kind, list(self)))
+
+    def __deepcopy__(self, memo):
+        copy = FlagSet(self.kind)
+        copy.mask = self.mask
+        return copy
+
+    def __iter__(self):
+        names = _NAMES[self.kind]
+        mask = self.mask
+        index = 0
+        while mask:
+            if mask & 1:
+                yield names[index]
+            mask >>= 1
+            index += 1
+
+    def __len__(self):
+        return bin(self.mask).count("1")
+
+    def add(self, name):
+        self.mask |= flag(self.kind, name)
+
+    def discard(self, name):
+        self.mask &= ~flag(self.kind, name)
+
+    def update(self, names):
+        """Adds every name in ``names``, as set.update."""
+        for name in names:
+            self.mask |= flag(self.kind, name)
+
+    def __repr__(self):
+        return f"FlagSet({self.kind!r}, {sorted(self)!r})"
+
+
+class ConditionEffects:
+    """Mechanical effects of one condition, or of a combination of them.
+
+    attack: advantage (+1) or disadvantage (-1) on the creature's attacks.
+    defense: same for attacks against it; defense_melee and defense_ranged
+    replace it by distance when they differ (prone).
+    """
+
+    def __init__(self, attack=0, defense=0, defense_melee=None, defense_ranged=None, speed_zero=False,
+                 melee_autocrit=False, skip_turn=False, fails_str_dex=False):
+        self.attack = attack
+        self.defense_melee = defense if defense_melee is None else defense_melee
+        self.defense_ranged = defense if defense_ranged is None else defense_ranged
+        self.speed_zero = speed_zero
+        self.melee_autocrit = melee_autocrit
+        self.skip_turn = skip_turn
+        self.fails_str_dex = fails_str_dex
+
+    def combine(self, other):
+        return ConditionEffects(
+            attack=self.attack + other.attack,
+            defense_melee=self.defense_melee + other.defense_melee,
+            defense_ranged=self.defense_ranged + other.defense_ranged,
+            speed_zero=self.speed_zero or other.speed_zero,
+            melee_autocrit=self.melee_autocrit or other.melee_autocrit,
+            skip_turn=self.skip_turn or other.skip_turn,
+            fails_str_dex=self.fails_str_dex or other.fails_str_dex,
+        )
+
+
+CONDITION_EFFECTS = {
+    "blinded": ConditionEffects(attack=-1, defense=1),
+    "frightened": ConditionEffects(attack=-1),
+    "grappled": ConditionEffects(speed_zero=True),
+    "incapacitated": ConditionEffects(skip_turn=True),
+    "invisible": ConditionEffects(attack=1, defense=-1),
+    "paralyzed": ConditionEffects(defense=1, speed_zero=True, melee_autocrit=True, fails_str_dex=True, skip_turn=True),
+    "petrified": ConditionEffects(defense=1, speed_zero=True, fails_str_dex=True, skip_turn=True),
+    "poisoned": ConditionEffects(attack=-1),
+    "prone": ConditionEffects(attack=-1, defense_melee=1, defense_ranged=-1),
+    "restrained": ConditionEffects(attack=-1, defense=1, speed_zero=True),
+    "stunned": ConditionEffects(defense=1, speed_zero=True, fails_str_dex=True, skip_turn=True),
+    "unconscious": ConditionEffects(defense=1, speed_zero=True, melee_autocrit=True, fails_str_dex=True, skip_turn=True),
+}
+NO_EFFECTS = ConditionEffects()
+_EFFECT_TABLE = {0: NO_EFFECTS}
+
+
+def condition_effects(mask):
+    """Combined ConditionEffects of a condition mask (cached per mask)."""
+    effects = _EFFECT_TABLE.get(mask)
+    if effects is None:
+        effects = NO_EFFECTS
+        for name, effect in CONDITION_EFFECTS.items():
+            if mask & condition_bit(name):
+                effects = effects.combine(effect)
+        _EFFECT_TABLE[mask] = effects
+    return effects
+
+
+def advantage(attacker, target, melee):
+    """Net advantage from the attacker's and target's conditions (>0 advantage, <0 disadvantage)."""
+    attacking = condition_effects(attacker.conditions.mask)
+    defending = condition_effects(target.conditions.mask)
+    return attacking.attack + (defending.defense_melee if melee else defending.defense_ranged)
+
+
+def _save_modifier(creature, ability):
+    """Save modifier, or None for an automatic failure (paralyzed, petrified, stunned, unconscious on STR/DEX)."""
+    if ability in ("STR", "DEX") and condition_effects(creature.conditions.mask).fails_str_dex:
+        return None
+    modifier = creature.ability_scores.get(ability, 10) // 2 - 5
+    if ability in getattr(creature, "saving_throws", []):
+        modifier += getattr(creature, "proficiency_bonus", 0)
+    return modifier
+
+
+def saving_throw(creature, ability, dc):
+    """Rolls a saving throw; paralyzed, petrified, stunned and unconscious creatures fail STR and DEX saves."""
+    modifier = _save_modifier(creature, ability.upper()[:3])
+    if modifier is None:
+        return False
+    return roll_die(20) + modifier >= dc
+
+
+def save_probability(creature, ability, dc):
+    """Chance that saving_throw succeeds."""
+    modifier = _save_modifier(creature, ability.upper()[:3])
+    if modifier is None:
+        return 0.0
+    return min(max((21 - (dc - modifier)) / 20, 0.0), 1.0)
+
+
+def repeat_saves(creature):
+    """End-of-turn saves against conditions imposed with a save (creature.condition_saves)."""
+    for condition, (ability, dc) in list(creature.condition_saves.items()):
+        if saving_throw(creature, ability, dc):
+            creature.conditions.discard(condition)
+            del creature.condition_saves[condition]
+            if event_log.active is not None:
+                event_log.active.record(event_log.CONDITION, creature.name, label=condition)
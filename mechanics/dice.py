@@ -0,0 +1,79 @@
+import math
+import random
+from statistics import NormalDist
+
+# When set, every die is rolled from 1 - u instead of u, so a combat replayed
+# from the same seed sees the "mirror image" of each roll (antithetic variates).
+_antithetic = False
+
+
+def set_antithetic(enabled):
+    """Enables or disables antithetic dice; returns the previous setting."""
+    global _antithetic
+    previous = _antithetic
+    _antithetic = bool(enabled)
+    return previous
+
+
+def is_antithetic():
+    """True while antithetic dice are enabled."""
+    return _antithetic
+
+
+def _uniform():
+    u = random.random()
+    if _antithetic:
+        u = 1.0 - u
+    return u
+
+
+def roll_die(sides):
+    """Rolls a single die with the given number of sides."""
+    return min(int(_uniform() * sides), sides - 1) + 1
+
+
+def roll_dice(num, sides):
+    """Rolls ``num`` dice with ``sides`` sides and returns the total."""
+    return sum(roll_die(sides) for _ in range(num))
+
+
+def binomial(n, p):
+    """Successes in ``n`` independent trials of probability ``p``, from one uniform draw.
+
+    Inverts the CDF, walking up from 0 (about n * p steps); counts too large
+    for the exact walk use the normal approximation.
+    """
+    if n <= 0 or p <= 0:
+        return 0
+    if p >= 1:
+        return n
+    u = _uniform()
+    if p > 0.5:
+        flipped, p = True, 1 - p
+    else:
+        flipped = False
+    q = 1 - p
+    pmf = math.exp(n * math.log(q))
+    if pmf > 0:
+        k, cdf, ratio = 0, pmf, p / q
+        while u > cdf and k < n:
+            pmf *= ratio * (n - k) / (k + 1)
+            k += 1
+            cdf += pmf
+    else:
+        k = round(n * p + math.sqrt(n * p * q) * NormalDist().inv_cdf(min(max(u, 1e-12), 1 - 1e-12)))
+        k = min(max(k, 0), n)
+    return n - k if flipped else k
+
+
+def multinomial(n, probabilities):
+    """Counts of ``n`` trials falling in each category, as a chain of binomial draws."""
+    counts = []
+    remaining, mass = n, 1.0
+    for p in probabilities[:-1]:
+        k = binomial(remaining, p / mass) if mass > 0 else 0
+        counts.append(k)
+        remaining -= k
+        mass -= p
+    counts.append(remaining)
+    return counts
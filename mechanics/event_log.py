@@ -0,0 +1,202 @@
+"""Compact binary log of what happens in each combat.
+
+An event log is a directory holding ``events.bin``, a flat file of
+fixed-size records packed with RECORD, and a small JSON header (record
+count, the record layout and the table of creature, spell, condition and
+reaction names the records refer to by index).  The record file can be
+opened with numpy.memmap (see EVENT_DTYPE), so a log of millions of combats
+is filtered without parsing it record by record.
+
+Every record holds the combat index, the round, the event kind, a few flag
+bits, the acting creature, the target, a label (an action, spell, condition
+or reaction name) and three numbers whose meaning depends on the kind:
+
+- combat_start: a = number of creatures
+- entity (one per creature at the start): flags 1 = party side; a, b, c = HP, x, y
+- turn_start: a, b, c = HP, x, y
+- move: a, b, c = x, y, z after the move
+- attack: flags 1 = hit, 2 = crit; a, b, c = natural d20, total, target AC;
+  a troop's volley is one record labelled VOLLEY, a, b, c = attacks, hits
+  (crits included), crits
+- damage: actor = source; a, b = damage, target HP left
+- spell: target = first target, label = spell; flags 1 = success,
+  2 = countered; a, b, c = slot level, targets, amount
+- reaction: label = reaction (target = the creature reacted to, if any)
+- condition: label = condition; flags 1 = applied, 0 = ended
+- combat_end: label = winner; a = rounds
+
+Logging is off unless a log is ``active``; every hook in the combat code
+checks that first, so runs without a log pay one attribute test per event.
+simulation.replay reads a log back and replays a combat step by step.
+"""
+import json
+import os
+import struct
+import numpy as np
+
+HEADER_FILE = "header.json"
+EVENTS_FILE = "events.bin"
+FORMAT_VERSION = 1
+
+KINDS = ("combat_start", "entity", "turn_start", "move", "attack", "damage", "spell", "reaction",
+         "condition", "combat_end")
+(COMBAT_START, ENTITY, TURN_START, MOVE, ATTACK, DAMAGE, SPELL, REACTION,
+ CONDITION, COMBAT_END) = range(len(KINDS))
+
+RECORD = struct.Struct("<IHBBHHH2xfff")
+EVENT_DTYPE = np.dtype([
+    ("combat", "<u4"), ("round", "<u2"), ("kind", "u1"), ("flags", "u1"),
+    ("actor", "<u2"), ("target", "<u2"), ("label", "<u2"), ("pad", "V2"),
+    ("a", "<f4"), ("b", "<f4"), ("c", "<f4"),
+])
+NO_NAME = 0xFFFF
+VOLLEY = "Volley"  # label of the attack record of a troop volley
+
+# flag bits
+HIT, CRIT = 1, 2
+SUCCESS, COUNTERED = 1, 2
+PARTY, APPLIED = 1, 1
+
+active = None  # the EventLog being written to, if any
+
+
+def _write_header(path, header):
+    tmp_path = os.path.join(path, HEADER_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(header, f, indent=1)
+    os.replace(tmp_path, os.path.join(path, HEADER_FILE))
+
+
+def read_header(path):
+    with open(os.path.join(path, HEADER_FILE), "r") as f:
+        header = json.load(f)
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported event log version: {header.get('version')}")
+    return header
+
+
+class EventLog:
+    """Writes event records into a buffer and appends it to the log when full.
+
+    As in the results store, the header's record count only advances once
+    the records are written, so a log is readable up to its last flush.
+    Opening an existing log appends to it (records past the header's count,
+    left by an interrupted run, are dropped); give each run its own combat
+    indices, e.g. with run_bulk_simulations ``start``, to tell them apart.
+    """
+
+    def __init__(self, path, buffer_records=65536):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        events_path = os.path.join(path, EVENTS_FILE)
+        if os.path.exists(os.path.join(path, HEADER_FILE)):
+            self.header = read_header(path)
+            if self.header["record_format"] != RECORD.format:
+                raise ValueError(f"Event log {path} uses a different record format")
+            self.names = self.header["names"]
+            with open(events_path, "ab") as f:
+                f.truncate(self.header["records"] * RECORD.size)
+        else:
+            self.names = []
+            self.header = {"version": FORMAT_VERSION, "records": 0, "record_format": RECORD.format,
+                           "kinds": list(KINDS), "names": self.names}
+            open(events_path, "wb").close()
+            _write_header(path, self.header)
+        self._ids = {name: i for i, name in enumerate(self.names)}
+        self._buffer = bytearray(RECORD.size * buffer_records)
+        self._capacity = buffer_records
+        self._pending = 0
+        self.combat = 0
+        self.round = 0
+
+    def _name(self, name):
+        if name is None:
+            return NO_NAME
+        i = self._ids.get(name)
+        if i is None:
+            i = self._ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def begin(self, combat):
+        """Starts logging combat number ``combat``."""
+        self.combat = combat
+        self.round = 0
+
+    def record(self, kind, actor=None, target=None, label=None, flags=0, a=0.0, b=0.0, c=0.0):
+        """Adds one event; ``actor``, ``target`` and ``label`` are names."""
+        RECORD.pack_into(self._buffer, self._pending * RECORD.size, self.combat, self.round, kind, flags,
+                         self._name(actor), self._name(target), self._name(label), a, b, c)
+        self._pending += 1
+        if self._pending == self._capacity:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            with open(os.path.join(self.path, EVENTS_FILE), "ab") as f:
+                f.write(memoryview(self._buffer)[:self._pending * RECORD.size])
+            self.header["records"] += self._pending
+            self._pending = 0
+        _write_header(self.path, self.header)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def activate(log):
+    """Makes ``log`` (or None) the log hooks write to; returns the previous one."""
+    global active
+    previous = active
+    active = log
+    return previous
+
+
+class EventLogReader:
+    """Memory-mapped view of an event log."""
+
+    def __init__(self, path):
+        self.path = path
+        self.header = read_header(path)
+        self.names = self.header["names"]
+        count = self.header["records"]
+        if count:
+            self.records = np.memmap(os.path.join(path, EVENTS_FILE), dtype=EVENT_DTYPE, mode="r", shape=(count,))
+        else:
+            self.records = np.empty(0, dtype=EVENT_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    def combats(self):
+        """Indices of the combats in the log."""
+        return np.unique(self.records["combat"]).tolist()
+
+    def name(self, i):
+        return None if i == NO_NAME else self.names[i]
+
+    def select(self, combat=None, entity=None):
+        """Records of one combat and/or involving one creature (as actor or target)."""
+        mask = np.ones(len(self.records), dtype=bool)
+        if combat is not None:
+            mask &= self.records["combat"] == combat
+        if entity is not None:
+            if entity not in self.names:
+                return self.records[:0]
+            i = self.names.index(entity)
+            mask &= (self.records["actor"] == i) | (self.records["target"] == i)
+        return self.records[mask]
+
+    def events(self, combat=None, entity=None):
+        """Decoded events as dicts, in the order they happened."""
+        for r in self.select(combat, entity):
+            yield {
+                "combat": int(r["combat"]), "round": int(r["round"]), "kind": KINDS[r["kind"]],
+                "flags": int(r["flags"]), "actor": self.name(r["actor"]), "target": self.name(r["target"]),
+                "label": self.name(r["label"]), "a": float(r["a"]), "b": float(r["b"]), "c": float(r["c"]),
+            }
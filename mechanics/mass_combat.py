@@ -0,0 +1,128 @@
+"""Mass-combat resolution for troops (characters.troop).
+
+A troop's turn is one decision for the whole unit: it moves towards the
+closest foe like any creature, then splits its members over the foes
+within reach of its formation, lowest hit points first, at most
+``frontage`` members per foe in melee (a ranged troop shoots with every
+member at its weakest foe in range).  All the attacks on one foe are one
+multinomial draw of (crits, hits, misses) from the same attack matrix entry
+a single attack uses, and the damage of all the hits is rolled together.
+Foes are only scanned once per unit, never per member.
+
+Area spells that catch a troop damage as many members as the template can
+cover, with the members' saves drawn as one binomial.  No hit or spell
+damages a member beyond its own hit points, so a big hit on a troop kills
+one member, not several.
+"""
+import math
+from mechanics import event_log
+from mechanics.attack_matrix import get_attack_row
+from mechanics.dice import binomial, multinomial, roll_dice
+
+
+def hit_probabilities(entry):
+    """(critical, ordinary hit, miss) probabilities of one attack from an attack matrix entry."""
+    from mechanics.combat import d20_distribution
+    naturals = d20_distribution(entry.advantage)
+    crit = naturals[19]
+    hit = sum(naturals[entry.threshold - 1:19]) if entry.threshold <= 19 else 0.0
+    if entry.autocrit:
+        crit, hit = crit + hit, 0.0
+    return crit, hit, max(0.0, 1.0 - crit - hit)
+
+
+def volley(troop, target, attacks, stats):
+    """Resolves ``attacks`` weapon attacks of a troop on one target at once."""
+    from mechanics.combat import deal_damage
+    row = get_attack_row(troop)
+    melee = troop.position.distance_to(target.position) <= 5 + troop.formation_radius()
+    entry = row.entry(troop, target, melee)
+    crits, hits, _ = multinomial(attacks, hit_probabilities(entry))
+
+    stats["attack_count"][troop.name] = stats["attack_count"].get(troop.name, 0) + attacks
+    stats["crit_count"][troop.name] = stats["crit_count"].get(troop.name, 0) + crits
+    stats["total_crits"] += crits
+    # crits double the dice as in attack(); resistance halves the volley as a whole
+    damage = roll_dice(hits * row.num_dice, row.die) + 2 * roll_dice(crits * row.num_dice, row.die)
+    if event_log.active is not None:
+        event_log.active.record(event_log.ATTACK, troop.name, target.name, event_log.VOLLEY,
+                                flags=(event_log.HIT if hits + crits else 0) | (event_log.CRIT if crits else 0),
+                                a=attacks, b=hits + crits, c=crits)
+    damage = entry.mitigate(damage)
+    if target.is_troop:
+        damage = cap_member_damage(target, damage, hits + crits)
+    deal_damage(target, damage, stats, troop.name)
+
+
+def troop_turn(troop, foes, stats, occupied=()):
+    """Moves a troop and makes every member that can reach a foe attack."""
+    if not foes or troop.members <= 0:
+        return
+    closest = min(foes, key=lambda f: troop.position.distance_to(f.position))
+    reach = troop.weapon.get("range", 5)
+    radius = troop.formation_radius()
+    if troop.combat_style == "melee" and troop.position.distance_to(closest.position) > reach + radius:
+        troop.move_towards_target(closest, occupied)
+
+    in_reach = sorted(
+        (f for f in foes if troop.position.distance_to(f.position) <= reach + radius),
+        key=lambda f: f.hitpoints_current,
+    )
+    if not in_reach:
+        return
+    members = troop.members
+    if troop.combat_style == "melee":
+        allocation = []
+        for foe in in_reach:
+            engaged = min(members, troop.frontage)
+            allocation.append((foe, engaged))
+            members -= engaged
+            if members <= 0:
+                break
+    else:
+        allocation = [(in_reach[0], members)]
+    for foe, engaged in allocation:
+        volley(troop, foe, engaged * troop.attacks_per_member, stats)
+    stats["actions_used"].setdefault(troop.name, {}).setdefault("Attack", 0)
+    stats["actions_used"][troop.name]["Attack"] += 1
+
+
+def cap_member_damage(troop, damage, hits=1):
+    """Damage of ``hits`` separate hits on a troop, none spilling past the member it lands on.
+
+    The first hit lands on the front member, whatever it has left of its hit
+    points; each further hit can at most kill one more whole member.
+    """
+    members = troop.members
+    if members <= 0 or hits <= 0:
+        return 0
+    front = troop.hitpoints_current - (members - 1) * troop.member_hitpoints
+    return min(damage, front + (min(hits, members) - 1) * troop.member_hitpoints)
+
+
+def area_members(troop, area):
+    """Members an area template can catch: its footprint in 5-ft squares, up to the whole unit."""
+    size = area["size"]
+    footprint = {
+        "sphere": math.pi * size * size,
+        "cube": size * size,
+        "cone": size * size / 2,
+        "line": size * 5,
+    }.get(area["shape"], 25)
+    return max(1, min(troop.members, int(footprint / 25)))
+
+
+def area_damage(troop, damage, area, save_ability=None, save_dc=None, half_on_save=False):
+    """Total damage an area spell deals to a troop, saves drawn for all caught members at once.
+
+    A member takes at most its own hit points, so the damage beyond what
+    kills it does not spill over onto members outside the template.
+    """
+    from mechanics.conditions import save_probability
+    caught = area_members(troop, area)
+    saved = 0
+    if save_ability is not None:
+        saved = binomial(caught, save_probability(troop, save_ability, save_dc))
+    member_hp = troop.member_hitpoints
+    saved_damage = damage // 2 if half_on_save else 0
+    return (caught - saved) * min(damage, member_hp) + saved * min(saved_damage, member_hp)
@@ -76,8 +76,19 @@ def closest_enemy(entity, enemy_camp):
     """Find the closest enemy to the given entity."""
     return min(enemy_camp, key=lambda enemy: distance(entity.position, enemy.position))
 
-def initialize_positions(party, enemies):
-    """Initializes positions for entities in both party and enemies only once."""
+def initialize_positions(party, enemies, seed=None):
+    """Initializes positions for entities in both party and enemies only once.
+
+    With a seed the layout is reproducible and the global RNG state is left
+    as it was.
+    """
+    if seed is not None:
+        state = random.getstate()
+        random.seed(f"positions:{seed}")
+        try:
+            return initialize_positions(party, enemies)
+        finally:
+            random.setstate(state)
   
     def generate_nearby_position(reference_points, min_dist, max_dist, entity, max_attempts=100):
         """Generates a position near at least one reference point within the given range."""
@@ -0,0 +1,240 @@
+"""Reaction triggers and the per-combat index of who can react to what.
+
+A creature's reactions are the callables in ``character.reactions``.  Each
+is classified by its trigger:
+
+LEAVE_REACH: a foe moves out of the creature's reach (Opportunity Attack).
+HIT: the creature is hit by an attack roll (Shield).
+CAST: a foe within range casts a spell (Counterspell).
+
+Reaction spells get their trigger from the casting condition in the spell
+data ("which you take when you are hit by an attack ..."); the spells with
+a modelled effect are listed in REACTION_SPELLS.
+
+The ReactionIndex keeps, for one combat, the creatures able to take each
+kind of reaction, so no trigger scans every combatant: opportunity
+attackers are hashed by the 5-ft cells their reach touches, hit reactions
+are looked up on the creature that was hit and cast reactions are kept in
+one (usually short) list.
+"""
+import math
+import re
+from mechanics import event_log
+from mechanics.dice import roll_die
+
+LEAVE_REACH = "leave_reach"
+HIT = "hit"
+CAST = "cast"
+
+CELL_SIZE = 5
+SHIELD_AC = 5
+
+_SPELL_TRIGGERS = {}
+
+
+def are_foes(a, b):
+    from characters.party_member import PartyMember
+    return isinstance(a, PartyMember) != isinstance(b, PartyMember)
+
+
+def spell_reaction_trigger(spell):
+    """(trigger, range) from a spell's reaction casting time, or None."""
+    for time in spell.get('time', []):
+        if time.get('unit') != 'reaction':
+            continue
+        condition = time.get('condition', '').lower()
+        if 'hit by an attack' in condition:
+            return HIT, 0
+        if 'casting a spell' in condition:
+            match = re.search(r'within (\d+) feet', condition)
+            if match:
+                return CAST, int(match.group(1))
+            from mechanics.spells import get_spell_range
+            return CAST, get_spell_range(spell)
+    return None
+
+
+def reaction_trigger(name, creature):
+    """(trigger, reach or range) of one of a creature's reactions, or None."""
+    if name == "Opportunity Attack":
+        # only melee creatures make opportunity attacks
+        if creature.combat_style != "melee" or not creature.weapon:
+            return None
+        return LEAVE_REACH, creature.weapon.get("range", 0)
+    if name not in _SPELL_TRIGGERS:
+        from mechanics.spells import get_spell
+        spell = get_spell(name)
+        _SPELL_TRIGGERS[name] = spell_reaction_trigger(spell) if spell else None
+    return _SPELL_TRIGGERS[name]
+
+
+def reactions_of(creature, trigger):
+    """[(name, handler, range)] of a creature's reactions to a trigger."""
+    found = []
+    for name, handler in creature.reactions.items():
+        classified = reaction_trigger(name, creature)
+        if classified is not None and classified[0] == trigger:
+            found.append((name, handler, classified[1]))
+    return found
+
+
+class ReactionIndex:
+    """Creatures able to react in one combat, indexed by trigger."""
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells = {}  # cell -> {id: creature} of creatures whose reach touches it
+        self._reach = {}  # id -> (reach, cells it is listed under)
+        self._on_hit = {}  # id -> hit reactions
+        self._on_cast = {}  # id -> (creature, cast reactions)
+
+    def _cell(self, position):
+        return (math.floor(position.x / self.cell_size), math.floor(position.y / self.cell_size))
+
+    def _cells_within(self, position, reach):
+        """Cells any part of which is within ``reach`` feet of a position (ignoring altitude)."""
+        size = self.cell_size
+        x, y = position.x, position.y
+        cells = []
+        for cx in range(math.floor((x - reach) / size), math.floor((x + reach) / size) + 1):
+            dx = max(cx * size - x, 0, x - (cx + 1) * size)
+            for cy in range(math.floor((y - reach) / size), math.floor((y + reach) / size) + 1):
+                dy = max(cy * size - y, 0, y - (cy + 1) * size)
+                if dx * dx + dy * dy <= reach * reach:
+                    cells.append((cx, cy))
+        return cells
+
+    def add(self, creature):
+        key = id(creature)
+        for name, handler in creature.reactions.items():
+            classified = reaction_trigger(name, creature)
+            if classified is None:
+                continue
+            trigger, reach = classified
+            if trigger == LEAVE_REACH and creature.position is not None:
+                self._reach[key] = (reach, [])
+                self.moved(creature)
+            elif trigger == HIT:
+                self._on_hit.setdefault(key, []).append((name, handler, reach))
+            elif trigger == CAST:
+                self._on_cast.setdefault(key, (creature, []))[1].append((name, handler, reach))
+
+    def remove(self, creature):
+        key = id(creature)
+        if key in self._reach:
+            for cell in self._reach.pop(key)[1]:
+                del self._cells[cell][key]
+        self._on_hit.pop(key, None)
+        self._on_cast.pop(key, None)
+
+    def moved(self, creature):
+        """Re-lists a creature under the cells its reach touches from its new position."""
+        key = id(creature)
+        if key not in self._reach:
+            return
+        reach, old = self._reach[key]
+        for cell in old:
+            del self._cells[cell][key]
+        cells = self._cells_within(creature.position, reach)
+        for cell in cells:
+            self._cells.setdefault(cell, {})[key] = creature
+        self._reach[key] = (reach, cells)
+
+    def threatening(self, position):
+        """Creatures whose reach may cover a position (candidates for an exact check)."""
+        return list(self._cells.get(self._cell(position), {}).values())
+
+    def hit_reactions(self, creature):
+        return self._on_hit.get(id(creature), ())
+
+    def cast_reactions(self):
+        return list(self._on_cast.values())
+
+
+def _record(reactor, name, stats):
+    reactor.has_used_reaction = True
+    stats["reactions_used"].setdefault(reactor.name, {}).setdefault(name, 0)
+    stats["reactions_used"][reactor.name][name] += 1
+    if event_log.active is not None:
+        event_log.active.record(event_log.REACTION, reactor.name, label=name)
+
+
+def react_to_hit(target, attacker, attack_total, stats):
+    """Lets a creature hit by an attack roll react (Shield); True if it did."""
+    if target.hitpoints_current <= 0 or not target.can_take_reaction():
+        return False
+    if target.scheduler is not None:
+        handlers = target.scheduler.reactions.hit_reactions(target)
+    else:
+        handlers = reactions_of(target, HIT)
+    for name, handler, _ in handlers:
+        if handler(target, attacker, attack_total, stats) is not None:
+            _record(target, name, stats)
+            return True
+    return False
+
+
+def react_to_cast(caster, spell_level, stats):
+    """Lets the caster's foes in range react to a spell (Counterspell); True if it is countered."""
+    if caster.scheduler is not None:
+        reactors = caster.scheduler.reactions.cast_reactions()
+    else:
+        reactors = [(c, reactions_of(c, CAST)) for c in stats.get('combatants') or []]
+    for reactor, handlers in reactors:
+        if reactor is caster or reactor.hitpoints_current <= 0 or not are_foes(reactor, caster):
+            continue
+        for name, handler, reach in handlers:
+            if not reactor.can_take_reaction() or reactor.position.distance_to(caster.position) > reach:
+                continue
+            countered = handler(reactor, caster, spell_level, stats)
+            if countered is None:
+                continue
+            _record(reactor, name, stats)
+            if countered:
+                return True
+    return False
+
+
+### ---- REACTION SPELLS ---- ###
+# handlers return None when they do not react, otherwise the outcome
+
+def shield(reactor, attacker, attack_total, stats):
+    """+5 AC until the start of the reactor's next turn, cast only if it turns the hit into a miss."""
+    from mechanics.combat import start_effect
+    from mechanics.spells import _spend_slot
+    if 'shield' in reactor.dicoTemporalite or attack_total >= reactor.ac + SHIELD_AC:
+        return None
+    if _spend_slot(reactor, 1) is None:
+        return None
+    if start_effect(reactor, 'shield', 1):
+        reactor.ac += SHIELD_AC
+    return True
+
+
+def counterspell(reactor, caster, spell_level, stats):
+    """Stops a spell of the slot's level or lower; a higher one needs a check against 10 + its level.
+
+    Cantrips are let through rather than spending a 3rd-level slot on them.
+    """
+    from mechanics.spells import _spend_slot
+    if spell_level <= 0 or not hasattr(reactor, 'can_cast_spells') or not reactor.can_cast_spells():
+        return None
+    slot_level = _spend_slot(reactor, 3)
+    if slot_level is None:
+        return None
+    if spell_level <= slot_level:
+        return True
+    modifier = reactor.ability_scores.get(reactor.spellcasting_ability.upper(), 10) // 2 - 5
+    return roll_die(20) + modifier >= 10 + spell_level
+
+
+REACTION_SPELLS = {"shield": shield, "counterspell": counterspell}
+
+
+def assign_reaction_spells(character):
+    """Adds the modelled reaction spells the character knows to its reactions."""
+    names = getattr(character, 'prepared_spells', []) + getattr(character, 'known_spells', [])
+    for name in names:
+        handler = REACTION_SPELLS.get(name.lower())
+        if handler is not None and reaction_trigger(name, character) is not None:
+            character.reactions[name] = handler
@@ -0,0 +1,166 @@
+"""Event-queue turn scheduler.
+
+Everything that happens in a combat happens at a point of the initiative
+timeline: the start and end of a round, a creature's turn, a legendary
+action after another creature's turn, a lair action on initiative count 20
+(losing ties) and the expiry of a temporary effect.  Each is an event in a
+single heap keyed on (round, -initiative count, tie-break, phase), so a turn
+costs a few heap operations however many effects are active.
+
+Creatures that join mid-combat roll initiative and take their first turn
+when their count next comes up; creatures that leave (or die) keep their
+queued events, which are skipped when popped.  The scheduler also owns the
+combat's mechanics.reactions.ReactionIndex, kept in step with who is in
+the fight.
+
+Temporary effects keep the dicoTemporalite durations of the original
+engine, counted in "ticks" of their creature: the start and the end of
+each of its turns.  An effect started during a creature's turn with
+duration 1 expires at the end of that turn, with duration 2 at the start of
+its next turn, and so on.
+"""
+import heapq
+import math
+from mechanics.combat import roll_initiative
+from mechanics.reactions import ReactionIndex
+
+ROUND_START = "round_start"
+TURN = "turn"
+LEGENDARY = "legendary"
+LAIR = "lair"
+EXPIRE = "expire"
+ROUND_END = "round_end"
+
+LAIR_COUNT = 20
+# phases of the events sharing one initiative slot
+START_TICK, ACT, END_TICK, AFTER_TURN = range(4)
+
+
+class CombatScheduler:
+    """Priority queue of combat events.
+
+    Args:
+        entities: combatants, in the order that breaks initiative ties.
+        initiatives: optional {name: initiative count}; missing counts are
+            rolled with roll_initiative.
+    """
+
+    def __init__(self, entities, initiatives=None):
+        self._queue = []
+        self._seq = 0
+        self._slots = {}  # id(creature) -> (count, tie-break)
+        self._next_turn = {}  # id(creature) -> round of its next turn
+        self._expiry = {}  # (id(creature), effect) -> seq of its live expiry event
+        self.creatures = []
+        self.round = 1
+        self.now = (0,)
+        self.active = None
+        self.reactions = ReactionIndex()
+        self._push((1, -math.inf, 0, 0), ROUND_START)
+        initiatives = initiatives or {}
+        for entity in entities:
+            self.join(entity, initiatives.get(entity.name))
+
+    def _push(self, key, kind, creature=None, data=None):
+        self._seq += 1
+        heapq.heappush(self._queue, (*key, self._seq, kind, creature, data))
+        return self._seq
+
+    def turn_order(self):
+        """Creatures still in the fight, in initiative order."""
+        return sorted(self.creatures, key=lambda c: (-self._slots[id(c)][0], self._slots[id(c)][1]))
+
+    def join(self, creature, initiative=None):
+        """Adds a creature; its first turn comes when its count next comes up."""
+        if initiative is None:
+            roll_initiative([creature])
+            initiative = creature.current_initiative
+        creature.current_initiative = initiative
+        slot = (initiative, self._seq)
+        self._slots[id(creature)] = slot
+        self.creatures.append(creature)
+        self.reactions.add(creature)
+        creature.scheduler = self
+        # a count already passed this round waits for the next one
+        first = self.round if (self.round, -initiative, slot[1]) > self.now[:3] else self.round + 1
+        self._schedule_turn(creature, first)
+        if getattr(creature, "lair_action", None) is not None:
+            self._push((first, -LAIR_COUNT, math.inf, ACT), LAIR, creature)
+        # effects carried in from an earlier fight resume their countdown
+        for name, values in creature.dicoTemporalite.items():
+            self.expire_after(creature, name, values[0])
+
+    def leave(self, creature):
+        """Removes a creature; its queued events are dropped when reached."""
+        if id(creature) in self._slots:
+            del self._slots[id(creature)]
+            del self._next_turn[id(creature)]
+            self.creatures.remove(creature)
+            self.reactions.remove(creature)
+            creature.scheduler = None
+
+    def _schedule_turn(self, creature, round_):
+        count, tie = self._slots[id(creature)]
+        self._next_turn[id(creature)] = round_
+        self._push((round_, -count, tie, ACT), TURN, creature)
+
+    def expire_after(self, creature, name, ticks):
+        """Queues the expiry of a creature's effect ``ticks`` ticks from now.
+
+        During the creature's own turn the first tick is the end of that
+        turn; otherwise it is the start of its next turn.
+        """
+        if id(creature) not in self._slots:
+            return
+        count, tie = self._slots[id(creature)]
+        index = ticks if creature is self.active else ticks - 1
+        index = max(index, 0)
+        round_ = self._next_turn[id(creature)] + index // 2
+        phase = END_TICK if index % 2 else START_TICK
+        self._expiry[(id(creature), name)] = self._push((round_, -count, tie, phase), EXPIRE, creature, name)
+
+    def _live(self, creature):
+        return id(creature) in self._slots
+
+    def events(self):
+        """Yields (kind, creature, data) in timeline order, forever.
+
+        Turns, legendary and lair actions are only yielded for creatures
+        still in the fight and alive; expiry events only while current.
+        """
+        while self._queue:
+            round_, neg_count, tie, phase, seq, kind, creature, data = heapq.heappop(self._queue)
+            self.now = (round_, neg_count, tie, phase, seq)
+            self.round = round_
+            if kind == ROUND_START:
+                self._push((round_, math.inf, 0, 0), ROUND_END)
+                self._push((round_ + 1, -math.inf, 0, 0), ROUND_START)
+                yield kind, None, None
+            elif kind == ROUND_END:
+                yield kind, None, None
+            elif not self._live(creature):
+                continue
+            elif kind == EXPIRE:
+                if self._expiry.get((id(creature), data)) == seq:
+                    del self._expiry[(id(creature), data)]
+                    yield kind, creature, data
+            elif kind == TURN:
+                acted = creature.hitpoints_current > 0
+                if acted:
+                    self.active = creature
+                    yield kind, creature, None
+                    self.active = None
+                if not self._live(creature):
+                    continue
+                self._schedule_turn(creature, round_ + 1)
+                if acted:
+                    # the other legendary creatures may act once this turn is over
+                    for other in self.creatures:
+                        if other is not creature and getattr(other, "legendary_actions", 0) > 0:
+                            self._push((round_, neg_count, tie, AFTER_TURN), LEGENDARY, other)
+            elif kind == LAIR:
+                self._push((round_ + 1, -LAIR_COUNT, math.inf, ACT), LAIR, creature)
+                if creature.hitpoints_current > 0:
+                    yield kind, creature, None
+            elif creature.hitpoints_current > 0:
+                yield kind, creature, data
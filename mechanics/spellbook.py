@@ -0,0 +1,151 @@
+from __future__ import annotations
+import random
+from bisect import bisect_left
+
+# spells cast by the Magic action of a caster that knows none
+DEFAULT_SPELLS = ['fire bolt', 'shocking grasp', 'acid splash']
+
+
+class SpellEntry:
+    """What the Magic action needs to know about one spell, computed once."""
+
+    def __init__(self, name, level, reach, expected_damage):
+        self.name = name
+        self.level = level
+        self.reach = reach
+        self.expected_damage = expected_damage
+
+
+def spell_entry(name, caster_level=1):
+    """SpellEntry of a spell that can be cast at a foe, or None (heals, utility spells)."""
+    from mechanics.spells import get_spell_program
+    program = get_spell_program(name)
+    if program is None or program.kind not in ('damage', 'control'):
+        return None
+    if program.kind == 'control' and not program.conditions:
+        return None  # nothing it does to a foe is modelled
+    area = program.area
+    reach = area['size'] if area and area['origin'] == 'self' else program.range
+    if reach <= 0:
+        return None
+    return SpellEntry(program.name, program.level, reach, program.expected(None, caster_level))
+
+
+class SpellTables:
+    """Castable-spell lists for every (range bucket, slot mask), shared by copies of a caster.
+
+    Spells are bucketed by reach: bucket ``b`` holds the spells whose reach
+    is at least the ``b``-th distinct reach, so a target at distance ``d``
+    can be hit by every spell in bucket ``bisect_left(reaches, d)``.  The
+    lists are built on first use and sorted by expected damage, best first.
+    """
+
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=lambda e: -e.expected_damage)
+        self.reaches = sorted({e.reach for e in self.entries})
+        self._tables = {}
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def castable(self, bucket, slot_mask):
+        key = (bucket, slot_mask)
+        table = self._tables.get(key)
+        if table is None:
+            if bucket < len(self.reaches):
+                reach = self.reaches[bucket]
+                # any slot of the spell's level or higher will do
+                table = [e for e in self.entries if e.reach >= reach and slot_mask >> e.level]
+            else:
+                table = []
+            self._tables[key] = table
+        return table
+
+
+def random_policy(candidates, caster, target):
+    return random.choice(candidates)
+
+
+def damage_policy(candidates, caster, target):
+    """Highest expected damage (candidates are sorted that way)."""
+    return candidates[0]
+
+
+def cheapest_policy(candidates, caster, target):
+    """Lowest-level spell, saving slots; cantrips first."""
+    return min(candidates, key=lambda e: e.level)
+
+
+SPELL_POLICIES = {"random": random_policy, "damage": damage_policy, "cheapest": cheapest_policy}
+
+
+class SpellBook:
+    """Per-caster set of the spells the Magic action can actually cast.
+
+    ``slot_mask`` has bit ``L`` set while ``L``-th level slots remain (bit 0,
+    cantrips, is always set) and is updated in place as slots are spent; a
+    spell is castable while any bit at or above its level is set, since it
+    can be cast with a higher slot.  A pick is a bucket lookup from the
+    target's distance plus the policy.
+    """
+
+    def __init__(self, caster, tables, policy="random"):
+        self.tables = tables
+        if not callable(policy):
+            if policy not in SPELL_POLICIES:
+                raise ValueError(f"Unknown spell policy: {policy!r} (expected one of {', '.join(SPELL_POLICIES)})")
+            policy = SPELL_POLICIES[policy]
+        self.policy = policy
+        self.source = spell_names(caster)
+        self.sync(caster)
+
+    def sync(self, caster):
+        """Recomputes the slot mask from the caster's slot list (after rests)."""
+        self.slots = caster.spell_slots
+        mask = 1
+        for index, count in enumerate(self.slots):
+            if count > 0:
+                mask |= 1 << (index + 1)
+        self.slot_mask = mask
+
+    def slot_spent(self, level, remaining):
+        if level > 0 and remaining <= 0:
+            self.slot_mask &= ~(1 << level)
+
+    def is_stale(self, caster):
+        # compares the names, so spells appended to the caster's lists are noticed
+        return spell_names(caster) != self.source
+
+    def castable(self, caster, target):
+        distance = caster.position.distance_to(target.position)
+        return self.tables.castable(bisect_left(self.tables.reaches, distance), self.slot_mask)
+
+    def pick(self, caster, target):
+        """An entry castable at the target, chosen by the policy; None if there is none."""
+        candidates = self.castable(caster, target)
+        if not candidates:
+            return None
+        return self.policy(candidates, caster, target)
+
+
+def spell_names(caster):
+    """The caster's prepared and known spells, in order and without repeats."""
+    return tuple(dict.fromkeys(list(getattr(caster, 'prepared_spells', [])) + list(getattr(caster, 'known_spells', []))))
+
+
+def build_spellbook(caster):
+    names = list(spell_names(caster))
+    level = getattr(caster, 'level', 1)
+    entries = [e for e in (spell_entry(n, level) for n in names or DEFAULT_SPELLS) if e is not None]
+    caster.spellbook = SpellBook(caster, SpellTables(entries), getattr(caster, 'spell_policy', 'random'))
+    return caster.spellbook
+
+
+def get_spellbook(caster):
+    """Returns the caster's spell book, rebuilding it if its spell list changed."""
+    book = getattr(caster, 'spellbook', None)
+    if book is None or book.is_stale(caster):
+        return build_spellbook(caster)
+    if caster.spell_slots is not book.slots:
+        book.sync(caster)  # slots were replaced, e.g. by a rest
+    return book
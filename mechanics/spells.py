@@ -1,15 +1,17 @@
 import json
 import os
-import random
+import re
 from typing import Dict, List, Optional, Any
 from characters.base_character import Character
+from mechanics import event_log
+from mechanics.dice import roll_die, roll_dice
 
 # Class spell lists (simplified for common spells)
 CLASS_SPELL_LISTS = {
     'Wizard': [
         'Fire Bolt', 'Magic Missile', 'Fireball', 'Lightning Bolt', 'Cone of Cold',
         'Chain Lightning', 'Disintegrate', 'Power Word Kill', 'Wish',
-        'Cure Wounds', 'Healing Word', 'Revivify'
+        'Cure Wounds', 'Healing Word', 'Revivify', 'Shield', 'Counterspell'
     ],
     'Ranger': [
         'Hunter\'s Mark', 'Goodberry', 'Cure Wounds', 'Entangle', 'Pass Without Trace',
@@ -240,61 +242,189 @@ def get_spell_range(spell: Dict) -> int:
                 return 0  # Self range
     return 0
 
+AREA_RANGE_SHAPES = {'sphere': 'sphere', 'radius': 'sphere', 'hemisphere': 'sphere', 'cone': 'cone', 'line': 'line', 'cube': 'cube'}
+AREA_TEXT_SHAPES = {'sphere': 'sphere', 'radius': 'sphere', 'cylinder': 'sphere', 'cone': 'cone', 'line': 'line', 'cube': 'cube'}
+
 def get_spell_area(spell: Dict) -> Optional[Dict]:
-    """Extract area of effect from spell data."""
-    if 'area' in spell:
-        return spell['area']
-    return None
+    """Extract area of effect from spell data.
+
+    Returns {'shape', 'size', 'origin'} where shape is one of
+    mechanics.areas.SHAPES, size is the radius, length or side in feet, and
+    origin is 'self' (the template starts at the caster, e.g. Cone of Cold)
+    or 'point' (it is centred on a point within range, e.g. Fireball), or
+    None for single-target spells.  Cylinders are treated as spheres.
+    """
+    range_data = spell.get('range', {})
+    distance = range_data.get('distance', {})
+    if range_data.get('type') in AREA_RANGE_SHAPES and distance.get('type') == 'feet':
+        return {'shape': AREA_RANGE_SHAPES[range_data['type']], 'size': distance.get('amount', 0), 'origin': 'self'}
+    if range_data.get('type') != 'point' or not set(spell.get('areaTags', [])) & {'S', 'N', 'L', 'C', 'Y', 'H'}:
+        return None
+    entries_text = ' '.join([e if isinstance(e, str) else str(e) for e in spell.get('entries', [])]).lower()
+    match = re.search(r'(\d+)-foot(?:-radius)?[ -](sphere|radius|cylinder|cone|line|cube)', entries_text)
+    if not match:
+        return None
+    return {'shape': AREA_TEXT_SHAPES[match.group(2)], 'size': int(match.group(1)), 'origin': 'point'}
+
+DAMAGE_TAG = re.compile(r'\{@damage ([^}|]+)')
+SCALE_TAG = re.compile(r'\{@scale(?:damage|dice) ([^}|]+)\|(\d+)-\d+\|([^}|]+)')
+HEAL_DICE = re.compile(r'\{@dice ([^}|]+)\}')
+HEAL_FLAT = re.compile(r'(?:regains?|restoring) (\d+) ')
+REVIVE_HP = re.compile(r'with (\d+) ')
+
+
+def parse_dice(text: str):
+    """'8d6', '1d4 + 1' or '70' as a (count, faces, bonus) tuple; None if unparseable."""
+    match = re.fullmatch(r'\s*(?:(\d+)d(\d+))?\s*(?:\+?\s*(\d+))?\s*', text or '')
+    if not match or not any(match.groups()):
+        return None
+    count, faces, bonus = match.groups()
+    return (int(count or 0), int(faces or 0), int(bonus or 0))
+
+
+def _entries_text(entries) -> str:
+    return ' '.join([e if isinstance(e, str) else json.dumps(e) for e in entries or []])
+
+
+class SpellProgram:
+    """A spell compiled down to what casting it does.
+
+    Built once per spell by compile_spell from the structured 5etools fields
+    (spellAttack, savingThrow, damageInflict, conditionInflict,
+    scalingLevelDice, miscTags) and the dice tags of its entries, so casting
+    runs no text parsing.
+
+    kind is 'damage', 'healing', 'resurrection' or 'control' (conditions
+    only); resolution is 'attack', 'save' or 'auto'.  Dice are
+    (count, faces, bonus) tuples.
+    """
+
+    def __init__(self, name, level, kind, resolution, save_ability=None, half_on_save=False,
+                 damage_type=None, dice=None, per_slot=None, cantrip_dice=None, add_modifier=False,
+                 conditions=(), revive_hp=None, area=None, range_feet=0):
+        self.name = name
+        self.level = level
+        self.kind = kind
+        self.resolution = resolution
+        self.save_ability = save_ability
+        self.half_on_save = half_on_save
+        self.damage_type = damage_type
+        self.dice = dice
+        self.per_slot = per_slot
+        self.cantrip_dice = cantrip_dice or {}
+        self.add_modifier = add_modifier
+        self.conditions = list(conditions)
+        self.revive_hp = revive_hp
+        self.area = area
+        self.range = range_feet
+
+    def dice_for(self, slot_level=None, caster_level=1):
+        """Effect dice when cast with a slot of ``slot_level`` by a caster of ``caster_level``."""
+        if self.cantrip_dice:
+            return self.cantrip_dice[max([l for l in self.cantrip_dice if l <= caster_level], default=min(self.cantrip_dice))]
+        if self.dice is None:
+            return None
+        count, faces, bonus = self.dice
+        extra = max((slot_level or self.level) - self.level, 0)
+        if extra and self.per_slot:
+            if self.per_slot[1] in (0, faces):
+                count, bonus = count + extra * self.per_slot[0], bonus + extra * self.per_slot[2]
+        return (count, faces, bonus)
+
+    def expected(self, slot_level=None, caster_level=1):
+        dice = self.dice_for(slot_level, caster_level)
+        if dice is None:
+            return 0
+        count, faces, bonus = dice
+        return count * (faces + 1) / 2 + bonus
+
+    def roll(self, slot_level=None, caster_level=1):
+        dice = self.dice_for(slot_level, caster_level)
+        if dice is None:
+            return 0
+        count, faces, bonus = dice
+        return (roll_dice(count, faces) if count else 0) + bonus
+
+
+def compile_spell(spell: Dict) -> SpellProgram:
+    """Compiles a 5etools spell dictionary into a SpellProgram."""
+    text = _entries_text(spell.get('entries'))
+    higher = _entries_text(spell.get('entriesHigherLevel'))
+    level = spell.get('level', 0)
+
+    if spell.get('spellAttack'):
+        resolution = 'attack'
+    elif spell.get('savingThrow'):
+        resolution = 'save'
+    else:
+        resolution = 'auto'
+    save_ability = spell['savingThrow'][0].upper()[:3] if spell.get('savingThrow') else None
+
+    scale = SCALE_TAG.search(higher)
+    per_slot = parse_dice(scale.group(3)) if scale else None
+    cantrip_dice = {}
+    scaling = spell.get('scalingLevelDice')
+    if isinstance(scaling, list):
+        scaling = scaling[0] if scaling else None
+    if scaling:
+        cantrip_dice = {int(k): parse_dice(v) for k, v in scaling.get('scaling', {}).items() if parse_dice(v)}
+
+    program = dict(area=get_spell_area(spell), range_feet=get_spell_range(spell), per_slot=per_slot,
+                   save_ability=save_ability, conditions=spell.get('conditionInflict') or [])
+    if is_resurrection_spell(spell):
+        revive = REVIVE_HP.search(text)
+        return SpellProgram(spell['name'], level, 'resurrection', 'auto',
+                            revive_hp=int(revive.group(1)) if revive else None, **program)
+    if 'HL' in spell.get('miscTags', []):
+        heal = HEAL_DICE.search(text)
+        dice = parse_dice(heal.group(1)) if heal else None
+        if dice is None:
+            flat = HEAL_FLAT.search(text)
+            dice = (0, 0, int(flat.group(1))) if flat else (parse_dice(scale.group(1)) if scale else None)
+        if dice is not None:
+            return SpellProgram(spell['name'], level, 'healing', 'auto', dice=dice,
+                                add_modifier='spellcasting ability modifier' in text, **program)
+
+    damage = DAMAGE_TAG.search(text)
+    dice = parse_dice(damage.group(1)) if damage else None
+    if dice is None and scale and spell.get('damageInflict'):
+        dice = parse_dice(scale.group(1))
+    if dice or cantrip_dice:
+        return SpellProgram(spell['name'], level, 'damage', resolution,
+                            half_on_save='half as much damage' in text.lower(),
+                            damage_type=(spell.get('damageInflict') or ['force'])[0],
+                            dice=dice, cantrip_dice=cantrip_dice, **program)
+    return SpellProgram(spell['name'], level, 'control', resolution, **program)
+
+
+SPELL_PROGRAMS = {}
+
+def get_spell_program(spell_name: str) -> Optional[SpellProgram]:
+    """Compiled program of a spell, by name (compiled on first use)."""
+    key = spell_name.lower()
+    if key not in SPELL_PROGRAMS:
+        spell = get_spell(spell_name)
+        SPELL_PROGRAMS[key] = compile_spell(spell) if spell else None
+    return SPELL_PROGRAMS[key]
+
+def program_of(spell: Dict) -> SpellProgram:
+    """Cached program of a spell dict; spells missing from the data are compiled as given."""
+    program = get_spell_program(spell.get('name', ''))
+    return program if program is not None else compile_spell(spell)
+
+def format_dice(dice) -> str:
+    count, faces, bonus = dice
+    text = f"{count}d{faces}" if count else ""
+    if bonus:
+        text = f"{text}+{bonus}" if text else str(bonus)
+    return text
 
 def get_spell_damage(spell: Dict, caster_level: int = 1) -> Optional[Dict]:
     """Extract damage information from spell."""
-    damage_info = {}
-
-    # Check scalingLevelDice for level-based damage
-    if 'scalingLevelDice' in spell:
-        scaling = spell['scalingLevelDice']
-        label = scaling.get('label', '')
-        scale_dict = scaling.get('scaling', {})
-
-        # Find the appropriate level
-        levels = sorted([int(k) for k in scale_dict.keys()])
-        applicable_level = max([l for l in levels if l <= caster_level], default=levels[0] if levels else 1)
-        damage_info['dice'] = scale_dict.get(str(applicable_level), '1d6')
-        damage_info['type'] = label.split()[0] if ' ' in label else label  # Extract damage type
-
-    # Check entries for damage mentions
-    elif 'entries' in spell:
-        for entry in spell['entries']:
-            if isinstance(entry, str) and '{@damage' in entry:
-                # Simple parsing for damage
-                import re
-                damage_match = re.search(r'\{@damage ([^}]+)\}', entry)
-                if damage_match:
-                    damage_info['dice'] = damage_match.group(1)
-                    # Try to find damage type
-                    if 'acid' in entry.lower():
-                        damage_info['type'] = 'acid'
-                    elif 'fire' in entry.lower():
-                        damage_info['type'] = 'fire'
-                    elif 'cold' in entry.lower():
-                        damage_info['type'] = 'cold'
-                    elif 'lightning' in entry.lower():
-                        damage_info['type'] = 'lightning'
-                    elif 'poison' in entry.lower():
-                        damage_info['type'] = 'poison'
-                    elif 'necrotic' in entry.lower():
-                        damage_info['type'] = 'necrotic'
-                    elif 'radiant' in entry.lower():
-                        damage_info['type'] = 'radiant'
-                    elif 'psychic' in entry.lower():
-                        damage_info['type'] = 'psychic'
-                    elif 'force' in entry.lower():
-                        damage_info['type'] = 'force'
-                    elif 'thunder' in entry.lower():
-                        damage_info['type'] = 'thunder'
-                    break
-
-    return damage_info if damage_info else None
+    program = program_of(spell)
+    if program.kind != 'damage':
+        return None
+    return {'dice': format_dice(program.dice_for(None, caster_level)), 'type': program.damage_type}
 
 def get_spell_saving_throw(spell: Dict) -> Optional[str]:
     """Extract saving throw from spell."""
@@ -304,28 +434,11 @@ def get_spell_saving_throw(spell: Dict) -> Optional[str]:
 
 def get_spell_conditions(spell: Dict) -> List[str]:
     """Extract conditions inflicted by spell."""
-    conditions = []
-    if 'entries' in spell:
-        entries_text = ' '.join([e if isinstance(e, str) else str(e) for e in spell['entries']]).lower()
-        condition_keywords = ['stunned', 'paralyzed', 'poisoned', 'blinded', 'deafened', 'frightened', 'charmed', 'restrained', 'prone', 'grappled']
-        for condition in condition_keywords:
-            if condition in entries_text:
-                conditions.append(condition)
-    return conditions
+    return list(spell.get('conditionInflict') or [])
 
 def is_healing_spell(spell: Dict) -> bool:
     """Determine if a spell is a healing spell."""
-    spell_name = spell.get('name', '').lower()
-    healing_keywords = ['heal', 'cure', 'aid', 'regenerate', 'restoration', 'life']
-    for keyword in healing_keywords:
-        if keyword in spell_name:
-            return True
-    
-    if 'entries' in spell:
-        entries_text = ' '.join([e if isinstance(e, str) else str(e) for e in spell['entries']]).lower()
-        if 'hit point' in entries_text and ('restore' in entries_text or 'regain' in entries_text or 'heal' in entries_text):
-            return True
-    return False
+    return program_of(spell).kind == 'healing'
 
 def is_resurrection_spell(spell: Dict) -> bool:
     """Determine if a spell is a resurrection spell."""
@@ -337,136 +450,164 @@ def is_resurrection_spell(spell: Dict) -> bool:
     return False
 
 def get_healing_amount(spell: Dict, caster_level: int = 1) -> int:
-    """Extract healing amount from a healing spell."""
-    # Similar to damage extraction, look for healing dice
-    if 'scalingLevelDice' in spell:
-        scaling = spell['scalingLevelDice']
-        scale_dict = scaling.get('scaling', {})
-        levels = sorted([int(k) for k in scale_dict.keys()])
-        applicable_level = max([l for l in levels if l <= caster_level], default=levels[0] if levels else 1)
-        dice_str = scale_dict.get(str(applicable_level), '1d6')
-        return calculate_spell_damage(dice_str)
-    
-    # Parse from entries
-    if 'entries' in spell:
-        for entry in spell['entries']:
-            if isinstance(entry, str) and '{@damage' in entry:
-                import re
-                heal_match = re.search(r'regain.*?({@damage ([^}]+)}|(\d+d\d+))', entry)
-                if heal_match:
-                    dice_str = heal_match.group(2) or heal_match.group(3)
-                    if dice_str:
-                        return calculate_spell_damage(dice_str)
-            elif isinstance(entry, str) and any(word in entry.lower() for word in ['regain', 'restore']):
-                import re
-                heal_match = re.search(r'(\d+d\d+|\d+) hit point', entry.lower())
-                if heal_match:
-                    return calculate_spell_damage(heal_match.group(1))
-    
-    return 0
+    """Roll the healing of a healing spell (without the caster's modifier)."""
+    program = program_of(spell)
+    return program.roll(None, caster_level) if program.kind == 'healing' else 0
 
 def calculate_spell_damage(damage_dice: str) -> int:
-    """Calculate damage from dice string like '2d6'."""
-    if not damage_dice:
+    """Calculate damage from dice string like '2d6' or '1d4+1'."""
+    dice = parse_dice(damage_dice)
+    if dice is None:
         return 0
-    try:
-        num, die = map(int, damage_dice.split('d'))
-        return sum(random.randint(1, die) for _ in range(num))
-    except:
+    count, faces, bonus = dice
+    return (roll_dice(count, faces) if count else 0) + bonus
+
+def spell_save_dc(caster: Character) -> int:
+    return 8 + caster.proficiency_bonus + (caster.ability_scores.get(caster.spellcasting_ability.upper(), 0) // 2 - 5)
+
+def _spend_slot(caster: Character, spell_level: int) -> Optional[int]:
+    """Spends the lowest slot of at least ``spell_level``; returns its level, or None if none is left.
+
+    ``spell_slots[0]`` holds the 1st-level slots.  Cantrips cost nothing
+    and return 0.
+    """
+    if spell_level <= 0 or not hasattr(caster, 'spell_slots'):
         return 0
+    for index in range(spell_level - 1, len(caster.spell_slots)):
+        if caster.spell_slots[index] > 0:
+            caster.spell_slots[index] -= 1
+            book = getattr(caster, 'spellbook', None)
+            if book is not None and book.slots is caster.spell_slots:
+                book.slot_spent(index + 1, caster.spell_slots[index])
+            return index + 1
+    return None
+
+def run_spell_program(program: SpellProgram, caster: Character, targets: List[Character], stats: Dict, slot_level: int):
+    """Runs a compiled spell against its targets and records the cast.
+
+    Damage and healing are rolled once for all targets, as in the rules.
+    Attack spells roll against each target's AC; save spells roll every
+    target's save together, with damage halved or negated on a success and
+    conditions only applied on a failure (and ended by a later save, see
+    mechanics.conditions.repeat_saves).
+    """
+    from mechanics.combat import apply_damage
+    caster_level = getattr(caster, 'level', 1)
+    modifier = caster.ability_scores.get(caster.spellcasting_ability.upper(), 0) // 2 - 5
+    total = 0
+    success = False
+    effect_type = program.kind
+
+    if program.kind == 'healing':
+        amount = program.roll(slot_level, caster_level) + (modifier if program.add_modifier else 0)
+        for target in targets:
+            if target.hitpoints_current > 0 and amount > 0:
+                healed = min(target.hitpoints_maximum, target.hitpoints_current + amount) - target.hitpoints_current
+                target.hitpoints_current += healed
+                total += healed
+                success = True
+    elif program.kind == 'resurrection':
+        for target in targets:
+            if target.hitpoints_current <= 0:
+                target.hitpoints_current = min(program.revive_hp or target.hitpoints_maximum, target.hitpoints_maximum)
+                target.conditions.discard('unconscious')
+                total += target.hitpoints_current
+                success = True
+    else:
+        if program.resolution == 'attack':
+            from mechanics.reactions import react_to_hit
+            attack_bonus = caster.proficiency_bonus + modifier
+            affected = []
+            for t in targets:
+                attack_total = roll_die(20) + attack_bonus
+                if attack_total >= t.ac:
+                    react_to_hit(t, caster, attack_total, stats)  # Shield may turn the hit into a miss
+                affected.append(attack_total >= t.ac)
+            saved = [False] * len(targets)
+        elif program.resolution == 'save':
+            from mechanics.conditions import saving_throw
+            save_dc = spell_save_dc(caster)
+            saved = [saving_throw(t, program.save_ability, save_dc) for t in targets]
+            affected = [True] * len(targets)
+        else:
+            affected = [True] * len(targets)
+            saved = [False] * len(targets)
+
+        damage = program.roll(slot_level, caster_level) if program.kind == 'damage' else 0
+        for target, hit, save in zip(targets, affected, saved):
+            if not hit:
+                continue
+            dealt = (damage // 2 if program.half_on_save else 0) if save else damage
+            if target.is_troop and program.area:
+                # the template catches many of the troop's members, each saving on its own
+                from mechanics.mass_combat import area_damage
+                save_ability = program.save_ability if program.resolution == 'save' else None
+                dealt = area_damage(target, damage, program.area, save_ability,
+                                    save_dc if save_ability else None, program.half_on_save)
+            if dealt > 0:
+                apply_damage(target, dealt, program.damage_type, stats, caster.name)
+                total += dealt
+                success = True
+            if not save and program.conditions:
+                target.conditions.update(program.conditions)
+                if event_log.active is not None:
+                    for condition in program.conditions:
+                        event_log.active.record(event_log.CONDITION, target.name, label=condition,
+                                                flags=event_log.APPLIED)
+                if program.resolution == 'save':
+                    # the target repeats the save at the end of each of its turns
+                    for condition in program.conditions:
+                        target.condition_saves[condition] = (program.save_ability, save_dc)
+                effect_type = 'damage_and_condition' if program.kind == 'damage' else 'condition'
+                success = True
+
+    stats["spells_cast"].setdefault(caster.name, {}).setdefault(program.name, 0)
+    stats["spells_cast"][caster.name][program.name] += 1
+    stats.setdefault('spell_effectiveness', []).append({
+        'spell': program.name, 'target': ', '.join(t.name for t in targets), 'targets': len(targets),
+        'success': success, 'effect_type': effect_type if success else None, 'amount': total,
+    })
+    if event_log.active is not None:
+        event_log.active.record(event_log.SPELL, caster.name, targets[0].name if targets else None, program.name,
+                                flags=event_log.SUCCESS if success else 0, a=slot_level, b=len(targets), c=total)
 
 def cast_spell(caster: Character, spell_name: str, target: Character, stats: Dict):
-    """Cast a spell at a target."""
-    spell = get_spell(spell_name)
-    if not spell:
+    """Cast a spell at a target by running its compiled program.
+
+    Area spells are aimed by mechanics.areas.best_placement at whatever
+    position catches the most foes among ``stats['combatants']`` (the target
+    and caster alone when absent).  The lowest available slot of at least
+    the spell's level is spent, and the effect scales with it.
+    """
+    program = get_spell_program(spell_name)
+    if program is None:
         return False
 
-    # Check range
-    spell_range = get_spell_range(spell)
-    if spell_range > 0 and caster.position.distance_to(target.position) > spell_range:
-        return False  # Out of range
-
-    # Get spell level and check slots
-    spell_level = spell.get('level', 0)
-    if hasattr(caster, 'spell_slots') and spell_level > 0:
-        if spell_level >= len(caster.spell_slots) or caster.spell_slots[spell_level] <= 0:
-            return False  # No slots available
-        caster.spell_slots[spell_level] -= 1
-
-    # Determine spell type
-    is_healing = is_healing_spell(spell)
-    is_resurrection = is_resurrection_spell(spell)
-
-    # Check for spell attack
-    spell_attack = spell.get('spellAttack', [])
-    hit = True  # Default to hit
-    if spell_attack and not is_healing:
-        # Calculate spell attack modifier
-        spell_mod = caster.ability_scores.get(caster.spellcasting_ability.upper(), 0) // 2 - 5
-        attack_roll = random.randint(1, 20) + caster.proficiency_bonus + spell_mod
-        if attack_roll < target.ac:
-            hit = False
-
-    # Get saving throw
-    save_type = get_spell_saving_throw(spell)
-    save_success = False
-    if save_type and not is_healing:
-        ability_key = save_type.upper()[:3]  # 'dex' for dexterity
-        save_mod = target.ability_scores.get(ability_key, 10) // 2 - 5
-        if ability_key in getattr(target, 'saving_throws', []):
-            save_mod += getattr(target, 'proficiency_bonus', 0)
-        save_roll = random.randint(1, 20) + save_mod
-        save_dc = 8 + caster.proficiency_bonus + (caster.ability_scores.get(caster.spellcasting_ability.upper(), 0) // 2 - 5)
-        save_success = save_roll >= save_dc
-
-    # Apply effects based on spell type
-    spell_effectiveness = {'spell': spell_name, 'target': target.name, 'success': False, 'effect_type': None, 'amount': 0}
-
-    if is_healing:
-        # Healing spells always succeed on allies
-        healing = get_healing_amount(spell, getattr(caster, 'level', 1))
-        if healing > 0:
-            target.hit_points = min(target.max_hp, target.hit_points + healing)
-            spell_effectiveness['success'] = True
-            spell_effectiveness['effect_type'] = 'healing'
-            spell_effectiveness['amount'] = healing
-    elif is_resurrection:
-        # Resurrection spell - restore dead character to life
-        if target.hit_points <= 0:
-            target.hit_points = max(1, target.max_hp // 2)  # Resurrect at half HP
-            spell_effectiveness['success'] = True
-            spell_effectiveness['effect_type'] = 'resurrection'
-            spell_effectiveness['amount'] = target.hit_points
+    if program.area and program.kind in ('damage', 'control'):
+        from mechanics.areas import best_placement
+        from characters.party_member import PartyMember
+        combatants = [c for c in stats.get('combatants') or [caster, target] if c.hitpoints_current > 0 and c is not caster]
+        foes = [c for c in combatants if isinstance(c, PartyMember) != isinstance(caster, PartyMember)]
+        allies = [c for c in combatants if isinstance(c, PartyMember) == isinstance(caster, PartyMember)]
+        placement = best_placement(program.area, caster, foes, allies, program.range)
+        if placement is None:
+            return False
+        _, _, foes_hit, allies_hit = placement
+        targets = foes_hit + allies_hit
     else:
-        # Damage spells
-        effects_apply = hit and not (save_type and save_success)
-
-        if effects_apply:
-            # Apply damage
-            damage_info = get_spell_damage(spell, getattr(caster, 'level', 1))
-            if damage_info:
-                damage = calculate_spell_damage(damage_info['dice'])
-                damage_type = damage_info.get('type', 'force')
-                from mechanics.combat import apply_damage
-                apply_damage(target, damage, damage_type, stats, caster.name)
-                spell_effectiveness['success'] = True
-                spell_effectiveness['effect_type'] = 'damage'
-                spell_effectiveness['amount'] = damage
-
-            # Apply conditions
-            conditions = get_spell_conditions(spell)
-            for condition in conditions:
-                target.conditions.add(condition)
-                if conditions:
-                    spell_effectiveness['effect_type'] = 'damage_and_condition'
-
-    # Track spell usage and effectiveness
-    stats["spells_cast"].setdefault(caster.name, {}).setdefault(spell_name, 0)
-    stats["spells_cast"][caster.name][spell_name] += 1
-    
-    # Track spell effectiveness
-    if 'spell_effectiveness' not in stats:
-        stats['spell_effectiveness'] = []
-    stats['spell_effectiveness'].append(spell_effectiveness)
-
-    return True
\ No newline at end of file
+        # Check range
+        if program.range > 0 and caster.position.distance_to(target.position) > program.range:
+            return False  # Out of range
+        targets = [target]
+
+    slot_level = _spend_slot(caster, program.level)
+    if slot_level is None:
+        return False  # No slots available
+    from mechanics.reactions import react_to_cast
+    if react_to_cast(caster, slot_level, stats):
+        if event_log.active is not None:
+            event_log.active.record(event_log.SPELL, caster.name, targets[0].name if targets else None, program.name,
+                                    flags=event_log.COUNTERED, a=slot_level, b=len(targets))
+        return True  # countered: the action and slot are spent for nothing
+    run_spell_program(program, caster, targets, stats, slot_level)
+    return True
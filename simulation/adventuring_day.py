@@ -0,0 +1,185 @@
+"""Adventuring days: several encounters fought back to back by the same party.
+
+Between encounters the party keeps its hit points, spell slots, conditions
+and hit dice, optionally recovering some of them with a short or long rest.
+That carried state is captured in a small immutable snapshot (one tuple per
+party member) instead of a copy of the characters, so rests are applied to
+snapshots directly and many days can branch from the same earlier encounter:
+every outcome of encounter k is continued ``branching[k]`` times, and the
+encounters before it are never replayed.
+
+Party members that drop to 0 HP stay down for the rest of the day; the day
+is lost as soon as the enemies win an encounter.
+"""
+from copy import deepcopy
+import numpy as np
+import pandas as pd
+from mechanics.combat import simulate_combat
+from mechanics.dice import roll_die
+from simulation.bulk_runner import _initialize_stats, seed_combat
+
+SHORT_REST = "short"
+LONG_REST = "long"
+
+
+def snapshot_party(party):
+    """Immutable snapshot of the state a party carries between encounters."""
+    return tuple(
+        (m.hitpoints_current, tuple(m.spell_slots), frozenset(m.conditions), m.hit_dice_remaining)
+        for m in party
+    )
+
+
+def restore_party(party, snapshot):
+    """Applies a snapshot to party member objects (in the same order)."""
+    for member, (hp, slots, conditions, hit_dice) in zip(party, snapshot):
+        member.hitpoints_current = hp
+        member.spell_slots = list(slots)
+        member.conditions = set(conditions)
+        member.hit_dice_remaining = hit_dice
+
+
+def short_rest(party, snapshot):
+    """Spends hit dice while it is worth it and restores pact magic slots.
+
+    ``party`` holds the fresh templates, which provide the maximum HP and
+    spell slots to recover towards.
+    """
+    result = []
+    for member, (hp, slots, conditions, hit_dice) in zip(party, snapshot):
+        if hp > 0:
+            con = (member.ability_scores.get("CON", 10) - 10) // 2
+            average = member.hit_die // 2 + 1 + con
+            # stop once the next die would mostly be wasted
+            while hit_dice > 0 and member.hitpoints_maximum - hp >= average:
+                hp = min(hp + max(roll_die(member.hit_die) + con, 0), member.hitpoints_maximum)
+                hit_dice -= 1
+            if member.caster_progression == "pact":
+                slots = tuple(member.spell_slots)
+        result.append((hp, slots, conditions, hit_dice))
+    return tuple(result)
+
+
+def long_rest(party, snapshot):
+    """Restores HP, spell slots and half the hit dice; clears conditions."""
+    result = []
+    for member, (hp, slots, conditions, hit_dice) in zip(party, snapshot):
+        if hp > 0:
+            hp = member.hitpoints_maximum
+            slots = tuple(member.spell_slots)
+            conditions = frozenset()
+            hit_dice = min(member.level, hit_dice + max(1, member.level // 2))
+        result.append((hp, slots, conditions, hit_dice))
+    return tuple(result)
+
+
+REST_RULES = {
+    None: lambda party, snapshot: snapshot,
+    SHORT_REST: short_rest,
+    LONG_REST: long_rest,
+}
+
+
+def play_encounter(party, enemies, snapshot, max_rounds=None):
+    """Fights one encounter from a party snapshot.
+
+    Returns:
+        (winner, snapshot of the party afterwards)
+    """
+    members = deepcopy(party)
+    restore_party(members, snapshot)
+    entities = [m for m in members if m.hitpoints_current > 0] + deepcopy(enemies)
+    kwargs = {} if max_rounds is None else {"max_rounds": max_rounds}
+    result = simulate_combat(entities, _initialize_stats(entities), **kwargs)
+    return result["winner"], snapshot_party(members)
+
+
+def run_adventuring_day(party, encounters, num_days=100, rests=None, branching=None, seed=None, max_rounds=None):
+    """Simulates adventuring days of several consecutive encounters.
+
+    Args:
+        party: PartyMember objects; their positions are their starting spots
+            in every encounter.
+        encounters: list of enemy lists (positions assigned), in order.
+        num_days: independent plays of the first encounter.
+        rests: one entry per gap between encounters: None, SHORT_REST or
+            LONG_REST.
+        branching: for encounters 2..n, how many times each outcome of the
+            previous encounter is continued (default 1).  A day count of
+            num_days * prod(branching) costs far fewer combats than playing
+            every day from scratch.
+        seed: makes the whole run reproducible.
+        max_rounds: per-encounter round cap (defaults to simulate_combat's).
+
+    Returns:
+        DataFrame with one row per simulated day: its weight (the rows of a
+        shallow branch stand in for several days), the first-encounter
+        ``root`` it descends from, whether the party survived, encounters
+        won, the encounter it fell in, and the HP and spell slots left.
+    """
+    rests = list(rests) if rests is not None else [None] * (len(encounters) - 1)
+    branching = list(branching) if branching is not None else [1] * (len(encounters) - 1)
+    if len(rests) != len(encounters) - 1 or len(branching) != len(encounters) - 1:
+        raise ValueError("rests and branching need one entry per gap between encounters")
+    for rest in rests:
+        if rest not in REST_RULES:
+            raise ValueError(f"Unknown rest: {rest}")
+
+    fanout = [num_days] + branching
+    records = []
+    # (root, snapshot, weight, encounters won)
+    nodes = [(None, snapshot_party(party), 1.0, 0)]
+    combats = 0
+    for k, enemies in enumerate(encounters):
+        next_nodes = []
+        for n, (root, snapshot, weight, won) in enumerate(nodes):
+            for b in range(fanout[k]):
+                if seed is not None:
+                    seed_combat(seed, f"{k}:{n}:{b}")
+                winner, after = play_encounter(party, enemies, snapshot, max_rounds)
+                combats += 1
+                child_root = b if root is None else root
+                child_weight = weight / fanout[k]
+                child_won = won + (winner == "party")
+                if winner == "enemies" or k == len(encounters) - 1:
+                    records.append(_day_record(party, child_root, after, child_weight, child_won,
+                                               None if winner != "enemies" else k + 1))
+                else:
+                    next_nodes.append((child_root, REST_RULES[rests[k]](party, after), child_weight, child_won))
+        nodes = next_nodes
+
+    df = pd.DataFrame(records)
+    df.attrs["combats"] = combats
+    return df
+
+
+def _day_record(party, root, snapshot, weight, won, defeated_at):
+    record = {
+        "root": root,
+        "weight": weight,
+        "survived": defeated_at is None,
+        "encounters_won": won,
+        "defeated_at": defeated_at,
+        "members_down": sum(1 for hp, _, _, _ in snapshot if hp <= 0),
+    }
+    for member, (hp, slots, _, _) in zip(party, snapshot):
+        record[f"hp_end_{member.name}"] = hp
+        record[f"spell_slots_left_{member.name}"] = sum(slots)
+    return record
+
+
+def summarize_days(df):
+    """Weighted day statistics with a standard error from the independent roots."""
+    weights = df["weight"]
+    survived = df["survived"].astype(float)
+    # days sharing a first encounter are correlated; their roots are independent
+    per_root = (survived * weights).groupby(df["root"]).sum() / weights.groupby(df["root"]).sum()
+    n = len(per_root)
+    return {
+        "days": len(df),
+        "combats": df.attrs.get("combats"),
+        "survival_probability": float((survived * weights).sum() / weights.sum()),
+        "survival_se": float(per_root.std(ddof=1) / np.sqrt(n)) if n > 1 else float("nan"),
+        "expected_encounters_won": float((df["encounters_won"] * weights).sum() / weights.sum()),
+        "expected_members_down": float((df["members_down"] * weights).sum() / weights.sum()),
+    }
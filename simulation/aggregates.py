@@ -0,0 +1,322 @@
+"""Streaming aggregates of a bulk run, updated as each combat finishes.
+
+Every tracked quantity has a MetricAggregate: Welford running mean and
+variance, a fixed-width histogram and a quantile sketch.  All three take
+O(1) memory per value range (not per combat) and merge exactly (the
+histogram and sketch) or to rounding error (mean and variance), so worker
+and chunk aggregates can be added together in any order.
+
+RunAggregates keeps one MetricAggregate per metric, per metric and entity,
+and per spell:
+
+- per combat: rounds and total damage dealt;
+- per entity: damage dealt, hit points at the end, turns survived, attacks
+  and crits (an entity that dealt no damage in a combat counts as 0);
+- per spell: the cast counts of compute_spell_effectiveness and the damage
+  and healing amounts of its successful casts.
+
+The figures of a run can be drawn from the histograms alone, see
+bulk_runner.plot_binned_histogram.
+"""
+import math
+
+ENTITY_METRICS = ("damage_dealt", "hp_end", "turns_survived", "attack_count", "crit_count")
+SPELL_COUNTS = ("casts", "successful_casts", "damage_casts", "healing_casts", "resurrection_casts")
+SKETCH_ACCURACY = 0.01
+
+
+class RunningStats:
+    """Count, sum, mean, variance (Welford), min and max of a stream of values."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        self.count += 1
+        self.total += x
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def merge(self, other):
+        """Adds ``other`` in (Chan et al.'s parallel update); returns self."""
+        if other.count == 0:
+            return self
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / n
+        self.mean += delta * other.count / n
+        self.count = n
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def variance(self):
+        """Sample variance (n - 1), nan below two values."""
+        return self.m2 / (self.count - 1) if self.count > 1 else float("nan")
+
+    @property
+    def std(self):
+        return math.sqrt(max(self.variance, 0)) if self.count > 1 else float("nan")
+
+
+class FixedHistogram:
+    """Counts per bin of a fixed width, bins created as values land in them.
+
+    Bin ``i`` covers [origin + i * width, origin + (i + 1) * width); the grid
+    is the same for every histogram of a metric, so merging adds counts.
+    """
+
+    def __init__(self, width=1.0, origin=0.0):
+        self.width = width
+        self.origin = origin
+        self.counts = {}
+
+    def add(self, x, n=1):
+        i = math.floor((x - self.origin) / self.width)
+        self.counts[i] = self.counts.get(i, 0) + n
+
+    def merge(self, other):
+        if (other.width, other.origin) != (self.width, self.origin):
+            raise ValueError("Cannot merge histograms with different bins")
+        for i, n in other.counts.items():
+            self.counts[i] = self.counts.get(i, 0) + n
+        return self
+
+    def binned(self, max_bins=20):
+        """(edges, counts) from the lowest to the highest filled bin, in at most ``max_bins`` bins.
+
+        Neighbouring bins are added together in groups of equal size, so the
+        bars stay on the histogram's grid.
+        """
+        if not self.counts:
+            return [], []
+        low, high = min(self.counts), max(self.counts)
+        group = max(1, math.ceil((high - low + 1) / max_bins))
+        bins = math.ceil((high - low + 1) / group)
+        counts = [0] * bins
+        for i, n in self.counts.items():
+            counts[(i - low) // group] += n
+        edges = [self.origin + (low + k * group) * self.width for k in range(bins + 1)]
+        return edges, counts
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative accuracy (as DDSketch).
+
+    Values are counted in logarithmic buckets of ratio gamma = (1 + a) / (1 - a),
+    so any quantile is returned within a relative error ``a`` of a value of
+    that rank; zero and negative values get their own buckets.
+    """
+
+    def __init__(self, accuracy=SKETCH_ACCURACY):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def _bucket(self, x):
+        return math.ceil(math.log(x) / self._log_gamma)
+
+    def _value(self, bucket):
+        return 2 * self.gamma ** bucket / (self.gamma + 1)
+
+    def add(self, x):
+        self.count += 1
+        if x > 0:
+            i = self._bucket(x)
+            self.positive[i] = self.positive.get(i, 0) + 1
+        elif x < 0:
+            i = self._bucket(-x)
+            self.negative[i] = self.negative.get(i, 0) + 1
+        else:
+            self.zeros += 1
+
+    def merge(self, other):
+        if other.accuracy != self.accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for i, n in theirs.items():
+                mine[i] = mine.get(i, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        """Value of rank ``q`` (0..1), nan for an empty sketch."""
+        if self.count == 0:
+            return float("nan")
+        rank = q * (self.count - 1)
+        seen = 0
+        for i in sorted(self.negative, reverse=True):
+            seen += self.negative[i]
+            if seen > rank:
+                return -self._value(i)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for i in sorted(self.positive):
+            seen += self.positive[i]
+            if seen > rank:
+                return self._value(i)
+        return self._value(max(self.positive))
+
+
+class MetricAggregate:
+    """Running stats, histogram and quantile sketch of one metric."""
+
+    def __init__(self, width=1.0):
+        self.stats = RunningStats()
+        self.histogram = FixedHistogram(width)
+        self.sketch = QuantileSketch()
+
+    def add(self, x):
+        self.stats.add(x)
+        self.histogram.add(x)
+        self.sketch.add(x)
+
+    def merge(self, other):
+        self.stats.merge(other.stats)
+        self.histogram.merge(other.histogram)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def summary(self):
+        s = self.stats
+        if s.count == 0:
+            return {"count": 0}
+        return {
+            "count": s.count, "mean": s.mean, "std": s.std, "min": s.min, "max": s.max,
+            "p10": self.sketch.quantile(0.1), "median": self.sketch.quantile(0.5),
+            "p90": self.sketch.quantile(0.9),
+        }
+
+
+class SpellAggregate:
+    """Cast counts and effect amounts of one spell."""
+
+    def __init__(self):
+        for key in SPELL_COUNTS:
+            setattr(self, key, 0)
+        self.damage = MetricAggregate()
+        self.healing = MetricAggregate()
+
+    def add(self, record):
+        self.casts += 1
+        if not record.get('success', False):
+            return
+        self.successful_casts += 1
+        effect_type = record.get('effect_type')
+        amount = record.get('amount', 0)
+        if effect_type in ('damage', 'damage_and_condition'):
+            self.damage_casts += 1
+            self.damage.add(amount)
+        elif effect_type == 'healing':
+            self.healing_casts += 1
+            self.healing.add(amount)
+        elif effect_type == 'resurrection':
+            self.resurrection_casts += 1
+
+    def merge(self, other):
+        for key in SPELL_COUNTS:
+            setattr(self, key, getattr(self, key) + getattr(other, key))
+        self.damage.merge(other.damage)
+        self.healing.merge(other.healing)
+        return self
+
+    def report(self):
+        """The compute_spell_effectiveness entry of this spell, plus damage spread."""
+        casts, damage, healing = self.casts, self.damage.stats, self.healing.stats
+        report = {key: getattr(self, key) for key in SPELL_COUNTS}
+        report.update(
+            total_damage=damage.total,
+            total_healing=healing.total,
+            total_resurrections=self.resurrection_casts,
+            success_rate=self.successful_casts / casts * 100 if casts > 0 else 0,
+            avg_damage_per_cast=damage.total / self.damage_casts if self.damage_casts > 0 else 0,
+            avg_healing_per_cast=healing.total / self.healing_casts if self.healing_casts > 0 else 0,
+            avg_damage_when_hit=damage.total / casts if casts > 0 else 0,
+        )
+        if damage.count > 1:
+            report.update(damage_std=damage.std, damage_median=self.damage.sketch.quantile(0.5),
+                          damage_p90=self.damage.sketch.quantile(0.9))
+        return report
+
+
+class RunAggregates:
+    """Streaming aggregates of the combats of a run (see module docstring)."""
+
+    def __init__(self):
+        self.combats = 0
+        self.winners = {}
+        self.metrics = {"rounds": MetricAggregate(), "total_damage": MetricAggregate()}
+        self.entities = {}  # name -> metric -> MetricAggregate
+        self.spells = {}  # name -> SpellAggregate
+
+    def __len__(self):
+        return self.combats
+
+    def add_spell(self, record):
+        name = record.get('spell', 'Unknown')
+        if name not in self.spells:
+            self.spells[name] = SpellAggregate()
+        self.spells[name].add(record)
+
+    def update(self, result):
+        """Adds one finished combat (the stats dict simulate_combat returns)."""
+        self.combats += 1
+        winner = result.get("winner")
+        self.winners[winner] = self.winners.get(winner, 0) + 1
+        self.metrics["rounds"].add(result.get("rounds", 0))
+        self.metrics["total_damage"].add(sum(result.get("damage_dealt", {}).values()))
+        for name in result.get("turns_survived", {}):
+            per_entity = self.entities.get(name)
+            if per_entity is None:
+                per_entity = self.entities[name] = {metric: MetricAggregate() for metric in ENTITY_METRICS}
+            for metric in ENTITY_METRICS:
+                per_entity[metric].add(result.get(metric, {}).get(name, 0))
+        for record in result.get("spell_effectiveness", ()):
+            self.add_spell(record)
+
+    def merge(self, other):
+        """Adds another run's (or worker's) aggregates in; returns self."""
+        self.combats += other.combats
+        for winner, n in other.winners.items():
+            self.winners[winner] = self.winners.get(winner, 0) + n
+        for name, metric in other.metrics.items():
+            self.metrics[name].merge(metric)
+        for name, metrics in other.entities.items():
+            if name not in self.entities:
+                self.entities[name] = {metric: MetricAggregate() for metric in ENTITY_METRICS}
+            for metric, aggregate in metrics.items():
+                self.entities[name][metric].merge(aggregate)
+        for name, spell in other.spells.items():
+            if name not in self.spells:
+                self.spells[name] = SpellAggregate()
+            self.spells[name].merge(spell)
+        return self
+
+    def summary(self):
+        """Plain dict of every metric's summary, per entity where it applies."""
+        summary = {name: metric.summary() for name, metric in self.metrics.items()}
+        for metric in ENTITY_METRICS:
+            summary[metric] = {name: m[metric].summary() for name, m in self.entities.items()}
+        return summary
+
+    def spell_report(self):
+        """Per-spell effectiveness, keyed as compute_spell_effectiveness."""
+        return {name: spell.report() for name, spell in self.spells.items()}
@@ -0,0 +1,330 @@
+"""Single-pass analysis stage shared by every report.
+
+The flattened simulation results are classified once by column, reduced in a
+single vectorised pass over the numeric block that the requested metrics
+need, and returned as one dictionary that the combat report, the Monte Carlo
+analysis and the regression analysis all consume.
+"""
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+# metric names accepted by analyze_results
+WIN_RATE = "win_rate"
+WIN_INDICATOR = "win_indicator"
+ROUNDS = "rounds"
+DAMAGE = "damage_dealt"
+DAMAGE_PER_ATTACK = "avg_damage_per_attack"
+CRITS = "crits"
+TURNS_NO_DAMAGE = "turns_no_damage"
+HP_END = "hp_end"
+TURNS_SURVIVED = "turns_survived"
+ACTIONS = "actions_used"
+REACTIONS = "reactions_used"
+MOVEMENT = "movement"
+DAMAGE_DISTRIBUTION = "damage_distribution"
+SURVIVAL_CURVE = "survival_curve"
+REGRESSION_FEATURES = "regression_features"
+
+ALL_METRICS = frozenset({
+    WIN_RATE, WIN_INDICATOR, ROUNDS, DAMAGE, DAMAGE_PER_ATTACK, CRITS, TURNS_NO_DAMAGE,
+    HP_END, TURNS_SURVIVED, ACTIONS, REACTIONS, MOVEMENT, DAMAGE_DISTRIBUTION,
+    SURVIVAL_CURVE, REGRESSION_FEATURES,
+})
+
+# per-entity column families written by flatten_dict
+ENTITY_PREFIXES = (
+    "damage_dealt_", "attack_count_", "crit_count_", "turns_survived_", "hp_end_",
+    "initiative_order_", "survival_sequence_", "actions_used_", "reactions_used_", "spells_cast_",
+)
+# families whose suffix is "<entity>_<name>"
+NESTED_PREFIXES = ("actions_used_", "reactions_used_", "spells_cast_")
+
+
+class ColumnIndex:
+    """Classification of result columns by metric family and entity.
+
+    Every column is looked at exactly once.  Entity names are taken from the
+    ``turns_survived_`` family (always present for every combatant) so that
+    names containing underscores are split correctly in nested families.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.families = {prefix: {} for prefix in ENTITY_PREFIXES}
+
+        entities = set()
+        for col in self.columns:
+            for prefix in ("turns_survived_", "hp_end_", "initiative_order_"):
+                if col.startswith(prefix):
+                    entities.add(col[len(prefix):])
+        # longest names first so "Orc_Chief" wins over "Orc"
+        self.entities = sorted(entities, key=len, reverse=True)
+
+        for col in self.columns:
+            for prefix in ENTITY_PREFIXES:
+                if not col.startswith(prefix):
+                    continue
+                rest = col[len(prefix):]
+                if prefix in NESTED_PREFIXES:
+                    entity = next((e for e in self.entities if rest.startswith(e + "_")), None)
+                    if entity is None:
+                        entity, _, name = rest.partition("_")
+                    else:
+                        name = rest[len(entity) + 1:]
+                    self.families[prefix].setdefault(entity, {})[name] = col
+                else:
+                    self.families[prefix][rest] = col
+                break
+
+    def family(self, prefix):
+        """Returns {entity: column} (or {entity: {name: column}} for nested families)."""
+        return self.families[prefix]
+
+
+def _flat_columns(mapping):
+    """Flattens a family mapping to a list of column names."""
+    cols = []
+    for value in mapping.values():
+        if isinstance(value, dict):
+            cols.extend(value.values())
+        else:
+            cols.append(value)
+    return cols
+
+
+def _needed_columns(index, df, metrics):
+    """Numeric columns that the requested metrics read."""
+    needed = []
+    if metrics & {ROUNDS, DAMAGE_DISTRIBUTION} and "rounds" in df:
+        needed.append("rounds")
+    if metrics & {DAMAGE, DAMAGE_PER_ATTACK, DAMAGE_DISTRIBUTION, REGRESSION_FEATURES}:
+        needed += _flat_columns(index.family("damage_dealt_"))
+    if metrics & {DAMAGE_PER_ATTACK, CRITS}:
+        needed += _flat_columns(index.family("attack_count_"))
+    if CRITS in metrics:
+        needed += _flat_columns(index.family("crit_count_"))
+        if "total_crits" in df:
+            needed.append("total_crits")
+    if TURNS_NO_DAMAGE in metrics and "turns_no_damage" in df:
+        needed.append("turns_no_damage")
+    if HP_END in metrics:
+        needed += _flat_columns(index.family("hp_end_"))
+    if metrics & {TURNS_SURVIVED, REGRESSION_FEATURES}:
+        needed += _flat_columns(index.family("turns_survived_"))
+    if REGRESSION_FEATURES in metrics:
+        needed += _flat_columns(index.family("initiative_order_"))
+    if ACTIONS in metrics:
+        needed += _flat_columns(index.family("actions_used_"))
+    if REACTIONS in metrics:
+        needed += _flat_columns(index.family("reactions_used_"))
+    # preserve order while removing duplicates
+    return list(dict.fromkeys(needed))
+
+
+def win_rate_with_ci(wins, n, confidence=0.95):
+    """Party win rate (in %) with a t-based confidence interval."""
+    if n == 0:
+        return 0, (0, 0)
+    p = wins / n
+    rate = p * 100
+    if n > 1:
+        # standard error of the 0/100 indicator, matching scipy.stats.sem
+        se = np.sqrt(p * (1 - p) * n / (n - 1)) * 100 / np.sqrt(n)
+    else:
+        se = 0
+    if n > 1 and se > 0:
+        return rate, stats.t.interval(confidence, n - 1, loc=rate, scale=se)
+    # either not enough samples or zero variance
+    return rate, (rate, rate)
+
+
+def _survival_curves(df, index):
+    """Percent of combats in which each entity is alive at the start of each round."""
+    curves = {}
+    for name, col in index.family("survival_sequence_").items():
+        sequences = [seq for seq in df[col].dropna().tolist() if isinstance(seq, (list, tuple))]
+        if not sequences:
+            continue
+        max_len = max(len(seq) for seq in sequences)
+        counts = np.zeros(max_len)
+        for seq in sequences:
+            counts[:len(seq)] += np.asarray(seq, dtype=bool)
+        curves[name] = list(counts / len(sequences) * 100)
+    return curves
+
+
+def _movement(df):
+    """Movement statistics, when the movement columns were recorded."""
+    movement_data = {
+        "Average Distance Moved Per Turn": df.get("distance_moved_per_turn", pd.Series(dtype=float)).apply(np.mean).mean(),
+        "Percentage of Turns with Movement": df.get("percentage_turns_moved", pd.Series(dtype=float)).mean(),
+        "Average Distance Between Entities": df.get("average_distance_between_entities", pd.Series(dtype=float)).apply(np.mean).mean(),
+    }
+    return {k: v for k, v in movement_data.items() if pd.notna(v)}
+
+
+def analyze_results(df, metrics=None):
+    """Computes the requested aggregates from in-memory results in one pass.
+
+    Args:
+        df: DataFrame of flattened combat results (one row per combat), or a
+            simulation.results_store.ResultsStore, which is reduced chunk by
+            chunk (only the metrics in STORE_METRICS).
+        metrics: iterable of metric names (see ALL_METRICS); None computes all.
+
+    Returns:
+        Dictionary keyed the way generate_combat_report and the analysis
+        classes expect, or None when there is no data.
+    """
+    from simulation.results_store import ResultsStore, analyze_store
+    if isinstance(df, ResultsStore):
+        return analyze_store(df, metrics)
+    if df is None or df.empty:
+        return None
+    metrics = ALL_METRICS if metrics is None else frozenset(metrics)
+
+    index = ColumnIndex(df.columns)
+    needed = _needed_columns(index, df, metrics)
+
+    # the single reduction pass over every numeric column we need
+    block = df[needed].apply(pd.to_numeric, errors="coerce") if needed else pd.DataFrame(index=df.index)
+    means = block.mean()
+    sums = block.sum()
+    all_nan = block.isna().all()
+
+    results = {}
+    n = len(df)
+
+    if metrics & {WIN_RATE, WIN_INDICATOR, REGRESSION_FEATURES} and "winner" in df:
+        party_wins = (df["winner"] == "party")
+        wins = int(party_wins.sum())
+        if WIN_RATE in metrics:
+            results["Win Rate (%)"] = win_rate_with_ci(wins, n)
+        if WIN_INDICATOR in metrics:
+            indicator = party_wins.astype(int) * 100
+            results["win_indicator"] = {"mean": indicator.mean(), "std": indicator.std(), "n": n}
+
+    if ROUNDS in metrics and "rounds" in block:
+        results["rounds"] = means["rounds"]
+        results["avg_rounds"] = means["rounds"]
+
+    damage_cols = index.family("damage_dealt_")
+    if DAMAGE in metrics:
+        results["damage_dealt"] = {
+            name: (means[col] if not all_nan[col] else 0) for name, col in damage_cols.items()
+        }
+
+    attack_cols = index.family("attack_count_")
+    if DAMAGE_PER_ATTACK in metrics and attack_cols:
+        avg_per_attack = {}
+        for name, col in attack_cols.items():
+            if name in damage_cols:
+                total_atk = sums[col]
+                avg_per_attack[name] = sums[damage_cols[name]] / total_atk if total_atk > 0 else 0
+        results["avg_damage_per_attack"] = avg_per_attack
+
+    if CRITS in metrics:
+        crit_cols = index.family("crit_count_")
+        if crit_cols:
+            results["crit_average"] = {name: means[col] for name, col in crit_cols.items()}
+            crit_stats = {}
+            for name, col in crit_cols.items():
+                attempts = sums[attack_cols[name]] if name in attack_cols else np.nan
+                crit_stats[name] = {
+                    "Average Crits": means[col],
+                    "Total Crits": sums[col],
+                    "Crit Rate": sums[col] / attempts if attempts and attempts > 0 else np.nan,
+                }
+            results["crit_statistics"] = crit_stats
+        if "total_crits" in block:
+            results["total_crits_mean"] = means["total_crits"]
+
+    if TURNS_NO_DAMAGE in metrics and "turns_no_damage" in block:
+        results["turns_no_damage"] = means["turns_no_damage"]
+
+    if HP_END in metrics:
+        hp_cols = index.family("hp_end_")
+        if hp_cols:
+            results["hp_end"] = {name: means[col] for name, col in hp_cols.items()}
+
+    turn_cols = index.family("turns_survived_")
+    if TURNS_SURVIVED in metrics and turn_cols:
+        results["turns_survived"] = {name: means[col] for name, col in turn_cols.items()}
+
+    if ACTIONS in metrics:
+        actions = {
+            entity: {action: means[col] for action, col in cols.items()}
+            for entity, cols in index.family("actions_used_").items()
+        }
+        if actions:
+            results["actions_used"] = actions
+
+    if REACTIONS in metrics:
+        reaction_cols = _flat_columns(index.family("reactions_used_"))
+        if reaction_cols:
+            results["Reaction Usage Rate"] = means[reaction_cols]
+
+    if MOVEMENT in metrics:
+        results["Movement Analysis"] = _movement(df)
+
+    distributions = {}
+    if DAMAGE_DISTRIBUTION in metrics and damage_cols:
+        damage_values = block[list(damage_cols.values())].sum(axis=1).dropna()
+        distributions["Damage Distribution"] = {
+            "Mean": damage_values.mean(),
+            "Standard Deviation": damage_values.std(),
+        }
+        results["damage_values"] = damage_values
+        if "rounds" in block:
+            results["round_values"] = block["rounds"].dropna()
+    if SURVIVAL_CURVE in metrics:
+        curves = _survival_curves(df, index)
+        if curves:
+            distributions["Survival Curve"] = curves
+    if metrics & {DAMAGE_DISTRIBUTION, SURVIVAL_CURVE}:
+        results["Probability Distributions"] = distributions
+
+    if REGRESSION_FEATURES in metrics:
+        results["regression_features"] = regression_features(df, index, block)
+
+    return results
+
+
+def regression_features(df, index=None, block=None):
+    """Derives the per-combat regression inputs from flattened results.
+
+    Returns a DataFrame with 'Turns Survived', 'Initiative', 'Damage Dealt'
+    and 'Win Percentage' columns, dropping rows missing any of them.
+    """
+    index = index if index is not None else ColumnIndex(df.columns)
+    if block is None:
+        needed = _needed_columns(index, df, frozenset({REGRESSION_FEATURES}))
+        block = df[needed].apply(pd.to_numeric, errors="coerce")
+    features = pd.DataFrame(index=df.index)
+
+    if "Win Percentage" in df.columns:
+        features["Win Percentage"] = df["Win Percentage"]
+    elif "winner" in df.columns:
+        features["Win Percentage"] = (df["winner"] == "party").astype(int) * 100
+
+    # total damage across all entities
+    damage_cols = list(index.family("damage_dealt_").values())
+    if damage_cols:
+        features["Damage Dealt"] = block[damage_cols].sum(axis=1)
+
+    # initiative: minimum initiative order (earliest actor)
+    init_cols = list(index.family("initiative_order_").values())
+    if init_cols:
+        features["Initiative"] = block[init_cols].min(axis=1)
+
+    # turns survived: average of all characters
+    turn_cols = list(index.family("turns_survived_").values())
+    if turn_cols:
+        features["Turns Survived"] = block[turn_cols].mean(axis=1)
+
+    required = ['Turns Survived', 'Initiative', 'Damage Dealt', 'Win Percentage']
+    existing = [c for c in required if c in features.columns]
+    if existing:
+        features = features.dropna(subset=existing)
+    return features
@@ -1,13 +1,16 @@
 from copy import deepcopy
+import random
 import numpy as np
 import pandas as pd
 import scipy.stats as stats
 from mechanics.combat import simulate_combat
+from simulation import analysis
+from simulation.aggregates import RunAggregates
 import matplotlib.pyplot as plt
 import statsmodels.api as sm
 
-# Global variable to store spell effectiveness data from simulations
-_last_spell_effectiveness_data = []
+# Streaming aggregates (spell effectiveness and per-entity metrics) of the last run
+_last_run_aggregates = RunAggregates()
 
 def _initialize_stats(entities):
     """Create a fresh statistics dictionary for a new combat."""
@@ -28,30 +31,105 @@ def _initialize_stats(entities):
         "damage_this_round": 0,
     }
 
-def run_bulk_simulations(entities, num_simulations):
-    """Runs multiple combat simulations and aggregates statistics."""
-    global _last_spell_effectiveness_data
-    _last_spell_effectiveness_data = []
+def seed_combat(seed, index):
+    """Seeds the global RNG for combat ``index`` of a run seeded with ``seed``.
 
-    simulation_results = []
+    Every combat gets its own deterministic stream, so combat ``index`` plays
+    out identically regardless of which run, chunk or worker executes it.
+    """
+    random.seed(f"{seed}:{index}")
+
+def run_bulk_simulations(entities, num_simulations, seed=None, start=0, store_path=None,
+                         checkpoint_path=None, checkpoint_every=1000, event_log_path=None):
+    """Runs multiple combat simulations and aggregates statistics.
 
-    for _ in range(num_simulations):
-        stats = _initialize_stats(entities)
-        result = simulate_combat(deepcopy(entities), stats)
+    With a seed, combat ``start + i`` is seeded via seed_combat, making the run
+    reproducible and letting any range of combats be run independently.
 
-        if "spell_effectiveness" in result:
-            _last_spell_effectiveness_data.extend(result["spell_effectiveness"])
+    With a store_path the results are appended to a memory-mapped results
+    store (see simulation.results_store) instead of being collected in a
+    DataFrame, and the ResultsStore is returned.  Each row also records the
+    scenario's design inputs, so variants of an encounter can be run into
+    the same store.
 
-        flattened = flatten_dict(result)
-        flattened.pop("spell_effectiveness", None)
-        simulation_results.append(flattened)
+    With a checkpoint_path the completed combats and the RNG state are saved
+    every ``checkpoint_every`` combats (see simulation.checkpoint); calling
+    again with the same path resumes the run where it stopped.
+
+    Spell effectiveness and the other metrics are also accumulated in a
+    RunAggregates as each combat finishes, see get_run_aggregates.
+
+    With an event_log_path every combat played by this call is logged event
+    by event (see mechanics.event_log), for replay with simulation.replay;
+    an existing log is appended to.
+    """
+    global _last_run_aggregates
+    _last_run_aggregates = aggregates = RunAggregates()
 
-    df = pd.DataFrame(simulation_results)
+    simulation_results = []
+    writer = None
+    if store_path is not None:
+        from simulation.results_store import ResultsWriter, design_inputs
+        writer = ResultsWriter(store_path, [e.name for e in entities], design=design_inputs(entities))
+
+    checkpoint = None
+    done = 0
+    if checkpoint_path is not None:
+        from simulation.checkpoint import RunCheckpoint, scenario_fingerprint
+        checkpoint = RunCheckpoint(checkpoint_path, scenario_fingerprint(entities, seed, start))
+        done = checkpoint.restore(simulation_results, aggregates, writer)
+    saved_rows = len(simulation_results)
+
+    log = None
+    if event_log_path is not None:
+        from mechanics.event_log import EventLog, activate
+        log = EventLog(event_log_path)
+        previous_log = activate(log)
+
+    try:
+        for i in range(done, num_simulations):
+            if seed is not None:
+                seed_combat(seed, start + i)
+            if log is not None:
+                log.begin(start + i)
+            stats = _initialize_stats(entities)
+            result = simulate_combat(deepcopy(entities), stats)
+
+            aggregates.update(result)
+
+            if writer is not None:
+                writer.append(result)
+            else:
+                flattened = flatten_dict(result)
+                flattened.pop("spell_effectiveness", None)
+                simulation_results.append(flattened)
+
+            if checkpoint is not None and ((i + 1) % checkpoint_every == 0 or i + 1 == num_simulations):
+                checkpoint.save(i + 1, simulation_results[saved_rows:], aggregates, writer)
+                saved_rows = len(simulation_results)
+    finally:
+        if log is not None:
+            log.close()
+            activate(previous_log)
+
+    if writer is not None:
+        from simulation.results_store import ResultsStore
+        writer.close()
+        return ResultsStore(store_path)
+
+    df = pd.DataFrame(simulation_results[:num_simulations])
     return df if not df.empty else None
 
+def get_run_aggregates():
+    """Returns the RunAggregates of the last run_bulk_simulations call."""
+    return _last_run_aggregates
+
 def get_spell_effectiveness_data():
-    """Returns the spell effectiveness data from the last run_bulk_simulations call."""
-    return _last_spell_effectiveness_data
+    """Returns the spell effectiveness data from the last run_bulk_simulations call.
+
+    This is the run's RunAggregates, which compute_spell_effectiveness accepts.
+    """
+    return _last_run_aggregates
 
 def flatten_dict(d, parent_key='', sep='_'):
     """Flattens a nested dictionary for easier DataFrame conversion."""
@@ -147,61 +225,21 @@ def compute_spell_effectiveness(spell_effectiveness_data):
     """Analyze and report on spell effectiveness across simulations.
     
     Args:
-        spell_effectiveness_data: List of spell effect records from stats
-    
+        spell_effectiveness_data: RunAggregates of a run, or a list of spell
+            effect records from stats
+
     Returns:
         Dictionary with spell effectiveness metrics
     """
     if not spell_effectiveness_data:
         return {}
-    
-    spell_stats = {}
-    
+    if isinstance(spell_effectiveness_data, RunAggregates):
+        return spell_effectiveness_data.spell_report()
+
+    aggregates = RunAggregates()
     for effect in spell_effectiveness_data:
-        spell_name = effect.get('spell', 'Unknown')
-        effect_type = effect.get('effect_type', 'unknown')
-        success = effect.get('success', False)
-        amount = effect.get('amount', 0)
-        caster = 'Unknown'  # Will be enhanced if available
-        
-        key = f"{spell_name}"
-        if key not in spell_stats:
-            spell_stats[key] = {
-                'casts': 0,
-                'successful_casts': 0,
-                'total_damage': 0,
-                'total_healing': 0,
-                'total_resurrections': 0,
-                'damage_casts': 0,
-                'healing_casts': 0,
-                'resurrection_casts': 0,
-            }
-        
-        spell_stats[key]['casts'] += 1
-        
-        if success:
-            spell_stats[key]['successful_casts'] += 1
-            if effect_type == 'damage':
-                spell_stats[key]['total_damage'] += amount
-                spell_stats[key]['damage_casts'] += 1
-            elif effect_type == 'healing':
-                spell_stats[key]['total_healing'] += amount
-                spell_stats[key]['healing_casts'] += 1
-            elif effect_type == 'resurrection':
-                spell_stats[key]['total_resurrections'] += 1
-                spell_stats[key]['resurrection_casts'] += 1
-            elif effect_type == 'damage_and_condition':
-                spell_stats[key]['total_damage'] += amount
-                spell_stats[key]['damage_casts'] += 1
-    
-    # Calculate effectiveness metrics
-    for spell_name, stats in spell_stats.items():
-        stats['success_rate'] = (stats['successful_casts'] / stats['casts'] * 100) if stats['casts'] > 0 else 0
-        stats['avg_damage_per_cast'] = (stats['total_damage'] / stats['damage_casts']) if stats['damage_casts'] > 0 else 0
-        stats['avg_healing_per_cast'] = (stats['total_healing'] / stats['healing_casts']) if stats['healing_casts'] > 0 else 0
-        stats['avg_damage_when_hit'] = (stats['total_damage'] / stats['casts']) if stats['casts'] > 0 else 0
-    
-    return spell_stats
+        aggregates.add_spell(effect)
+    return aggregates.spell_report()
 
 def compute_movement_statistics(df):
     """Computes movement-related statistics."""
@@ -212,6 +250,14 @@ def compute_movement_statistics(df):
     }
     return {k: v for k, v in movement_data.items() if pd.notna(v)}
 
+PER_ENTITY_METRICS = (
+    analysis.DAMAGE, analysis.DAMAGE_PER_ATTACK, analysis.CRITS, analysis.TURNS_NO_DAMAGE,
+    analysis.HP_END, analysis.TURNS_SURVIVED, analysis.ROUNDS, analysis.MOVEMENT,
+    analysis.DAMAGE_DISTRIBUTION, analysis.SURVIVAL_CURVE,
+)
+GLOBAL_METRICS = (analysis.WIN_RATE, analysis.ROUNDS)
+
+
 def analyze_combat_results_per_entity(df):
     """Produce per-entity metrics from combat simulation results.
 
@@ -222,59 +268,9 @@ def analyze_combat_results_per_entity(df):
         print("DEBUG: No valid data available.")
         return "No valid data available."
 
-    results = {}
-    # damage dealt averages
-    results["damage_dealt"] = compute_damage_statistics(df)
-
-    # average damage per attack, if attack_count present
-    attack_cols = [c for c in df.columns if c.startswith("attack_count_")]
-    if attack_cols:
-        avg_per_attack = {}
-        for col in attack_cols:
-            name = col.split("attack_count_")[-1]
-            dmg_col = f"damage_dealt_{name}"
-            if dmg_col in df.columns:
-                total_dmg = df[dmg_col].sum()
-                total_atk = df[col].sum()
-                avg_per_attack[name] = total_dmg / total_atk if total_atk>0 else 0
-        results["avg_damage_per_attack"] = avg_per_attack
-
-    # crit statistics
-    crit_cols = [c for c in df.columns if c.startswith("crit_count_")]
-    if crit_cols:
-        crits = {col.split("crit_count_")[-1]: df[col].mean() for col in crit_cols}
-        results["crit_average"] = crits
-    if "total_crits" in df:
-        results["total_crits_mean"] = df["total_crits"].mean()
-
-    # turns no damage
-    if "turns_no_damage" in df:
-        results["turns_no_damage"] = df["turns_no_damage"].mean()
-
-    # hp end statistics
-    hp_cols = [c for c in df.columns if c.startswith("hp_end_")]
-    if hp_cols:
-        stats = {}
-        for col in hp_cols:
-            name = col.split("hp_end_")[-1]
-            stats[name] = df[col].mean()
-        results["hp_end"] = stats
-
-    # survivability (average turns)
-    surv = {}
-    turns_cols = [c for c in df.columns if c.startswith("turns_survived_")]
-    for col in turns_cols:
-        name = col.split("turns_survived_")[-1]
-        surv[name] = df[col].mean()
-    if surv:
-        results["turns_survived"] = surv
-
-    # rounds distribution and other global metrics
-    results["rounds"] = df["rounds"].mean() if "rounds" in df else None
-
-    results["Movement Analysis"] = compute_movement_statistics(df)
-    results["Probability Distributions"] = compute_probability_distributions(df)
-
+    results = analysis.analyze_results(df, PER_ENTITY_METRICS)
+    results.pop("avg_rounds", None)
+    render_distribution_figures(results)
     return results
 
 def analyze_combat_results_global(df):
@@ -282,13 +278,45 @@ def analyze_combat_results_global(df):
     if df is None or df.empty:
         print("DEBUG: No valid data available.")
         return "No valid data available."
-    results = {}
-    results["Win Rate (%)"] = compute_win_loss_distribution(df)
-    if "rounds" in df:
-        # global average rounds and distribution saved via histogram
-        results["avg_rounds"] = df["rounds"].mean()
+    results = analysis.analyze_results(df, GLOBAL_METRICS)
+    results.pop("rounds", None)
     return results
 
+def distribution_figure_jobs(results, aggregates=None):
+    """Damage, rounds and survival figure jobs for utils.report_jobs.render_artifacts.
+
+    With a RunAggregates the damage and rounds figures are drawn from its
+    histograms rather than from the per-combat values in ``results``.
+    """
+    from utils.report_jobs import ArtifactJob
+    if not results:
+        return []
+    jobs = []
+    for key, metric, title, xlabel, path in (
+        ("damage_values", "total_damage", "Total Damage Distribution", "Damage", "damage_distribution.png"),
+        ("round_values", "rounds", "Rounds Per Combat", "Rounds", "rounds_distribution.png"),
+    ):
+        if aggregates is not None and aggregates.combats > 0:
+            edges, counts = aggregates.metrics[metric].histogram.binned()
+            jobs.append(ArtifactJob(path, plot_binned_histogram,
+                                    {"edges": edges, "counts": counts, "title": title, "xlabel": xlabel,
+                                     "output_path": path}))
+            continue
+        data = results.get(key)
+        if data is not None and len(data) > 0:
+            jobs.append(ArtifactJob(path, plot_and_save_histogram,
+                                    {"data": np.asarray(data), "title": title, "xlabel": xlabel, "output_path": path}))
+    curves = results.get("Probability Distributions", {}).get("Survival Curve")
+    if curves:
+        jobs.append(ArtifactJob("survival_curve.png", plot_survival_curve,
+                                {"curves": curves, "output_path": "survival_curve.png"}))
+    return jobs
+
+def render_distribution_figures(results):
+    """Draws the damage, rounds and survival figures from analysis results."""
+    for job in distribution_figure_jobs(results):
+        job.run()
+
 def plot_and_save_histogram(data, title, xlabel, output_path):
     """Generates a histogram and saves it as an image file."""
     if data is None or len(data) == 0:
@@ -302,6 +330,20 @@ def plot_and_save_histogram(data, title, xlabel, output_path):
     plt.savefig(output_path, bbox_inches='tight')
     plt.close()
 
+def plot_binned_histogram(edges, counts, title, xlabel, output_path):
+    """Draws an already binned histogram (FixedHistogram.binned) and saves it as an image file."""
+    if not counts:
+        return
+    plt.figure(figsize=(6,4))
+    plt.stairs(counts, edges, fill=True, edgecolor='black', alpha=0.7)
+    plt.title(title)
+    plt.xlabel(xlabel)
+    plt.ylabel("Frequency")
+    plt.grid(axis='y', linestyle='--', alpha=0.7)
+    plt.savefig(output_path, bbox_inches='tight')
+    plt.close()
+
+
 
 def compute_survival_curve(df):
     """Calculates survival probabilities over rounds and plots a curve.
@@ -327,19 +369,24 @@ def compute_survival_curve(df):
         curves[name] = [(counts[i] / total) * 100 for i in range(max_len)]
     # plot if we have at least one curve
     if curves:
-        plt.figure(figsize=(8, 6))
-        for name, probs in curves.items():
-            plt.plot(range(1, len(probs) + 1), probs, label=name)
-        plt.xlabel("Round")
-        plt.ylabel("Percent Alive")
-        plt.title("Survivability Curve")
-        plt.legend()
-        plt.grid(True)
-        plt.savefig("survival_curve.png", bbox_inches="tight")
-        plt.close()
+        plot_survival_curve(curves, "survival_curve.png")
     return curves
 
 
+def plot_survival_curve(curves, output_path):
+    """Plots percent-alive-by-round curves and saves them as an image file."""
+    plt.figure(figsize=(8, 6))
+    for name, probs in curves.items():
+        plt.plot(range(1, len(probs) + 1), probs, label=name)
+    plt.xlabel("Round")
+    plt.ylabel("Percent Alive")
+    plt.title("Survivability Curve")
+    plt.legend()
+    plt.grid(True)
+    plt.savefig(output_path, bbox_inches="tight")
+    plt.close()
+
+
 def compute_probability_distributions(df):
     """Computes probability distributions and generates histograms."""
     stats_dict = {}
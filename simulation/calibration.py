@@ -0,0 +1,164 @@
+"""Calibrates an encounter to a target party win rate.
+
+One knob of the enemy side is searched over its integer values: the number of
+enemies, their hit points or their AC.  The party win rate falls as any of
+them grows, so the search is a noisy bisection: at each probe, combats are
+added in batches until the confidence interval either excludes the target
+(and tells which half to keep) or is narrower than the tolerance.
+
+Every probe is played on the same per-combat seeds, and the combats played
+for a value are kept and only topped up when the value is probed again, so
+no sample is ever thrown away.
+"""
+from copy import deepcopy
+from mechanics.position import Position
+from simulation.analysis import win_rate_with_ci
+from simulation.bulk_runner import run_bulk_simulations
+
+KNOBS = ("count", "hitpoints", "ac")
+
+
+def scale_encounter(enemies, knob, value):
+    """Returns a copy of ``enemies`` with one knob set to ``value``.
+
+    "count" repeats the first enemy ``value`` times, lined up 5 ft apart;
+    "hitpoints" and "ac" set the stat of every enemy.
+    """
+    if knob == "count":
+        template = enemies[0]
+        scaled = []
+        for i in range(value):
+            enemy = deepcopy(template)
+            enemy.name = template.name if value == 1 else f"{template.name}_{i + 1}"
+            if template.position is not None:
+                p = template.position
+                enemy.position = Position(p.x, p.y + 5 * i, p.z)
+            scaled.append(enemy)
+        return scaled
+    if knob == "hitpoints":
+        scaled = deepcopy(enemies)
+        for enemy in scaled:
+            enemy.hitpoints_maximum = enemy.hitpoints_current = value
+        return scaled
+    if knob == "ac":
+        scaled = deepcopy(enemies)
+        for enemy in scaled:
+            enemy.ac = value
+        return scaled
+    raise ValueError(f"Unknown knob: {knob}")
+
+
+def _default_bounds(enemies, knob):
+    if knob == "count":
+        return 1, 8
+    if knob == "hitpoints":
+        return 1, 4 * max(e.hitpoints_maximum for e in enemies)
+    return 5, 30
+
+
+class _Probe:
+    """Combat outcomes played so far for one knob value."""
+
+    def __init__(self, party, enemies, knob, value, seed):
+        self.entities = party + scale_encounter(enemies, knob, value)
+        self.seed = seed
+        self.wins = 0
+        self.n = 0
+
+    def top_up(self, count):
+        df = run_bulk_simulations(self.entities, count, seed=self.seed, start=self.n)
+        self.wins += int((df["winner"] == "party").sum())
+        self.n += count
+
+    def rate(self, confidence):
+        return win_rate_with_ci(self.wins, self.n, confidence)
+
+
+def calibrate_encounter(party, enemies, target=70, knob="count", low=None, high=None, tolerance=3,
+                        batch=100, max_combats=20000, confidence=0.95, seed=0):
+    """Finds the knob value whose party win rate is closest to ``target``.
+
+    Args:
+        party, enemies: the encounter; positions and actions assigned.
+        target: desired party win rate in %.
+        knob: one of KNOBS.
+        low, high: inclusive search range for the knob value.
+        tolerance: stop refining a value once its CI half-width (in
+            percentage points) is below this.
+        batch: combats added to a probe at a time.
+        max_combats: overall budget.
+        confidence: level of the win rate confidence intervals.
+        seed: common seed of every probe.
+
+    Returns:
+        Dictionary with the knob, the chosen value, the configured enemy
+        list, its win rate and CI, the combats spent and the win rate of
+        every probed value.
+    """
+    if knob not in KNOBS:
+        raise ValueError(f"Unknown knob: {knob}")
+    default_low, default_high = _default_bounds(enemies, knob)
+    low = default_low if low is None else low
+    high = default_high if high is None else high
+    if low > high:
+        raise ValueError("low must not exceed high")
+
+    probes = {}
+    spent = 0
+
+    def probe(value):
+        if value not in probes:
+            probes[value] = _Probe(party, enemies, knob, value, seed)
+        return probes[value]
+
+    def refine(value):
+        """Adds batches until the CI excludes the target or is narrow enough.
+
+        Returns +1 if the win rate is above the target, -1 if below, 0 if
+        it is within tolerance (or the budget ran out).
+        """
+        nonlocal spent
+        p = probe(value)
+        while True:
+            if p.n:
+                rate, ci = p.rate(confidence)
+                if ci[0] > target:
+                    return 1
+                if ci[1] < target:
+                    return -1
+                if (ci[1] - ci[0]) / 2 <= tolerance:
+                    return 0
+            count = min(batch, max_combats - spent)
+            if count <= 0:
+                return 0
+            p.top_up(count)
+            spent += count
+
+    # bisection for the boundary where the win rate crosses the target;
+    # invariant: values < lo are too easy, values > hi too hard
+    lo, hi = low, high
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        side = refine(mid)
+        if side == 0:
+            break
+        if side > 0:
+            lo = mid + 1  # party still wins too often: make it harder
+        else:
+            hi = mid - 1
+
+    def distance(value):
+        return abs(probes[value].rate(confidence)[0] - target)
+
+    best = min(probes, key=distance)
+    refine(best)
+    rate, ci = probes[best].rate(confidence)
+    return {
+        "knob": knob,
+        "value": best,
+        "enemies": scale_encounter(enemies, knob, best),
+        "win_rate": rate,
+        "ci": ci,
+        "combats": spent,
+        "probes": {v: (probes[v].rate(confidence)[0], probes[v].n) for v in sorted(probes)},
+    }
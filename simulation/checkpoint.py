@@ -0,0 +1,147 @@
+"""Checkpoint and resume support for run_bulk_simulations.
+
+A checkpoint directory holds the result chunks completed so far (one pickle
+per chunk, or the rows already flushed to a results store) and a state file
+with the run's streaming aggregates, the state of the global RNG after the
+last completed combat and a fingerprint of the scenario.  A run restarted
+with the same checkpoint reloads the chunks and aggregates, restores the RNG and carries on from the next combat, so its results are
+identical to those of an uninterrupted run.  Asking for more combats than a
+finished checkpoint holds simply extends it.
+"""
+import base64
+import hashlib
+import json
+import os
+import pickle
+import random
+
+STATE_FILE = "state.json"
+FORMAT_VERSION = 2  # 2: aggregates in the state file, chunks hold rows only
+
+
+def _entity_fingerprint(entity):
+    """JSON-able description of everything about an entity that affects combat."""
+    position = entity.position
+    data = {
+        "type": type(entity).__name__,
+        "name": entity.name,
+        "ability_scores": entity.ability_scores,
+        "ac": entity.ac,
+        "initiative": entity.initiative,
+        "speed": entity.speed,
+        "hitpoints": [entity.hitpoints_current, entity.hitpoints_maximum],
+        "size": entity.size,
+        "weapon": entity.weapon,
+        "combat_style": entity.combat_style,
+        "flying_speed": entity.flying_speed,
+        "resistances": sorted(entity.resistances),
+        "immunities": sorted(entity.immunities),
+        "conditions": sorted(entity.conditions),
+        "position": None if position is None else [position.x, position.y, position.z],
+        "reactions": sorted(getattr(entity, "reactions", {})),
+        "actions": [
+            [a.get("name"), a.get("weight", 1), a.get("type", "action"),
+             getattr(a.get("mechanic"), "__module__", None), getattr(a.get("mechanic"), "__qualname__", None)]
+            for a in getattr(entity, "actions", [])
+        ],
+    }
+    for attr in ("char_class", "subclass", "level", "proficiency_bonus", "saving_throws",
+                 "spell_slots", "multiattack", "attack_count", "legendary_actions",
+                 "member_hitpoints", "attacks_per_member", "frontage"):
+        if hasattr(entity, attr):
+            data[attr] = getattr(entity, attr)
+    lair_action = getattr(entity, "lair_action", None)
+    if lair_action is not None:
+        data["lair_action"] = [getattr(lair_action, "__module__", None), getattr(lair_action, "__qualname__", None)]
+    if getattr(entity, "battle_map", None) is not None:
+        data["battle_map"] = entity.battle_map.describe()
+    return data
+
+
+def scenario_fingerprint(entities, seed=None, start=0):
+    """Hash of the entities, the engine version and the seeding of a run."""
+    from mechanics.combat import ENGINE_VERSION
+    payload = {
+        "engine": ENGINE_VERSION,
+        "seed": seed,
+        "start": start,
+        "entities": [_entity_fingerprint(e) for e in entities],
+    }
+    text = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class RunCheckpoint:
+    """Chunks and RNG position of one run_bulk_simulations call."""
+
+    def __init__(self, path, scenario):
+        self.path = path
+        self.scenario = scenario
+        self.completed = 0
+        self.chunks = []
+        self.store_base = 0  # rows the results store held before this run
+        os.makedirs(path, exist_ok=True)
+
+    def _state_path(self):
+        return os.path.join(self.path, STATE_FILE)
+
+    def restore(self, results, aggregates, writer=None):
+        """Reloads completed chunks into ``results``, the RunAggregates ``aggregates`` and the RNG.
+
+        Returns the number of completed combats (0 for a new checkpoint).
+        """
+        if not os.path.exists(self._state_path()):
+            self.store_base = writer.rows if writer is not None else 0
+            return 0
+        with open(self._state_path(), "r") as f:
+            state = json.load(f)
+        if state.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Checkpoint {self.path} was written in an older format "
+                             f"(version {state.get('version', 1)}, expected {FORMAT_VERSION}); "
+                             "delete it or use a new checkpoint directory")
+        if state["scenario"] != self.scenario:
+            raise ValueError(f"Checkpoint {self.path} belongs to a different scenario")
+
+        self.completed = state["completed"]
+        self.chunks = state["chunks"]
+        self.store_base = state.get("store_base", 0)
+        for chunk in self.chunks:
+            with open(os.path.join(self.path, chunk), "rb") as f:
+                results.extend(pickle.load(f))
+        aggregates.merge(pickle.loads(base64.b64decode(state["aggregates"])))
+        if writer is not None:
+            # rows flushed after the last checkpoint are replayed; rows
+            # already in the store before this run are kept
+            writer.truncate(self.store_base + self.completed)
+        random.setstate(pickle.loads(base64.b64decode(state["rng_state"])))
+        return self.completed
+
+    def save(self, completed, rows, aggregates, writer=None):
+        """Commits the combats completed since the last save.
+
+        ``rows`` are the new flattened results (ignored with a writer, whose
+        flushed store rows are the chunk) and ``aggregates`` the RunAggregates
+        of all ``completed`` combats.
+        """
+        if writer is not None:
+            writer.flush()
+            rows = []
+        chunk = f"chunk_{len(self.chunks):06d}.pkl"
+        with open(os.path.join(self.path, chunk), "wb") as f:
+            pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.chunks.append(chunk)
+        self.completed = completed
+
+        state = {
+            "version": FORMAT_VERSION,
+            "scenario": self.scenario,
+            "completed": completed,
+            "chunks": self.chunks,
+            "store_base": self.store_base,
+            "rng_state": base64.b64encode(pickle.dumps(random.getstate())).decode(),
+            "aggregates": base64.b64encode(pickle.dumps(aggregates, protocol=pickle.HIGHEST_PROTOCOL)).decode(),
+        }
+        tmp_path = self._state_path() + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._state_path())
@@ -0,0 +1,117 @@
+"""Paired A/B comparison of scenario variants with common random numbers.
+
+Every variant replays combat ``i`` from the same seed (seed_combat), so the
+variants see the same dice for as long as their decisions coincide and their
+outcomes are strongly correlated.  The difference of each variant against the
+baseline is then estimated per combat, whose variance is far smaller than the
+sum of the two independent variances.  Antithetic dice additionally pair each
+combat with its mirror image (every die rolled from 1 - u) and average the two.
+"""
+from copy import deepcopy
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+from mechanics.combat import simulate_combat
+from mechanics.dice import set_antithetic
+from simulation.bulk_runner import _initialize_stats, seed_combat
+
+# per-combat outcome extractors
+COMPARISON_METRICS = {
+    "party_win": lambda result: 100.0 if result["winner"] == "party" else 0.0,
+    "rounds": lambda result: float(result["rounds"]),
+}
+
+
+def _play(entities, seed, index, antithetic):
+    """Plays combat ``index`` of a variant from its common seed."""
+    seed_combat(seed, index)
+    previous = set_antithetic(antithetic)
+    try:
+        return simulate_combat(deepcopy(entities), _initialize_stats(entities))
+    finally:
+        set_antithetic(previous)
+
+
+def run_paired_outcomes(variants, num_simulations, seed=0, antithetic=False, metrics=("party_win", "rounds")):
+    """Plays every variant on the same per-combat random streams.
+
+    Args:
+        variants: dict of variant name -> list of entities (positions assigned).
+        num_simulations: number of combats (antithetic pairs count as one).
+        seed: common seed shared by all variants.
+        antithetic: also play each combat with antithetic dice and average.
+        metrics: names from COMPARISON_METRICS to record.
+
+    Returns:
+        dict of variant name -> {metric: np.ndarray of per-combat values}.
+    """
+    outcomes = {name: {m: np.empty(num_simulations) for m in metrics} for name in variants}
+    for i in range(num_simulations):
+        for name, entities in variants.items():
+            results = [_play(entities, seed, i, False)]
+            if antithetic:
+                results.append(_play(entities, seed, i, True))
+            for m in metrics:
+                outcomes[name][m][i] = np.mean([COMPARISON_METRICS[m](r) for r in results])
+    return outcomes
+
+
+def paired_difference(baseline_values, variant_values, confidence=0.95):
+    """Mean paired difference (variant - baseline) with a t confidence interval."""
+    diff = np.asarray(variant_values) - np.asarray(baseline_values)
+    n = len(diff)
+    mean = diff.mean() if n else np.nan
+    se = diff.std(ddof=1) / np.sqrt(n) if n > 1 else 0
+    if n > 1 and se > 0:
+        ci = stats.t.interval(confidence, n - 1, loc=mean, scale=se)
+    else:
+        ci = (mean, mean)
+    return mean, se, ci
+
+
+def compare_scenarios(variants, num_simulations, baseline=None, seed=0, antithetic=False,
+                      metrics=("party_win", "rounds"), confidence=0.95):
+    """Compares scenario variants against a baseline using common random numbers.
+
+    Example:
+        tank_ac = deepcopy(party)
+        tank_ac[0].ac += 2
+        compare_scenarios({"base": party + enemies, "+2 AC": tank_ac + enemies}, 500)
+
+    Returns:
+        DataFrame with one row per (variant, metric): baseline and variant
+        means, the paired difference with its CI, and the variance reduction
+        factor relative to comparing two independent runs of the same size.
+    """
+    names = list(variants)
+    if len(names) < 2:
+        raise ValueError("compare_scenarios needs at least two variants")
+    baseline = names[0] if baseline is None else baseline
+    if baseline not in variants:
+        raise ValueError(f"Unknown baseline variant: {baseline}")
+
+    outcomes = run_paired_outcomes(variants, num_simulations, seed, antithetic, metrics)
+
+    rows = []
+    for name in names:
+        if name == baseline:
+            continue
+        for m in metrics:
+            base_values = outcomes[baseline][m]
+            values = outcomes[name][m]
+            mean, se, ci = paired_difference(base_values, values, confidence)
+            # variance of the difference had the two runs been independent
+            independent_var = base_values.var(ddof=1) + values.var(ddof=1) if len(values) > 1 else np.nan
+            paired_var = se ** 2 * len(values)
+            rows.append({
+                "variant": name,
+                "metric": m,
+                "baseline_mean": base_values.mean(),
+                "variant_mean": values.mean(),
+                "difference": mean,
+                "ci_lower": ci[0],
+                "ci_upper": ci[1],
+                "variance_reduction": independent_var / paired_var if paired_var > 0 else np.nan,
+                "combats": len(values),
+            })
+    return pd.DataFrame(rows)
@@ -0,0 +1,329 @@
+"""Coordinator/worker mode for spreading bulk runs over several machines.
+
+The coordinator splits every scenario into seed-range jobs (combats
+``start .. start + count`` of a seeded run, see seed_combat) and hands them
+out over TCP with multiprocessing.connection, authenticated with a shared
+key.  Workers play their range with run_bulk_simulations and send back a
+compact summary of sums, which the coordinator adds into the scenario total.
+
+A job whose worker disconnects, or does not answer within the lease
+timeout, goes back into the queue.  Since a job's results only depend on its
+seed range, whichever copy finishes first is merged and any later duplicate
+is discarded, so every combat is counted exactly once.
+
+Messages are pickled, so the shared key is what stops anyone who can reach
+the port from running code on the coordinator or the workers.  There is no
+default key: a coordinator listening on anything but a loopback address and
+every worker need one (``authkey`` or the COMBAT_SIM_AUTHKEY environment
+variable); a loopback-only coordinator without one makes up a random key for
+its local workers.
+
+Start a worker on another host with:
+
+    python -m simulation.distributed HOST:PORT --authkey KEY
+"""
+import argparse
+import ipaddress
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Client, Listener
+import numpy as np
+from simulation.analysis import win_rate_with_ci
+from simulation.bulk_runner import get_run_aggregates, run_bulk_simulations
+
+AUTHKEY_ENV = "COMBAT_SIM_AUTHKEY"
+WAIT_SECONDS = 0.2
+
+
+def is_loopback(host):
+    """True if ``host`` only resolves to a loopback address."""
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def resolve_authkey(authkey, address, generate=False):
+    """The shared key as bytes: ``authkey``, else $COMBAT_SIM_AUTHKEY.
+
+    Without either, a random key when ``generate`` is set and ``address`` is
+    a loopback address; otherwise a ValueError.
+    """
+    if authkey is None:
+        authkey = os.environ.get(AUTHKEY_ENV) or None
+    if authkey is None:
+        if generate and is_loopback(address[0]):
+            return os.urandom(32)
+        raise ValueError(f"An authkey is required for {address[0]}:{address[1]}: "
+                         f"pass --authkey or set {AUTHKEY_ENV}")
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+
+def summarize_results(df, entity_names, aggregates=None):
+    """Compact, additive summary of a block of combat results.
+
+    The block's RunAggregates, when given, travel with the summary and are
+    merged with the other blocks'.
+    """
+    summary = {
+        "combats": len(df),
+        "party_wins": int((df["winner"] == "party").sum()),
+        "enemy_wins": int((df["winner"] == "enemies").sum()),
+        "rounds_sum": float(df["rounds"].sum()),
+        "rounds_sq_sum": float(np.square(df["rounds"].astype(float)).sum()),
+        "damage_dealt": {},
+        "hp_end": {},
+    }
+    for name in entity_names:
+        for key in ("damage_dealt", "hp_end"):
+            col = f"{key}_{name}"
+            summary[key][name] = float(df[col].fillna(0).sum()) if col in df else 0.0
+    if aggregates is not None:
+        summary["aggregates"] = aggregates
+    return summary
+
+
+def merge_summaries(total, part):
+    """Adds ``part`` into ``total`` (both from summarize_results)."""
+    if total is None:
+        return {k: dict(v) if isinstance(v, dict) else v for k, v in part.items()}
+    for key, value in part.items():
+        if key == "aggregates":
+            total[key].merge(value)
+        elif isinstance(value, dict):
+            for name, amount in value.items():
+                total[key][name] = total[key].get(name, 0) + amount
+        else:
+            total[key] += value
+    return total
+
+
+def finalize_summary(summary):
+    """Win rate with CI and per-combat means from a merged summary."""
+    n = summary["combats"]
+    finalized = {}
+    if "aggregates" in summary:
+        finalized["metrics"] = summary["aggregates"].summary()
+        finalized["spell_effectiveness"] = summary["aggregates"].spell_report()
+    rounds_mean = summary["rounds_sum"] / n
+    rounds_var = (summary["rounds_sq_sum"] - n * rounds_mean ** 2) / (n - 1) if n > 1 else float("nan")
+    return {
+        **finalized,
+        "combats": n,
+        "Win Rate (%)": win_rate_with_ci(summary["party_wins"], n),
+        "enemy_win_rate": summary["enemy_wins"] / n * 100,
+        "avg_rounds": rounds_mean,
+        "rounds_std": float(np.sqrt(max(rounds_var, 0))),
+        "damage_dealt": {k: v / n for k, v in summary["damage_dealt"].items()},
+        "hp_end": {k: v / n for k, v in summary["hp_end"].items()},
+    }
+
+
+class Coordinator:
+    """Hands out seed-range jobs to TCP workers and merges their summaries.
+
+    Args:
+        scenarios: dict of scenario name -> list of entities (positions and
+            actions assigned).
+        num_simulations: combats per scenario.
+        seed: seed of every scenario's run; job results depend only on it
+            and their range.
+        job_size: combats per job.
+        address: (host, port) to listen on; port 0 picks a free port.
+        authkey: shared secret workers must present (see resolve_authkey;
+            the key in use is ``self.authkey``).
+        lease_timeout: seconds after which an unanswered job is handed out
+            again (None: only when its worker disconnects).
+    """
+
+    def __init__(self, scenarios, num_simulations, seed=0, job_size=500, address=("127.0.0.1", 0),
+                 authkey=None, lease_timeout=600):
+        self.authkey = resolve_authkey(authkey, address, generate=True)
+        self.scenarios = scenarios
+        self.seed = seed
+        self.lease_timeout = lease_timeout
+        self.pending = deque()
+        for name in scenarios:
+            for start in range(0, num_simulations, job_size):
+                self.pending.append((name, start, min(job_size, num_simulations - start)))
+        self.total_jobs = len(self.pending)
+        self.leases = {}  # job -> (worker, deadline)
+        self.completed = set()
+        self.duplicates = 0
+        self.retries = 0
+        self.summaries = {name: None for name in scenarios}
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if not self.pending:
+            self._done.set()
+        self._listener = Listener(address, authkey=self.authkey)
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._listener.address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def _accept_loop(self):
+        while not self._done.is_set():
+            try:
+                conn = self._listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                # listener closed, or a client failed authentication
+                if self._done.is_set():
+                    return
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _next_job(self, worker):
+        with self._lock:
+            self._expire_leases()
+            while self.pending:
+                job = self.pending.popleft()
+                if job in self.completed:
+                    continue
+                deadline = None if self.lease_timeout is None else time.monotonic() + self.lease_timeout
+                self.leases[job] = (worker, deadline)
+                return job
+            return None
+
+    def _expire_leases(self):
+        now = time.monotonic()
+        for job, (worker, deadline) in list(self.leases.items()):
+            if deadline is not None and deadline < now:
+                del self.leases[job]
+                self.pending.append(job)
+                self.retries += 1
+
+    def _release(self, worker):
+        """Requeues the jobs leased to a worker that went away."""
+        with self._lock:
+            for job, (owner, _) in list(self.leases.items()):
+                if owner == worker:
+                    del self.leases[job]
+                    self.pending.appendleft(job)
+                    self.retries += 1
+
+    def _complete(self, job, summary):
+        with self._lock:
+            self.leases.pop(job, None)
+            if job in self.completed:
+                self.duplicates += 1
+                return
+            self.completed.add(job)
+            self.summaries[job[0]] = merge_summaries(self.summaries[job[0]], summary)
+            if len(self.completed) == self.total_jobs:
+                self._done.set()
+
+    def _serve(self, conn):
+        worker = None
+        try:
+            kind, name = conn.recv()
+            if kind != "hello":
+                return
+            # the connection, not the name, owns leases: a worker may reconnect
+            worker = (name, id(conn))
+            while True:
+                if self._done.is_set():
+                    conn.send(("done",))
+                    return
+                job = self._next_job(worker)
+                if job is None:
+                    # everything is leased out; wait in case a lease is returned
+                    conn.send(("wait", WAIT_SECONDS))
+                    conn.recv()
+                    continue
+                name, start, count = job
+                conn.send(("job", job, self.scenarios[name], self.seed, start, count))
+                kind, finished, summary = conn.recv()
+                if kind == "result":
+                    self._complete(tuple(finished), summary)
+        except (EOFError, OSError):
+            pass
+        finally:
+            if worker is not None:
+                self._release(worker)
+            conn.close()
+
+    def wait(self, timeout=None):
+        """Blocks until every job is merged; returns {scenario: merged summary}."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._done.wait(WAIT_SECONDS):
+            with self._lock:
+                self._expire_leases()
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError("Distributed run did not finish in time")
+        return self.summaries
+
+    def close(self):
+        self._done.set()
+        self._listener.close()
+
+
+def run_worker(address, authkey=None, worker_id=None):
+    """Connects to a coordinator and plays jobs until it says it is done."""
+    authkey = resolve_authkey(authkey, address)
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    with Client(tuple(address), authkey=authkey) as conn:
+        conn.send(("hello", worker_id))
+        while True:
+            message = conn.recv()
+            if message[0] == "done":
+                return
+            if message[0] == "wait":
+                time.sleep(message[1])
+                conn.send(("ready",))
+                continue
+            _, job, entities, seed, start, count = message
+            df = run_bulk_simulations(entities, count, seed=seed, start=start)
+            conn.send(("result", job, summarize_results(df, [e.name for e in entities], get_run_aggregates())))
+
+
+def run_distributed(scenarios, num_simulations, workers=None, seed=0, job_size=500,
+                    authkey=None, timeout=None):
+    """Runs scenarios through a localhost coordinator and local worker processes.
+
+    The same code path as a multi-host run; remote workers may join the
+    coordinator as well while it runs.
+
+    Returns:
+        dict of scenario name -> finalize_summary() of its merged results.
+    """
+    workers = workers or os.cpu_count() or 1
+    coordinator = Coordinator(scenarios, num_simulations, seed=seed, job_size=job_size, authkey=authkey).start()
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(coordinator.address, coordinator.authkey, f"local-{i}"),
+                                daemon=True)
+        for i in range(workers)
+    ]
+    try:
+        for p in processes:
+            p.start()
+        summaries = coordinator.wait(timeout)
+    finally:
+        coordinator.close()
+        for p in processes:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+    return {name: finalize_summary(summary) for name, summary in summaries.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a combat-sim worker for a remote coordinator.")
+    parser.add_argument("address", help="coordinator HOST:PORT")
+    parser.add_argument("--authkey", help=f"shared key (default: ${AUTHKEY_ENV})")
+    args = parser.parse_args()
+    host, _, port = args.address.rpartition(":")
+    try:
+        run_worker((host, int(port)), args.authkey)
+    except ValueError as e:
+        parser.error(str(e))
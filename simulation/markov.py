@@ -0,0 +1,250 @@
+"""Exact Markov-chain solver for small encounters.
+
+For a handful of melee combatants standing within reach of each other the
+combat state is small: every creature's hit points plus whether it is
+currently Dodging.  The solver propagates the exact probability distribution
+over those states round by round, using the same turn rules as
+mechanics.combat (flee threshold, lowest-HP targeting, weighted action
+choice, multiattack, advantage from Dodge, crits and resistances), with the
+transition of each (round-start state) memoised.  No dice are rolled, so the
+results are instant answers and ground truth for the Monte Carlo engines.
+
+Positions are assumed fixed: creatures that flee are treated as still being
+in reach, which is what happens in the engine once their foes follow them.
+Turn order follows rolled initiative as in the engine, so the solution is
+averaged over the exact distribution of initiative orders.
+"""
+from itertools import permutations
+from mechanics.actions import get_action_table, satisfied_requirements
+from mechanics.combat import attack, attack_damage_distribution, dash, disengage, dodge
+
+LOW_HP_RATIO = 0.3  # mirrors the retreat threshold in execute_turn
+NO_EFFECT_ACTIONS = (dash, disengage)  # movement-only actions, inert with fixed positions
+
+
+def _add(dist, key, p):
+    dist[key] = dist.get(key, 0.0) + p
+
+
+def initiative_orders(entities):
+    """[(order, probability)] of every turn order under d20 + initiative.
+
+    Higher counts act first and ties keep list order, as in
+    mechanics.scheduler.  The probability of an order is a product down the
+    chain: each creature's count must beat the next one's (or tie it from
+    earlier in the list).
+    """
+    counts = [{roll + e.initiative: 1 / 20 for roll in range(1, 21)} for e in entities]
+    orders = []
+    for order in permutations(range(len(entities))):
+        # tail[v]: probability that the rest of the chain is ordered, given the previous count v
+        tail = None
+        for k in reversed(range(len(order))):
+            i = order[k]
+            nxt = {}
+            for v, p in counts[i].items():
+                if tail is None:
+                    nxt[v] = p
+                else:
+                    j = order[k + 1]
+                    nxt[v] = p * sum(q for u, q in tail.items() if u < v or (u == v and i < j))
+            tail = nxt
+        probability = sum(tail.values())
+        if probability > 0:
+            orders.append((order, probability))
+    return orders
+
+
+class MarkovSolver:
+    """Exact win probability, round distribution and remaining HP of an encounter.
+
+    Args:
+        entities: PartyMember and Enemy objects, with actions assigned and
+            positions set; list order breaks initiative ties.
+        max_rounds: rounds to propagate before the remaining probability is
+            reported as unresolved (fights where everyone flees never end).
+        prune: states whose probability falls below this are dropped.
+    """
+
+    def __init__(self, entities, max_rounds=200, prune=1e-15):
+        from characters.party_member import PartyMember
+        from characters.enemy import Enemy
+
+        self.entities = list(entities)
+        self.max_rounds = max_rounds
+        self.prune = prune
+        self.names = [e.name for e in self.entities]
+        self.is_party = [isinstance(e, PartyMember) for e in self.entities]
+        if not all(isinstance(e, (PartyMember, Enemy)) for e in self.entities):
+            raise ValueError("The exact solver only supports PartyMember and Enemy combatants")
+        if all(self.is_party) or not any(self.is_party):
+            raise ValueError("The exact solver needs at least one combatant on each side")
+        self._validate()
+
+        self.max_hp = [e.hitpoints_maximum for e in self.entities]
+        self.foes = [
+            [j for j in range(len(self.entities)) if self.is_party[j] != self.is_party[i]]
+            for i in range(len(self.entities))
+        ]
+        self.action_probs = [self._action_probabilities(e) for e in self.entities]
+        self.orders = initiative_orders(self.entities)
+        self._damage = {}
+        self._round_cache = {}
+
+    def _validate(self):
+        for e in self.entities:
+            if e.position is None:
+                raise ValueError(f"{e.name} has no position")
+            if e.combat_style != "melee":
+                raise ValueError(f"{e.name}: the exact solver only supports melee combatants")
+            if e.position.z > 0 or e.is_flying:
+                raise ValueError(f"{e.name}: the exact solver only supports ground combatants")
+            if get_action_table(e, "bonus").entries:
+                raise ValueError(f"{e.name}: bonus actions are not supported by the exact solver")
+            if e.is_troop:
+                raise ValueError(f"{e.name}: troops are not supported by the exact solver")
+            if getattr(e, "legendary_actions", 0) or getattr(e, "lair_action", None) is not None:
+                raise ValueError(f"{e.name}: legendary and lair actions are not supported by the exact solver")
+        for i, a in enumerate(self.entities):
+            for j, b in enumerate(self.entities):
+                if self.is_party[i] != self.is_party[j] and a.position.distance_to(b.position) > a.weapon["range"]:
+                    raise ValueError(f"{a.name} is not within reach of {b.name}; positions must be fixed")
+
+    def _action_probabilities(self, entity):
+        """[(kind, probability)] of the action drawn when a target is available."""
+        probs = []
+        for action, p in get_action_table(entity).probabilities(satisfied_requirements(entity, True)):
+            mechanic = action["mechanic"]
+            if mechanic is attack:
+                probs.append(("attack", p))
+            elif mechanic is dodge:
+                probs.append(("dodge", p))
+            elif mechanic in NO_EFFECT_ACTIONS:
+                probs.append(("none", p))
+            else:
+                raise ValueError(f"{entity.name}: action {action['name']} is not supported by the exact solver")
+        return probs
+
+    def _turn_damage(self, i, j, dodging):
+        """Distribution of the total damage i deals to j with one Attack action."""
+        key = (i, j, dodging)
+        if key not in self._damage:
+            attacker, target = self.entities[i], self.entities[j]
+            advantage = attacker.attack_advantage + target.defense_advantage - (1 if dodging else 0)
+            single = attack_damage_distribution(attacker, target, advantage)
+            num_attacks = attacker.get_attack_count() if hasattr(attacker, "get_attack_count") else 1
+            total = {0: 1.0}
+            for _ in range(num_attacks):
+                nxt = {}
+                for a, p in total.items():
+                    for b, q in single.items():
+                        _add(nxt, a + b, p * q)
+                total = nxt
+            self._damage[key] = total
+        return self._damage[key]
+
+    def _take_turn(self, i, state, p, out):
+        """Adds the distribution of states after creature i's turn to ``out``."""
+        hps, dodging = state
+        # the Dodge from i's previous turn expires at the start of this one
+        if dodging[i]:
+            dodging = dodging[:i] + (False,) + dodging[i + 1:]
+        targets = [j for j in self.foes[i] if hps[j] > 0]
+        if not targets or hps[i] <= self.max_hp[i] * LOW_HP_RATIO:
+            # fleeing (or dead, or nothing left to fight): no effect on the state
+            _add(out, (hps, dodging), p)
+            return
+        target = min(targets, key=lambda j: hps[j])
+        for kind, q in self.action_probs[i]:
+            if kind == "attack":
+                for damage, r in self._turn_damage(i, target, dodging[target]).items():
+                    new_hps = hps[:target] + (max(hps[target] - damage, 0),) + hps[target + 1:]
+                    _add(out, (new_hps, dodging), p * q * r)
+            elif kind == "dodge":
+                _add(out, (hps, dodging[:i] + (True,) + dodging[i + 1:]), p * q)
+            else:
+                _add(out, (hps, dodging), p * q)
+
+    def _round(self, order, state):
+        """Memoised distribution of end-of-round states from a round-start state."""
+        key = (order, state)
+        if key in self._round_cache:
+            return self._round_cache[key]
+        dist = {state: 1.0}
+        for i in order:
+            nxt = {}
+            for s, p in dist.items():
+                if s[0][i] > 0:
+                    self._take_turn(i, s, p, nxt)
+                else:
+                    _add(nxt, s, p)  # the dead take no turns
+            dist = nxt
+        self._round_cache[key] = dist
+        return dist
+
+    def _winner(self, hps):
+        if not any(hp > 0 for hp, party in zip(hps, self.is_party) if party):
+            return "enemies"
+        if not any(hp > 0 for hp, party in zip(hps, self.is_party) if not party):
+            return "party"
+        return None
+
+    def solve(self):
+        """Runs the dynamic programme.
+
+        Returns:
+            Dictionary with the party/enemy win probabilities, the unresolved
+            probability mass, the distribution of the number of rounds, the
+            expected number of rounds and the expected HP at the end (overall
+            and given a party win), keyed by entity name.
+        """
+        start = (tuple(e.hitpoints_current for e in self.entities), tuple(False for _ in self.entities))
+        # the order is rolled once per combat, so it is part of the state
+        dist = {(order, start): p for order, p in self.orders}
+        wins = {"party": 0.0, "enemies": 0.0}
+        rounds = {}
+        hp_end = [0.0] * len(self.entities)
+        hp_end_party_win = [0.0] * len(self.entities)
+
+        for r in range(1, self.max_rounds + 1):
+            nxt = {}
+            for (order, state), p in dist.items():
+                for s, q in self._round(order, state).items():
+                    _add(nxt, (order, s), p * q)
+            dist = {}
+            for (order, state), p in nxt.items():
+                winner = self._winner(state[0])
+                if winner is None:
+                    if p >= self.prune:
+                        dist[(order, state)] = p
+                    continue
+                wins[winner] += p
+                rounds[r] = rounds.get(r, 0.0) + p
+                for k, hp in enumerate(state[0]):
+                    hp_end[k] += p * hp
+                    if winner == "party":
+                        hp_end_party_win[k] += p * hp
+            if not dist:
+                break
+
+        resolved = wins["party"] + wins["enemies"]
+        return {
+            "party_win_probability": wins["party"],
+            "enemy_win_probability": wins["enemies"],
+            "unresolved_probability": max(0.0, 1.0 - resolved),
+            "rounds_distribution": rounds,
+            "expected_rounds": sum(r * p for r, p in rounds.items()) / resolved if resolved else float("nan"),
+            "expected_hp_end": {
+                name: hp / resolved if resolved else float("nan") for name, hp in zip(self.names, hp_end)
+            },
+            "expected_hp_end_given_party_win": {
+                name: hp / wins["party"] if wins["party"] else float("nan")
+                for name, hp in zip(self.names, hp_end_party_win)
+            },
+            "states_explored": len(self._round_cache),
+        }
+
+
+def solve_encounter(entities, max_rounds=200):
+    """Exact outcome distribution of a small fixed-position melee encounter."""
+    return MarkovSolver(entities, max_rounds=max_rounds).solve()
@@ -0,0 +1,181 @@
+"""Successive-halving / racing search over candidate party builds.
+
+Each candidate build replaces one member of the party.  Candidates are played
+in rounds on common random numbers (combat ``i`` uses the same seed for every
+build), so they can be compared by their paired difference to the current
+leader.  After every round, builds whose difference is significantly below
+the leader are dropped, the remaining field is optionally cut to the best
+``1/eta`` of it (down to a few finalists), and the next round plays ``eta``
+times more combats.  Most of
+the budget therefore goes to the builds that are hard to tell apart.
+"""
+from copy import deepcopy
+from itertools import product
+import math
+import numpy as np
+import pandas as pd
+from characters.party_member import PartyMember
+from mechanics.combat import assign_default_actions
+from simulation.analysis import win_rate_with_ci
+from simulation.bulk_runner import run_bulk_simulations
+from simulation.comparison import paired_difference
+
+
+def make_build(base, level=None, weapon=None, combat_style=None, ability_scores=None, name=None):
+    """Builds a PartyMember like ``base`` with some of its build choices replaced.
+
+    A different level rescales hit points linearly and recomputes the
+    proficiency bonus.  The new member takes ``base``'s position.
+    """
+    level = base.level if level is None else level
+    hitpoints = base.hitpoints_maximum
+    proficiency_bonus = base.proficiency_bonus
+    if level != base.level:
+        hitpoints = max(1, round(base.hitpoints_maximum * level / base.level))
+        proficiency_bonus = 2 + (level - 1) // 4
+
+    member = PartyMember(
+        base.name if name is None else name,
+        base.char_class,
+        base.subclass,
+        level,
+        dict(base.ability_scores if ability_scores is None else ability_scores),
+        base.ac,
+        base.initiative,
+        base.speed,
+        hitpoints,
+        list(base.saving_throws),
+        proficiency_bonus,
+        list(base.features_traits),
+        [],
+        base.size,
+        dict(base.weapon if weapon is None else weapon),
+        base.combat_style if combat_style is None else combat_style,
+        base.flying_speed,
+    )
+    member.resistances = set(base.resistances)
+    member.immunities = set(base.immunities)
+    member.position = deepcopy(base.position)
+    assign_default_actions(member)
+    return member
+
+
+def build_grid(base, weapons=None, combat_styles=None, ability_spreads=None, levels=None):
+    """Candidate builds for every combination of the given choices.
+
+    Args:
+        base: the PartyMember whose build is varied.
+        weapons: dict of weapon name -> weapon (e.g. characters.weapons.WEAPONS or a subset).
+        combat_styles: iterable of "melee"/"ranged".
+        ability_spreads: dict of spread name -> ability score dict.
+        levels: iterable of levels.
+
+    Returns:
+        dict of build label -> PartyMember.
+    """
+    axes = [
+        [(f"{k}", {"weapon": v}) for k, v in (weapons or {}).items()] or [(None, {})],
+        [(s, {"combat_style": s}) for s in (combat_styles or ())] or [(None, {})],
+        [(k, {"ability_scores": v}) for k, v in (ability_spreads or {}).items()] or [(None, {})],
+        [(f"L{lv}", {"level": lv}) for lv in (levels or ())] or [(None, {})],
+    ]
+    candidates = {}
+    for combo in product(*axes):
+        label = " / ".join(part for part, _ in combo if part) or base.name
+        overrides = {}
+        for _, choice in combo:
+            overrides.update(choice)
+        candidates[label] = make_build(base, **overrides)
+    return candidates
+
+
+def _party_wins(party, enemies, slot, build, start, count, seed):
+    entities = party[:slot] + [build] + party[slot + 1:] + enemies
+    df = run_bulk_simulations(entities, count, seed=seed, start=start)
+    return (df["winner"] == "party").to_numpy(dtype=float) * 100
+
+
+def optimize_builds(candidates, party, enemies, slot=0, budget=20000, initial=50, eta=2,
+                    confidence=0.95, seed=0, max_rounds=10, finalists=2):
+    """Ranks candidate builds for one party slot by party win rate.
+
+    Args:
+        candidates: dict of build label -> PartyMember (see build_grid).
+        party, enemies: the encounter; positions and actions assigned.
+        slot: index of the party member the builds replace.
+        budget: maximum total number of combats.
+        initial: combats per build in the first round.
+        eta: growth of the per-round sample size and the halving factor;
+            None disables halving and only drops builds on CI evidence.
+        confidence: level of the paired confidence intervals.
+        seed: common seed, shared by every build.
+        max_rounds: stop after this many rounds.
+        finalists: halving never cuts the field below this many builds;
+            the finalists are only separated by their confidence intervals.
+
+    Returns:
+        DataFrame ranked best first with the win rate, its CI, the combats
+        spent and the round in which each build was eliminated (NaN for
+        the survivors).
+    """
+    if not candidates:
+        raise ValueError("optimize_builds needs at least one candidate")
+    wins = {label: np.empty(0) for label in candidates}
+    eliminated = {}
+    alive = list(candidates)
+    spent = 0
+    played = 0
+    batch = initial
+
+    for rnd in range(1, max_rounds + 1):
+        batch = min(batch, (budget - spent) // len(alive))
+        if batch <= 0:
+            break
+        for label in alive:
+            new = _party_wins(party, enemies, slot, candidates[label], played, batch, seed)
+            wins[label] = np.concatenate([wins[label], new])
+        spent += batch * len(alive)
+        played += batch
+        if len(alive) == 1:
+            break
+
+        leader = max(alive, key=lambda label: wins[label].mean())
+        survivors = []
+        for label in alive:
+            if label == leader:
+                survivors.append(label)
+                continue
+            _, _, ci = paired_difference(wins[leader], wins[label], confidence)
+            if ci[1] < 0:
+                eliminated[label] = rnd
+            else:
+                survivors.append(label)
+        if eta is not None and len(survivors) > finalists:
+            survivors.sort(key=lambda label: wins[label].mean(), reverse=True)
+            keep = max(finalists, math.ceil(len(survivors) / eta))
+            for label in survivors[keep:]:
+                eliminated[label] = rnd
+            survivors = survivors[:keep]
+        alive = survivors
+        if len(alive) == 1:
+            break
+        batch *= eta if eta is not None else 2
+
+    rows = []
+    for label, values in wins.items():
+        rate, ci = win_rate_with_ci(values.sum() / 100, len(values), confidence)
+        rows.append({
+            "build": label,
+            "win_rate": rate,
+            "ci_lower": ci[0],
+            "ci_upper": ci[1],
+            "combats": len(values),
+            "eliminated_round": eliminated.get(label, np.nan),
+        })
+    table = pd.DataFrame(rows)
+    # survivors first, then by how long they lasted, then by win rate
+    table["_order"] = table["eliminated_round"].fillna(np.inf)
+    table = table.sort_values(["_order", "win_rate"], ascending=False).drop(columns="_order")
+    table.insert(0, "rank", range(1, len(table) + 1))
+    table.attrs["combats"] = spent
+    return table.reset_index(drop=True)
@@ -0,0 +1,137 @@
+"""Step-by-step replay of combats from an event log (see mechanics.event_log).
+
+The state of every creature (hit points, position, conditions) is rebuilt
+from the log as the events go by, so each line of the replay shows the
+event together with what it left behind.
+
+List the logged combats, e.g. the ones that dragged on for 30 rounds or more:
+
+    python -m simulation.replay LOG --min-rounds 30
+
+Replay one of them, optionally only the events involving one creature:
+
+    python -m simulation.replay LOG --combat 12 --entity "Orc Chief"
+"""
+import argparse
+from mechanics.event_log import APPLIED, COMBAT_END, COUNTERED, CRIT, HIT, PARTY, SUCCESS, VOLLEY, EventLogReader
+
+
+class CombatState:
+    """Creatures of one combat as the log describes them so far."""
+
+    def __init__(self):
+        self.creatures = {}  # name -> {"party", "hp", "position", "conditions"}
+        self.round = 0
+        self.winner = None
+
+    def apply(self, event):
+        kind, actor = event["kind"], event["actor"]
+        self.round = event["round"]
+        if kind == "entity":
+            self.creatures[actor] = {"party": bool(event["flags"] & PARTY), "hp": event["a"],
+                                     "position": (event["b"], event["c"], 0.0), "conditions": set()}
+        elif kind == "turn_start" and actor in self.creatures:
+            self.creatures[actor]["hp"] = event["a"]
+        elif kind == "move" and actor in self.creatures:
+            self.creatures[actor]["position"] = (event["a"], event["b"], event["c"])
+        elif kind == "damage" and event["target"] in self.creatures:
+            self.creatures[event["target"]]["hp"] = event["b"]
+        elif kind == "condition" and actor in self.creatures:
+            conditions = self.creatures[actor]["conditions"]
+            if event["flags"] & APPLIED:
+                conditions.add(event["label"])
+            else:
+                conditions.discard(event["label"])
+        elif kind == "combat_end":
+            self.winner = event["label"]
+
+    def describe(self, name):
+        creature = self.creatures.get(name)
+        if creature is None:
+            return name
+        x, y, z = creature["position"]
+        conditions = f" [{', '.join(sorted(creature['conditions']))}]" if creature["conditions"] else ""
+        return f"{name} ({creature['hp']:g} HP at {x:g},{y:g},{z:g}{conditions})"
+
+
+def describe_event(event, state):
+    """One line of text for an event, using the state it left behind."""
+    kind, actor, target, label = event["kind"], event["actor"], event["target"], event["label"]
+    a, b, c, flags = event["a"], event["b"], event["c"], event["flags"]
+    if kind == "combat_start":
+        return f"combat {event['combat']}: {a:g} creatures"
+    if kind == "entity":
+        return f"  {'party' if flags & PARTY else 'enemy'}: {state.describe(actor)}"
+    if kind == "turn_start":
+        return f"turn of {state.describe(actor)}"
+    if kind == "move":
+        return f"  {actor} moves to {a:g},{b:g},{c:g}"
+    if kind == "attack" and label == VOLLEY:
+        return f"  {actor} volleys {target}: {a:g} attacks, {b:g} hit, {c:g} crit"
+    if kind == "attack":
+        outcome = "crits" if flags & CRIT else "hits" if flags & HIT else "misses"
+        return f"  {actor} attacks {target}: {a:g} ({b:g} vs AC {c:g}), {outcome}"
+    if kind == "damage":
+        return f"  {actor} deals {a:g} damage to {state.describe(target)}"
+    if kind == "spell":
+        if flags & COUNTERED:
+            return f"  {actor} casts {label} (level {a:g}), countered"
+        outcome = "succeeds" if flags & SUCCESS else "fails"
+        on = f" on {target}" + (f" and {b - 1:g} more" if b > 1 else "") if target else ""
+        return f"  {actor} casts {label}{on} (level {a:g}), {outcome}, {c:g}"
+    if kind == "reaction":
+        return f"  {actor} reacts with {label}" + (f" against {target}" if target else "")
+    if kind == "condition":
+        return f"  {actor} {'is now' if flags & APPLIED else 'is no longer'} {label}"
+    if kind == "combat_end":
+        return f"combat {event['combat']} ends after {a:g} rounds, winner: {label}"
+    return f"  {kind} {actor} {target} {label}"
+
+
+def replay(path, combat, entity=None):
+    """Yields (event, CombatState, text) for each event of a combat.
+
+    With an ``entity`` only the events it takes part in are yielded, but the
+    state is still rebuilt from every event.
+    """
+    reader = EventLogReader(path)
+    state = CombatState()
+    current_round = None
+    for event in reader.events(combat):
+        state.apply(event)
+        if entity is not None and entity not in (event["actor"], event["target"]) and \
+                event["kind"] not in ("combat_start", "combat_end"):
+            continue
+        if event["round"] != current_round and event["round"] > 0:
+            current_round = event["round"]
+            yield event, state, f"-- round {current_round} --"
+        yield event, state, describe_event(event, state)
+
+
+def combat_outcomes(path, min_rounds=0):
+    """[(combat, rounds, winner)] of the logged combats lasting at least ``min_rounds`` rounds."""
+    reader = EventLogReader(path)
+    ends = reader.records[reader.records["kind"] == COMBAT_END]
+    return [
+        (int(r["combat"]), int(r["a"]), reader.name(r["label"]))
+        for r in ends if r["a"] >= min_rounds
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay combats from an event log")
+    parser.add_argument("log", help="event log directory (run_bulk_simulations event_log_path)")
+    parser.add_argument("--combat", type=int, help="combat index to replay (lists the combats if omitted)")
+    parser.add_argument("--entity", help="only show events involving this creature")
+    parser.add_argument("--min-rounds", type=int, default=0, help="only list combats lasting this many rounds")
+    args = parser.parse_args(argv)
+    if args.combat is None:
+        for combat, rounds, winner in combat_outcomes(args.log, args.min_rounds):
+            print(f"combat {combat}: {rounds} rounds, winner: {winner}")
+        return
+    for _, _, text in replay(args.log, args.combat, args.entity):
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""Memory-mapped columnar storage for very large simulation runs.
+
+A results store is a directory holding one raw fixed-dtype file per metric
+column and a small JSON header (row count, entity names, column dtypes).
+Columns are opened with numpy.memmap, so aggregates over tens of millions of
+combats are computed chunk by chunk without ever materialising a DataFrame.
+
+Stored per combat: the winner (coded), the number of rounds, and per entity
+the damage dealt, the HP at the end and the round in which it dropped
+(0 if it never did).  Each row also carries the scenario's design inputs
+(design_inputs: per side AC, HP, level, weapon dice and creature count), so
+runs of several variants of an encounter can share one store and be
+regressed on what was varied (utils.regressionanalysis.DesignRegression).
+"""
+import json
+import os
+import numpy as np
+from simulation.analysis import (
+    DAMAGE, DAMAGE_DISTRIBUTION, HP_END, ROUNDS, SURVIVAL_CURVE, WIN_INDICATOR, WIN_RATE,
+    win_rate_with_ci,
+)
+
+HEADER_FILE = "header.json"
+FORMAT_VERSION = 1
+WINNER_CODES = ("enemies", "party", "draw")
+PARTY_CODE = WINNER_CODES.index("party")
+CHUNK_SIZE = 1 << 20
+
+DESIGN_PREFIX = "design_"
+DESIGN_SIDES = ("party", "enemy")
+DESIGN_INPUTS = ("count", "ac", "hp", "level", "weapon_dice")
+
+# metrics that can be computed from a store
+STORE_METRICS = frozenset({WIN_RATE, WIN_INDICATOR, ROUNDS, DAMAGE, HP_END, DAMAGE_DISTRIBUTION, SURVIVAL_CURVE})
+
+
+def store_columns(entity_names, design=()):
+    """(column, dtype) pairs stored for a combat between the named entities."""
+    columns = [("winner", "u1"), ("rounds", "<i4")]
+    for prefix, dtype in (("damage_dealt_", "<i4"), ("hp_end_", "<i4"), ("death_round_", "<i4")):
+        columns += [(f"{prefix}{name}", dtype) for name in entity_names]
+    columns += [(f"{DESIGN_PREFIX}{name}", "<f4") for name in design]
+    return columns
+
+
+def design_inputs(entities):
+    """Scenario input parameters of a run, per side (party_ac, enemy_hp, ...).
+
+    AC and level are side averages, HP the side's total maximum, weapon dice
+    the average roll of a weapon's damage dice and count the number of
+    creatures (a troop counts its members).
+    """
+    from characters.party_member import PartyMember
+    inputs = {}
+    for side in DESIGN_SIDES:
+        members = [e for e in entities if isinstance(e, PartyMember) == (side == "party")]
+        n = max(len(members), 1)
+        dice = [e.weapon["damage_dice"].split("d") for e in members if e.weapon]
+        inputs[f"{side}_count"] = sum(e.members if e.is_troop else 1 for e in members)
+        inputs[f"{side}_ac"] = sum(e.ac for e in members) / n
+        inputs[f"{side}_hp"] = sum(e.hitpoints_maximum for e in members)
+        inputs[f"{side}_level"] = sum(getattr(e, "level", 0) for e in members) / n
+        inputs[f"{side}_weapon_dice"] = sum(int(k) * (int(d) + 1) / 2 for k, d in dice) / max(len(dice), 1)
+    return inputs
+
+
+def death_round(result, name):
+    """Round in which ``name`` dropped to 0 HP, or 0 if it survived."""
+    sequence = result.get("survival_sequence", {}).get(name, [])
+    if False in sequence:
+        # dead at the start of round k+1, so it dropped during round k
+        return sequence.index(False)
+    if result.get("hp_end", {}).get(name, 1) <= 0:
+        return result["rounds"]
+    return 0
+
+
+def combat_row(result, entity_names):
+    """Stored values of one simulate_combat result."""
+    row = {
+        "winner": WINNER_CODES.index(result["winner"]),
+        "rounds": result["rounds"],
+    }
+    for name in entity_names:
+        row[f"damage_dealt_{name}"] = result["damage_dealt"].get(name, 0)
+        row[f"hp_end_{name}"] = result["hp_end"].get(name, 0)
+        row[f"death_round_{name}"] = death_round(result, name)
+    return row
+
+
+def is_results_store(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, HEADER_FILE))
+
+
+def _write_header(path, header):
+    tmp_path = os.path.join(path, HEADER_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(header, f, indent=1)
+    os.replace(tmp_path, os.path.join(path, HEADER_FILE))
+
+
+def _read_header(path):
+    with open(os.path.join(path, HEADER_FILE), "r") as f:
+        header = json.load(f)
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported results store version: {header.get('version')}")
+    return header
+
+
+class ResultsWriter:
+    """Appends combat results to a results store in fixed-size chunks.
+
+    Rows are buffered in NumPy arrays and appended to the column files when
+    the buffer is full; the header row count is only advanced after the data
+    is written, so a store is always readable up to its last flush.
+
+    ``design`` maps design input names to this run's values, written on
+    every row; runs appending to the same store must use the same names.
+    A store written before design inputs were stored has no design columns,
+    so rows appended to it are stored without them.
+    """
+
+    def __init__(self, path, entity_names, chunk_size=65536, design=None):
+        self.path = path
+        self.entity_names = list(entity_names)
+        self.chunk_size = chunk_size
+        self.design = dict(design or {})
+        columns = store_columns(self.entity_names, self.design)
+
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, HEADER_FILE)):
+            self.header = _read_header(path)
+            if self.header["entities"] != self.entity_names:
+                raise ValueError("Results store was written for different entities")
+            if "design" not in self.header and not any(
+                    c["name"].startswith(DESIGN_PREFIX) for c in self.header["columns"]):
+                self.design = {}
+            elif self.header.get("design", []) != list(self.design):
+                raise ValueError("Results store was written with different design inputs")
+        else:
+            self.header = {
+                "version": FORMAT_VERSION,
+                "rows": 0,
+                "entities": self.entity_names,
+                "design": list(self.design),
+                "winner_codes": list(WINNER_CODES),
+                "columns": [
+                    {"name": name, "dtype": dtype, "file": f"col_{i}.bin"}
+                    for i, (name, dtype) in enumerate(columns)
+                ],
+            }
+            _write_header(path, self.header)
+        self._buffers = {c["name"]: np.empty(chunk_size, dtype=c["dtype"]) for c in self.header["columns"]}
+        self._pending = 0
+        # drop any bytes past the last committed row (an interrupted flush)
+        self.truncate(self.header["rows"])
+
+    def truncate(self, rows):
+        """Discards buffered rows and every stored row from ``rows`` on."""
+        self._pending = 0
+        rows = min(rows, self.header["rows"])
+        for column in self.header["columns"]:
+            with open(os.path.join(self.path, column["file"]), "ab") as f:
+                f.truncate(rows * np.dtype(column["dtype"]).itemsize)
+        if rows != self.header["rows"]:
+            self.header["rows"] = rows
+            _write_header(self.path, self.header)
+
+    @property
+    def rows(self):
+        return self.header["rows"] + self._pending
+
+    def append(self, result):
+        """Buffers one simulate_combat result."""
+        for name, value in combat_row(result, self.entity_names).items():
+            self._buffers[name][self._pending] = value
+        for name, value in self.design.items():
+            self._buffers[DESIGN_PREFIX + name][self._pending] = value
+        self._pending += 1
+        if self._pending == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        for column in self.header["columns"]:
+            with open(os.path.join(self.path, column["file"]), "ab") as f:
+                self._buffers[column["name"]][:self._pending].tofile(f)
+        self.header["rows"] += self._pending
+        self._pending = 0
+        _write_header(self.path, self.header)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ResultsStore:
+    """Read-only, memory-mapped view of a results store."""
+
+    def __init__(self, path):
+        self.path = path
+        self.header = _read_header(path)
+        self.entities = self.header["entities"]
+        self.design = self.header.get("design", [])
+        self._columns = {c["name"]: c for c in self.header["columns"]}
+
+    def __len__(self):
+        return self.header["rows"]
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def column(self, name):
+        """The whole column as a memmap (nothing is read until it is indexed)."""
+        c = self._columns[name]
+        if not len(self):
+            return np.empty(0, dtype=c["dtype"])
+        return np.memmap(os.path.join(self.path, c["file"]), dtype=c["dtype"], mode="r", shape=(len(self),))
+
+    def iter_chunks(self, columns=None, chunk_size=CHUNK_SIZE):
+        """Yields {column: ndarray} for consecutive row ranges."""
+        names = self.columns if columns is None else list(columns)
+        maps = {name: self.column(name) for name in names}
+        for start in range(0, len(self), chunk_size):
+            yield {name: np.asarray(m[start:start + chunk_size]) for name, m in maps.items()}
+
+
+def _curve_counts(counts, values):
+    """Adds a bincount of ``values`` into the growing array ``counts``."""
+    new = np.bincount(values)
+    if len(new) > len(counts):
+        counts = np.pad(counts, (0, len(new) - len(counts)))
+    counts[:len(new)] += new
+    return counts
+
+
+def analyze_store(store, metrics=None, chunk_size=CHUNK_SIZE):
+    """Chunked equivalent of simulation.analysis.analyze_results for a store.
+
+    Only the metrics in STORE_METRICS are available, under the same keys as
+    analyze_results (the raw per-combat series used for histograms are not
+    returned).  An entity that dealt no damage in a combat is stored as 0,
+    so damage means are per combat rather than over the combats in which
+    the entity landed a hit.
+    """
+    n = len(store)
+    if n == 0:
+        return None
+    metrics = STORE_METRICS if metrics is None else frozenset(metrics) & STORE_METRICS
+    entities = store.entities
+
+    wins = 0
+    rounds_sum = 0
+    damage_sums = np.zeros(len(entities))
+    hp_sums = np.zeros(len(entities))
+    total_sum = 0.0
+    total_sq = 0.0
+    alive_counts = [np.zeros(0, dtype=np.int64) for _ in entities]
+
+    columns = ["winner", "rounds"]
+    if metrics & {DAMAGE, DAMAGE_DISTRIBUTION}:
+        columns += [f"damage_dealt_{name}" for name in entities]
+    if HP_END in metrics:
+        columns += [f"hp_end_{name}" for name in entities]
+    if SURVIVAL_CURVE in metrics:
+        columns += [f"death_round_{name}" for name in entities]
+
+    for chunk in store.iter_chunks(columns, chunk_size):
+        wins += int(np.count_nonzero(chunk["winner"] == PARTY_CODE))
+        rounds = chunk["rounds"].astype(np.int64)
+        rounds_sum += int(rounds.sum())
+        if metrics & {DAMAGE, DAMAGE_DISTRIBUTION}:
+            damage = np.stack([chunk[f"damage_dealt_{name}"] for name in entities]).astype(np.float64)
+            damage_sums += damage.sum(axis=1)
+            totals = damage.sum(axis=0)
+            total_sum += totals.sum()
+            total_sq += np.square(totals).sum()
+        if HP_END in metrics:
+            for k, name in enumerate(entities):
+                hp_sums[k] += chunk[f"hp_end_{name}"].sum(dtype=np.int64)
+        if SURVIVAL_CURVE in metrics:
+            for k, name in enumerate(entities):
+                died = chunk[f"death_round_{name}"].astype(np.int64)
+                # rounds at whose start the entity was alive
+                alive_counts[k] = _curve_counts(alive_counts[k], np.where(died > 0, died, rounds))
+
+    results = {}
+    if WIN_RATE in metrics:
+        results["Win Rate (%)"] = win_rate_with_ci(wins, n)
+    if WIN_INDICATOR in metrics:
+        p = wins / n
+        std = np.sqrt(p * (1 - p) * n / (n - 1)) * 100 if n > 1 else np.nan
+        results["win_indicator"] = {"mean": p * 100, "std": std, "n": n}
+    if ROUNDS in metrics:
+        results["rounds"] = results["avg_rounds"] = rounds_sum / n
+    if DAMAGE in metrics:
+        results["damage_dealt"] = dict(zip(entities, damage_sums / n))
+    if HP_END in metrics:
+        results["hp_end"] = dict(zip(entities, hp_sums / n))
+
+    distributions = {}
+    if DAMAGE_DISTRIBUTION in metrics:
+        mean = total_sum / n
+        var = (total_sq - n * mean ** 2) / (n - 1) if n > 1 else np.nan
+        distributions["Damage Distribution"] = {"Mean": mean, "Standard Deviation": np.sqrt(max(var, 0))}
+    if SURVIVAL_CURVE in metrics:
+        curves = {}
+        for name, counts in zip(entities, alive_counts):
+            # alive at the start of round r+1 <=> alive for more than r rounds
+            at_least = counts[::-1].cumsum()[::-1]
+            curves[name] = list(at_least[1:] / n * 100)
+        distributions["Survival Curve"] = curves
+    if metrics & {DAMAGE_DISTRIBUTION, SURVIVAL_CURVE}:
+        results["Probability Distributions"] = distributions
+    return results
@@ -0,0 +1,87 @@
+"""Content-addressed on-disk cache of scenario results for run_pipeline.
+
+Entries are keyed by simulation.checkpoint.scenario_fingerprint (entity
+stats, weapons, positions, actions, engine version and seed).  Each entry
+keeps the combats played so far as a run checkpoint, so a request for more
+combats only plays the extra ones (combat ``i`` is seeded by its index, so
+the result is the same as playing them all at once), and the aggregated
+results of every sample count already reported, so a repeated request is
+answered without simulating anything.  Only per-scenario results are
+kept: analyses over the shared combat history are recomputed by the caller.
+
+The cache holds at most ``max_entries`` scenarios; saving a new result
+evicts the least recently used ones.
+"""
+import json
+import os
+import pickle
+import shutil
+from simulation.checkpoint import STATE_FILE, scenario_fingerprint
+
+SCENARIO_CACHE = ".scenario_cache"
+MAX_ENTRIES = 32
+
+
+class ScenarioCache:
+    """Directory of cache entries, one per scenario fingerprint."""
+
+    def __init__(self, root=SCENARIO_CACHE, max_entries=MAX_ENTRIES):
+        self.root = root
+        self.max_entries = max_entries
+
+    def fingerprint(self, entities, seed):
+        return scenario_fingerprint(entities, seed)
+
+    def _entry(self, fingerprint):
+        path = os.path.join(self.root, fingerprint)
+        os.makedirs(path, exist_ok=True)
+        os.utime(path)  # marks the entry as recently used
+        return path
+
+    def entries(self):
+        """Fingerprints in the cache, least recently used first."""
+        if not os.path.isdir(self.root):
+            return []
+        names = [n for n in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, n))]
+        return sorted(names, key=lambda n: os.path.getmtime(os.path.join(self.root, n)))
+
+    def evict(self, keep=()):
+        """Removes the least recently used entries beyond max_entries (never those in ``keep``)."""
+        entries = [n for n in self.entries() if n not in keep]
+        excess = len(entries) + len(keep) - self.max_entries
+        for name in entries[:max(excess, 0)]:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def checkpoint_path(self, fingerprint):
+        """Checkpoint directory to pass to run_bulk_simulations."""
+        return os.path.join(self._entry(fingerprint), "combats")
+
+    def cached_combats(self, fingerprint):
+        """Number of combats already played for the scenario."""
+        state_path = os.path.join(self.root, fingerprint, "combats", STATE_FILE)
+        if not os.path.exists(state_path):
+            return 0
+        with open(state_path, "r") as f:
+            return json.load(f)["completed"]
+
+    def _summary_path(self, fingerprint, num_simulations):
+        return os.path.join(self._entry(fingerprint), f"summary_{num_simulations}.pkl")
+
+    def load_summary(self, fingerprint, num_simulations):
+        """Cached pipeline output for this sample count, or None."""
+        path = self._summary_path(fingerprint, num_simulations)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+
+    def save_summary(self, fingerprint, num_simulations, summary):
+        path = self._summary_path(fingerprint, num_simulations)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(summary, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self.evict(keep=(fingerprint,))
@@ -0,0 +1,320 @@
+"""Local HTTP/JSON simulation service.
+
+A small asyncio server so that other tools can ask for encounter statistics
+without going through the tkinter GUI:
+
+    POST /simulate   {"party": [...], "enemies": [...], "num_simulations": 1000, "seed": 0}
+    GET  /health
+
+Entity specs use the same fields as the GUI forms (see entities_from_payload).
+The run is split into seed ranges that are played on a process pool, and the
+response is streamed as JSON lines: one {"progress": ...} line per finished
+range, then a {"result": ...} line.  Results are cached by a canonical hash
+of the scenario, seed and sample count, so a repeated query is answered
+immediately, and identical queries in flight share one run.
+
+Run with:
+
+    python -m simulation.service --port 8765
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from characters.weapons import WEAPONS
+from simulation.distributed import finalize_summary, merge_summaries, summarize_results
+
+CHUNK_SIZE = 250
+MAX_BODY = 1 << 20
+MAX_CACHED = 32  # results kept in memory; older ones are reloaded from cache_dir
+
+
+def _weapon(spec):
+    if isinstance(spec, dict):
+        return spec
+    if spec not in WEAPONS:
+        raise ValueError(f"Unknown weapon: {spec}")
+    return WEAPONS[spec]
+
+
+def entities_from_payload(payload):
+    """Builds the party and enemies described by a request payload.
+
+    Each entity is a dict with the GUI form fields: name, ability_scores, ac,
+    initiative, speed, hp, saving_throws, proficiency_bonus, size, weapon
+    (a WEAPONS name or a weapon dict), combat_style, flying_speed,
+    resistances, immunities and optionally position [x, y, z]; party members
+    add char_class, subclass and level, enemies multiattack and
+    attack_count.  Without explicit positions, positions are drawn from the
+    request seed so that the same payload always yields the same layout.
+    """
+    from characters.party_member import PartyMember
+    from characters.enemy import Enemy
+    from mechanics.combat import assign_default_actions
+    from mechanics.position import Position, initialize_positions
+
+    def common(spec):
+        return dict(
+            ability_scores=dict(spec["ability_scores"]),
+            ac=int(spec["ac"]),
+            initiative=int(spec.get("initiative", 0)),
+            speed=int(spec.get("speed", 30)),
+            hitpoints=int(spec["hp"]),
+            saving_throws=list(spec.get("saving_throws", [])),
+            proficiency_bonus=int(spec.get("proficiency_bonus", 2)),
+            size=spec.get("size", "Medium"),
+            weapon=dict(_weapon(spec["weapon"])),
+            combat_style=spec.get("combat_style", "melee"),
+            flying_speed=int(spec.get("flying_speed", 0)),
+        )
+
+    party = [
+        PartyMember(spec["name"], spec.get("char_class", ""), spec.get("subclass", ""), int(spec.get("level", 1)),
+                    **common(spec))
+        for spec in payload["party"]
+    ]
+    enemies = [
+        Enemy(spec["name"], multiattack=bool(spec.get("multiattack", False)),
+              attack_count=int(spec.get("attack_count", 1)), **common(spec))
+        for spec in payload["enemies"]
+    ]
+    if not party or not enemies:
+        raise ValueError("A scenario needs at least one party member and one enemy")
+
+    specs = payload["party"] + payload["enemies"]
+    entities = party + enemies
+    for entity, spec in zip(entities, specs):
+        entity.resistances = set(spec.get("resistances", []))
+        entity.immunities = set(spec.get("immunities", []))
+        assign_default_actions(entity)
+        if "position" in spec:
+            entity.position = Position(*spec["position"])
+    if any(e.position is None for e in entities):
+        initialize_positions(party, enemies, seed=payload.get("seed", 0))
+    return entities
+
+
+def request_key(payload):
+    """Canonical hash of the scenario, seed and sample count of a request.
+
+    The engine version is part of it, so cached results from an older
+    engine are never served.
+    """
+    from mechanics.combat import ENGINE_VERSION
+    canonical = {
+        "engine": ENGINE_VERSION,
+        "party": payload["party"],
+        "enemies": payload["enemies"],
+        "seed": payload.get("seed", 0),
+        "num_simulations": payload["num_simulations"],
+    }
+    text = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _run_chunk(payload, start, count):
+    """Process pool task: plays combats start..start+count of the request."""
+    from simulation.bulk_runner import get_run_aggregates, run_bulk_simulations
+    entities = entities_from_payload(payload)
+    df = run_bulk_simulations(entities, count, seed=payload.get("seed", 0), start=start)
+    return summarize_results(df, [e.name for e in entities], get_run_aggregates())
+
+
+class SimulationService:
+    """Request handling, run de-duplication and the result cache."""
+
+    def __init__(self, max_workers=None, cache_dir=None, chunk_size=CHUNK_SIZE, max_cached=MAX_CACHED):
+        # workers are spawned, not forked: forking the threaded event loop
+        # process can deadlock the children
+        self.pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        self.cache_dir = cache_dir
+        self.chunk_size = chunk_size
+        self.cache = OrderedDict()  # key -> result, least recently used first
+        self.max_cached = max_cached
+        self.running = {}  # key -> list of progress queues of the clients waiting on it
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _remember(self, key, result):
+        self.cache[key] = result
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_cached:
+            self.cache.popitem(last=False)
+        return result
+
+    def _cached(self, key):
+        if key in self.cache:
+            return self._remember(key, self.cache[key])
+        if self.cache_dir:
+            path = os.path.join(self.cache_dir, f"{key}.json")
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    return self._remember(key, json.load(f))
+        return None
+
+    def _store(self, key, result):
+        self._remember(key, result)
+        if self.cache_dir:
+            tmp_path = os.path.join(self.cache_dir, f"{key}.json.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(result, f)
+            os.replace(tmp_path, os.path.join(self.cache_dir, f"{key}.json"))
+
+    async def simulate(self, payload, progress):
+        """Runs (or joins, or answers from cache) a request.
+
+        ``progress`` is an asyncio.Queue that receives progress dicts.
+        Returns (result, cached).
+        """
+        key = request_key(payload)
+        result = self._cached(key)
+        if result is not None:
+            return result, True
+        if key in self.running:
+            # identical request already running: follow its progress
+            future, listeners = self.running[key]
+            listeners.append(progress)
+            return await asyncio.shield(future), False
+
+        future = asyncio.get_running_loop().create_future()
+        listeners = [progress]
+        self.running[key] = (future, listeners)
+        try:
+            result = await self._run(payload, listeners)
+            self._store(key, result)
+            future.set_result(result)
+            return result, False
+        except Exception as exc:
+            future.set_exception(exc)
+            # make sure the exception is retrieved even without followers
+            future.exception()
+            raise
+        finally:
+            del self.running[key]
+
+    async def _run(self, payload, listeners):
+        # validate in this process first, so bad payloads fail fast
+        entities_from_payload(payload)
+        total = int(payload["num_simulations"])
+        if total <= 0:
+            raise ValueError("num_simulations must be positive")
+        loop = asyncio.get_running_loop()
+        tasks = [
+            loop.run_in_executor(self.pool, _run_chunk, payload, start, min(self.chunk_size, total - start))
+            for start in range(0, total, self.chunk_size)
+        ]
+        summary = None
+        for task in asyncio.as_completed(tasks):
+            summary = merge_summaries(summary, await task)
+            for queue in listeners:
+                queue.put_nowait({"progress": summary["combats"], "total": total})
+        # plain JSON types, so cached and fresh answers are identical
+        return json.loads(json.dumps(finalize_summary(summary), default=float))
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+async def _read_request(reader):
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    if not request_line:
+        return None, None, None
+    method, path, _ = request_line.split(" ", 2)
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY:
+        raise ValueError("Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, path, body
+
+
+def _head(status, content_type="application/json"):
+    return (f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            "Cache-Control: no-store\r\nConnection: close\r\n\r\n").encode()
+
+
+def _line(data):
+    return (json.dumps(data) + "\n").encode()
+
+
+async def handle_connection(service, reader, writer):
+    """Serves one HTTP request; /simulate streams JSON lines until done."""
+    try:
+        try:
+            method, path, body = await _read_request(reader)
+        except (ValueError, asyncio.IncompleteReadError) as exc:
+            writer.write(_head("400 Bad Request") + _line({"error": str(exc)}))
+            return
+        if method is None:
+            return
+        if method == "GET" and path == "/health":
+            writer.write(_head("200 OK") + _line({"status": "ok", "running": len(service.running)}))
+            return
+        if method != "POST" or path != "/simulate":
+            writer.write(_head("404 Not Found") + _line({"error": f"No route for {method} {path}"}))
+            return
+        try:
+            payload = json.loads(body)
+            request_key(payload)
+        except (ValueError, KeyError, TypeError) as exc:
+            writer.write(_head("400 Bad Request") + _line({"error": f"Invalid payload: {exc}"}))
+            return
+
+        writer.write(_head("200 OK", "application/x-ndjson"))
+        progress = asyncio.Queue()
+        run = asyncio.ensure_future(service.simulate(payload, progress))
+        while not run.done():
+            getter = asyncio.ensure_future(progress.get())
+            await asyncio.wait({run, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                writer.write(_line(getter.result()))
+                await writer.drain()
+            else:
+                getter.cancel()
+        while not progress.empty():
+            writer.write(_line(progress.get_nowait()))
+        try:
+            result, cached = run.result()
+            writer.write(_line({"result": result, "cached": cached}))
+        except Exception as exc:
+            # the status line is already sent; report the failure in the stream
+            writer.write(_line({"error": str(exc)}))
+    finally:
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+
+async def serve(host="127.0.0.1", port=8765, max_workers=None, cache_dir=None, ready=None):
+    """Runs the service until cancelled.  ``ready`` (a callback) receives the bound port."""
+    service = SimulationService(max_workers=max_workers, cache_dir=cache_dir)
+    server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), host, port)
+    if ready is not None:
+        ready(server.sockets[0].getsockname()[1])
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local combat simulation service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache-dir", default=".service_cache")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.workers, args.cache_dir))
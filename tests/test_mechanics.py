@@ -75,3 +75,422 @@ def test_falling_damage_applied():
     p.position = Position(0,0,50)
     execute_turn(p, [p, e], stats)
     assert p.hitpoints_current < p.hitpoints_maximum
+
+
+def test_action_table_masks_actions_without_target():
+    from mechanics.actions import ActionTable, NEEDS_TARGET
+    p, _ = make_simple_pair()
+    table = ActionTable(p.actions)
+    for _ in range(200):
+        assert table.pick(0)["name"] != "Attack"
+    assert any(table.pick(NEEDS_TARGET)["name"] == "Attack" for _ in range(200))
+
+
+def test_bonus_action_dispatched_from_table():
+    p, e = make_simple_pair()
+    calls = []
+    p.actions.append({"name": "Second Wind", "mechanic": lambda c: calls.append(c.name), "weight": 1, "type": "bonus"})
+    stats = make_stats()
+    stats["turns_survived"][p.name] = 0
+    execute_turn(p, [p, e], stats)
+    assert calls == ["P"]
+    assert stats["actions_used"]["P"]["Second Wind"] == 1
+
+
+def test_battle_map_paths_around_wall_and_shares_fields():
+    import random
+    from copy import deepcopy
+    from mechanics.battle_map import BattleMap, assign_battle_map
+    p, e = make_simple_pair()
+    p2 = deepcopy(p)
+    p2.name = "P2"
+    p.position = Position(0, 0, 0)
+    p2.position = Position(0, 10, 0)
+    e.position = Position(30, 0, 0)
+    e.hitpoints_current = e.hitpoints_maximum = 500
+    # wall at x=15 ft with a gap at the far end of the map
+    battle_map = BattleMap(8, 8, obstacles=[(3, y) for y in range(7)])
+    assign_battle_map([p, p2, e], battle_map)
+    assert deepcopy(p).battle_map is battle_map
+
+    stats = make_stats()
+    for entity in (p, p2, e):
+        stats["turns_survived"][entity.name] = 0
+    p.speed = p2.speed = 30
+    random.seed(39)
+    field = battle_map.distance_field(battle_map.cell_of(e.position))
+    starts = [battle_map.cell_of(p.position), battle_map.cell_of(p2.position)]
+    execute_turn(p, [p, p2, e], stats)
+    execute_turn(p2, [p, p2, e], stats)
+    # both walked a full 30 ft of the shortest path round the wall, sharing one field
+    for mover, start in zip((p, p2), starts):
+        cell = battle_map.cell_of(mover.position)
+        assert battle_map.is_passable(cell)
+        assert field[cell] == field[start] - 30
+    assert battle_map.cell_of(p.position)[0] < 3
+    assert battle_map.fields_computed == 1
+    assert battle_map.cell_of(p.position) != battle_map.cell_of(p2.position)
+
+
+def test_fireball_hits_every_foe_in_best_sphere():
+    import random
+    from copy import deepcopy
+    from mechanics.spells import get_spell_area, get_spell, cast_spell
+    assert get_spell_area(get_spell("Fireball")) == {"shape": "sphere", "size": 20, "origin": "point"}
+    assert get_spell_area(get_spell("Cone of Cold"))["origin"] == "self"
+    random.seed(3)
+    wizard, _ = make_simple_pair()
+    wizard.char_class = "Wizard"
+    wizard.spellcasting_ability = "INT"
+    wizard.ability_scores["INT"] = 18
+    wizard.spell_slots = [4, 3, 2]
+    ally = deepcopy(wizard)
+    ally.name = "Ally"
+    ally.position = Position(110, 0, 0)
+    foes = []
+    for i, x in enumerate((100, 110, 120, 200)):
+        _, e = make_simple_pair()
+        e.name = f"E{i}"
+        e.hitpoints_current = e.hitpoints_maximum = 500
+        e.position = Position(x, 30, 0)
+        foes.append(e)
+    wizard.position = Position(0, 0, 0)
+    stats = make_stats()
+    stats.update(spells_cast={}, spell_effectiveness=[], damage_this_round=0, combatants=[wizard, ally] + foes)
+    assert cast_spell(wizard, "Fireball", foes[0], stats)
+    # the sphere is centred among the cluster, away from the ally and the straggler
+    assert [e.hitpoints_current < 500 for e in foes] == [True, True, True, False]
+    assert ally.hitpoints_current == ally.hitpoints_maximum
+    assert stats["spell_effectiveness"][-1]["targets"] == 3
+    assert wizard.spell_slots == [4, 3, 1]
+
+    # with the ally next to the only foe in reach, no Fireball placement is worth
+    # it; the Magic action falls back to a single-target spell instead
+    from mechanics.combat import magic
+    from mechanics.spellbook import damage_policy, get_spellbook
+    wizard.known_spells = ["Fireball", "Fire Bolt"]
+    foes[3].position = Position(100, 0, 0)
+    ally.position = Position(100, 5, 0)
+    get_spellbook(wizard).policy = damage_policy
+    assert get_spellbook(wizard).pick(wizard, foes[3]).name == "Fireball"
+    stats["combatants"] = [wizard, ally, foes[3]]
+    magic(wizard, foes[3], stats)
+    assert stats["spells_cast"][wizard.name] == {"Fireball": 1, "Fire Bolt": 1}
+    assert wizard.spell_slots == [4, 3, 1] and ally.hitpoints_current == ally.hitpoints_maximum
+
+
+def test_spellbook_only_offers_castable_spells():
+    import pytest
+    from mechanics.spellbook import get_spellbook
+    from mechanics.spells import cast_spell
+    w = PartyMember("W", "Wizard", "", 5, {"DEX": 14, "INT": 18}, 12, 2, 30, 28, ["INT"], 3,
+                    weapon={"damage_dice": "1d6", "modifier": "DEX", "damage_type": "piercing", "range": 80},
+                    combat_style="ranged")
+    _, e = make_simple_pair()
+    e.hitpoints_current = e.hitpoints_maximum = 500
+    assign_default_actions(w)
+    w.position = Position(0, 0, 0)
+    e.position = Position(130, 0, 0)
+    book = get_spellbook(w)
+    # healing spells are never offered against a foe; only Fireball reaches 130 ft
+    assert "Cure Wounds" in w.known_spells
+    assert [s.name for s in book.castable(w, e)] == ["Fireball"]
+    e.position = Position(110, 0, 0)
+    book.policy = lambda candidates, caster, target: candidates[0]
+    assert book.pick(w, e).name == "Fireball"
+    stats = make_stats()
+    stats.update(spells_cast={}, spell_effectiveness=[], damage_this_round=0)
+    for _ in range(2):
+        assert cast_spell(w, "Fireball", e, stats)
+    # 3rd-level slots are gone: the set shrinks without being rebuilt
+    assert w.spell_slots[2] == 0 and book is get_spellbook(w)
+    assert "Fireball" not in [s.name for s in book.castable(w, e)]
+    assert "Fire Bolt" in [s.name for s in book.castable(w, e)]
+    w.spell_slots = [4, 3, 2]  # a long rest replaces the slot list
+    assert "Fireball" in [s.name for s in get_spellbook(w).castable(w, e)]
+    # learning a spell in place rebuilds the book; unknown policies are refused
+    w.known_spells.append("Hold Person")
+    assert get_spellbook(w) is not book
+    e.position = Position(50, 0, 0)
+    assert "Hold Person" in [s.name for s in get_spellbook(w).castable(w, e)]
+    w.spell_policy = "smartest"
+    w.known_spells.append("Entangle")
+    with pytest.raises(ValueError):
+        get_spellbook(w)
+
+
+def test_spell_programs_compile_from_structured_fields():
+    from mechanics.spells import get_spell_program, cast_spell
+    fireball = get_spell_program("Fireball")
+    assert (fireball.kind, fireball.resolution, fireball.save_ability) == ("damage", "save", "DEX")
+    assert fireball.damage_type == "fire" and fireball.half_on_save
+    assert fireball.dice_for(3) == (8, 6, 0) and fireball.dice_for(5) == (10, 6, 0)
+    assert get_spell_program("Fire Bolt").dice_for(caster_level=5) == (2, 10, 0)
+    assert get_spell_program("Hold Person").conditions == ["paralyzed"]
+    assert get_spell_program("Cure Wounds").kind == "healing"
+    # the spell dict helpers reuse the cached programs
+    import mechanics.spells as spells
+    compile_spell, spells.compile_spell = spells.compile_spell, None
+    try:
+        assert spells.get_spell_damage(spells.get_spell("Fireball"), 5)["dice"] == "8d6"
+        assert spells.is_healing_spell(spells.get_spell("Cure Wounds"))
+        assert spells.get_healing_amount(spells.get_spell("Cure Wounds")) > 0
+    finally:
+        spells.compile_spell = compile_spell
+
+    # healing runs on the engine's hit point attributes; the only 1st-level
+    # slots are gone, so the spell is upcast with a 2nd-level slot
+    cleric, ally = make_simple_pair()
+    cleric.spellcasting_ability = "WIS"
+    cleric.ability_scores["WIS"] = 16
+    cleric.spell_slots = [0, 1]
+    ally = PartyMember("A", "F", "", 1, {"STR": 10}, 10, 1, 10, 40, [], 2, [], [], "Medium", cleric.weapon, "melee")
+    ally.position = Position(5, 0, 0)
+    ally.hitpoints_current = 1
+    stats = make_stats()
+    stats.update(spells_cast={}, spell_effectiveness=[])
+    assert cast_spell(cleric, "Cure Wounds", ally, stats)
+    assert cleric.spell_slots == [0, 0]
+    assert 1 + 2 + 3 <= ally.hitpoints_current <= 1 + 16 + 3
+    assert stats["spell_effectiveness"][-1]["effect_type"] == "healing"
+
+
+def test_bitmask_conditions_and_resistances_affect_combat():
+    import random
+    from mechanics.combat import attack, mitigate_damage
+    p, e = make_simple_pair()
+    e.resistances = ["FIRE"]  # as typed in the GUI
+    e.immunities = {"poison"}
+    assert "fire" in e.resistances and e.resistances.mask
+    assert mitigate_damage(e, 10, "fire") == 5 and mitigate_damage(e, 10, "poison") == 0
+    assert mitigate_damage(e, 10, "cold") == 10
+
+    # a paralyzed creature skips its turn and melee hits against it are crits
+    e.conditions.add("paralyzed")
+    e.condition_saves["paralyzed"] = ("WIS", 30)
+    e.position = Position(5, 0, 0)
+    e.hitpoints_current = e.hitpoints_maximum = 500
+    stats = make_stats()
+    stats["turns_survived"][e.name] = 0
+    execute_turn(e, [p, e], stats)
+    assert e.position.x == 5 and e.name not in stats["actions_used"]
+    assert "paralyzed" in e.conditions  # DC 30 is never saved
+    e.ac = 0  # every attack hits, so every attack is a crit
+    for _ in range(5):
+        attack(p, e, stats)
+    assert stats["crit_count"][p.name] == stats["attack_count"][p.name] == 5
+
+    e.condition_saves["paralyzed"] = ("WIS", -100)
+    execute_turn(e, [p, e], stats)
+    assert "paralyzed" not in e.conditions and not e.condition_saves
+
+    # a landed Hold Person paralyzes through the spell program
+    from mechanics.spells import cast_spell
+    random.seed(43)
+    p.spellcasting_ability = "WIS"
+    p.ability_scores["WIS"] = 20
+    p.spell_slots = [0, 4]
+    stats.update(spells_cast={}, spell_effectiveness=[])
+    while "paralyzed" not in e.conditions and p.spell_slots[1]:
+        cast_spell(p, "Hold Person", e, stats)
+    assert "paralyzed" in e.conditions and e.condition_saves["paralyzed"][0] == "WIS"
+    assert stats["spell_effectiveness"][-1]["effect_type"] == "condition"
+
+
+def test_scheduler_orders_turns_effects_legendary_and_lair_actions():
+    from mechanics.combat import dodge, simulate_combat
+    from mechanics.scheduler import CombatScheduler
+    p, e = make_simple_pair()
+    e.legendary_actions = 1
+    e.lair_action = lambda creature, entities, stats: None
+    scheduler = CombatScheduler([p, e], initiatives={"P": 5, "E": 15})
+    log = []
+    for kind, creature, data in scheduler.events():
+        log.append((scheduler.round, kind, creature.name if creature else None, data))
+        if kind == "turn" and creature is p and scheduler.round == 1:
+            dodge(p)
+            dodge(p)  # renewing an effect does not stack it
+            assert p.defense_advantage == -1
+        if kind == "turn" and creature is e and scheduler.round == 2:
+            scheduler.join(Enemy("Late", {}, 10, 0, 5, 5, [], 1), initiative=10)  # still acts this round
+            scheduler.join(Enemy("Later", {}, 10, 0, 5, 5, [], 1), initiative=18)  # its count has passed
+        if kind == "round_end" and scheduler.round == 2:
+            break
+    assert log[:6] == [(1, "round_start", None, None), (1, "lair", "E", None), (1, "turn", "E", None),
+                       (1, "turn", "P", None), (1, "legendary", "E", None), (1, "round_end", None, None)]
+    # the Dodge ends at the start of P's next turn, the newcomers slot in by count
+    round_two = [(kind, name) for r, kind, name, _ in log if r == 2 and kind in ("turn", "expire")]
+    assert round_two == [("turn", "E"), ("turn", "Late"), ("expire", "P"), ("turn", "P")]
+
+    p.hitpoints_current = p.hitpoints_maximum = 500
+    e.hitpoints_current = e.hitpoints_maximum = 500
+    p.scheduler = e.scheduler = None
+    p.dicoTemporalite.clear()
+    p.position = Position(5, 0, 0)
+    e.ability_scores["DEX"] = 10
+    stats = make_stats()
+    stats.update(turns_survived={"P": 0, "E": 0}, turns_no_damage=0, hp_end={})
+    result = simulate_combat([p, e], stats, max_rounds=3)
+    assert result["winner"] == "draw" and sorted(result["initiative_order"].values()) == [0, 1]
+    assert result["actions_used"]["E"]["Legendary Action"] == 3  # one after each of P's turns
+    assert p.scheduler is None and e.scheduler is None
+
+
+def test_reaction_index_finds_opportunity_attacks_and_reaction_spells():
+    from mechanics.combat import end_effect, process_reactions
+    from mechanics.reactions import react_to_hit
+    from mechanics.scheduler import CombatScheduler
+    from mechanics.spells import cast_spell
+    w = PartyMember("W", "Wizard", "", 5, {"DEX": 14, "INT": 18}, 12, 2, 30, 28, ["INT"], 3,
+                    weapon={"damage_dice": "1d6", "modifier": "DEX", "damage_type": "piercing", "range": 80},
+                    combat_style="ranged")
+    assign_default_actions(w)
+    assert "Shield" in w.reactions and "Counterspell" in w.reactions  # reaction spells from the spell data
+    p, e = make_simple_pair()
+    e.ability_scores["DEX"] = 10
+    far = Enemy("Far", {"STR": 8}, 10, 1, 5, 5, [], 1, weapon=dict(e.weapon))
+    mage = Enemy("Mage", {"INT": 16}, 10, 1, 5, 5, [], 1, weapon=dict(e.weapon), combat_style="ranged")
+    mage.spell_slots = [4, 3, 3]
+    mage.spellcasting_ability = "INT"
+    for creature, x in ((w, 0), (p, 5), (e, 10), (far, 100), (mage, 50)):
+        creature.position = Position(x, 0, 0)
+    scheduler = CombatScheduler([w, p, e, far, mage])
+    index = scheduler.reactions
+    assert index.threatening(Position(5, 0, 0)) == [p, e]
+
+    # only the foe whose reach P left is considered; the entity list is not scanned
+    stats = make_stats()
+    stats.update(spells_cast={}, spell_effectiveness=[], damage_this_round=0)
+    p.position = Position(-20, 0, 0)
+    index.moved(p)
+    process_reactions(p, [], stats, Position(5, 0, 0))
+    assert stats["reactions_used"] == {"E": {"Opportunity Attack": 1}}
+    e.has_used_reaction = False
+    p.can_be_opportunity_attacked = False  # Disengaged
+    process_reactions(p, [], stats, Position(5, 0, 0))
+    assert stats["reactions_used"]["E"]["Opportunity Attack"] == 1
+
+    # without a scheduler the entity list is scanned; ranged foes neither attack
+    # nor spend their reaction on it
+    p2, e2 = make_simple_pair()
+    e2.position = Position(5, 0, 0)
+    e2.ability_scores["DEX"] = 10
+    e2.combat_style = "ranged"
+    p2.position = Position(40, 0, 0)
+    unscheduled = make_stats()
+    process_reactions(p2, [p2, e2], unscheduled, Position(0, 0, 0))
+    assert not unscheduled["reactions_used"] and not e2.has_used_reaction
+    e2.combat_style = "melee"
+    process_reactions(p2, [p2, e2], unscheduled, Position(0, 0, 0))
+    assert unscheduled["reactions_used"] == {"E": {"Opportunity Attack": 1}}
+
+    # Counterspell stops a 3rd-level spell outright
+    assert cast_spell(mage, "Fireball", w, stats)
+    assert w.hitpoints_current == w.hitpoints_maximum and w.spell_slots[2] == 1
+    assert stats["reactions_used"]["W"] == {"Counterspell": 1} and not stats["spells_cast"]
+
+    # Shield turns a hit by 1 into a miss until the start of W's next turn
+    w.has_used_reaction = False
+    assert react_to_hit(w, e, 13, stats) and w.ac == 17 and w.spell_slots[0] == 3
+    expiry = next((c, data) for kind, c, data in scheduler.events() if kind == "expire")
+    assert expiry == (w, "shield")
+    end_effect(w, "shield")
+    assert w.ac == 12
+
+
+def test_attack_matrix_reuses_entries_until_state_changes():
+    from copy import deepcopy
+    from mechanics.attack_matrix import HALF, get_attack_row
+    from mechanics.combat import attack, resolve_attack_roll
+    p, e = make_simple_pair()
+    e.position = Position(5, 0, 0)
+    e.hitpoints_current = e.hitpoints_maximum = 10 ** 6
+    row = get_attack_row(p)
+    assert get_attack_row(deepcopy(p)) is row  # shared by the copies of a run
+    rearmed = deepcopy(p)
+    rearmed.weapon = dict(rearmed.weapon, damage_dice="2d12")
+    assert (get_attack_row(rearmed).num_dice, get_attack_row(rearmed).die) == (2, 12)
+    rearmed.ability_scores["STR"] = 20
+    assert get_attack_row(rearmed).bonus(rearmed) == 5 + p.proficiency_bonus and get_attack_row(p) is row
+    stats = make_stats()
+    stats["damage_this_round"] = 0
+    for _ in range(20):
+        attack(p, e, stats)
+    assert row.entries_built == 1 and row.entry(p, e, True).threshold == 8  # AC 10 - (0 + 2)
+
+    e.ac = 15
+    e.resistances.add("bludgeoning")
+    entry = row.entry(p, e, True)
+    assert (entry.threshold, entry.multiplier, entry.mitigate(7)) == (13, HALF, 3) and row.entries_built == 2
+    e.conditions.add("paralyzed")
+    entry = row.entry(p, e, True)
+    assert entry.autocrit and entry.advantage == 1 and not row.entry(p, e, False).autocrit
+    # natural 20s always hit and crit, natural 1s always miss
+    assert resolve_attack_roll(20, -10, e) == (True, True) and resolve_attack_roll(1, 50, e) == (False, False)
+
+
+def test_troop_attacks_in_bulk_and_takes_area_casualties():
+    import random
+    from copy import deepcopy
+    from characters.troop import Troop
+    from mechanics.attack_matrix import get_attack_row
+    from mechanics.combat import attack_damage_distribution, execute_turn, simulate_combat
+    from mechanics.mass_combat import area_members, hit_probabilities
+    from mechanics.spells import cast_spell
+    random.seed(5)
+    spear = {"damage_dice": "1d6", "modifier": "STR", "damage_type": "piercing", "range": 5}
+    goblins = Troop("Goblins", 200, {"STR": 10, "DEX": 14}, 13, 2, 30, 7, [], 2, weapon=spear)
+    assign_default_actions(goblins)
+    assert goblins.hitpoints_maximum == 1400 and goblins.members == 200
+    heroes = []
+    for i in range(2):
+        hero, _ = make_simple_pair()
+        hero.name = f"H{i}"
+        hero.hitpoints_current = hero.hitpoints_maximum = 10 ** 6
+        hero.position = Position(0, 5 * i, 0)
+        heroes.append(hero)
+    goblins.position = Position(10, 0, 0)
+
+    # the single-attack odds and a volley's draw come from the same matrix entry
+    crit, hit, miss = hit_probabilities(get_attack_row(goblins).entry(goblins, heroes[0], True))
+    assert abs(crit + hit - (1 - attack_damage_distribution(goblins, heroes[0], 0)[0])) < 1e-12
+
+    stats = make_stats()
+    stats.update(turns_survived={"Goblins": 0}, damage_this_round=0)
+    execute_turn(goblins, heroes + [goblins], stats)
+    # 8 goblins engage each hero; the other 184 cannot reach
+    assert stats["attack_count"]["Goblins"] == 16
+    assert 0 < sum(stats["damage_dealt"].values()) <= 16 * 12
+
+    wizard = PartyMember("W", "Wizard", "", 5, {"DEX": 14, "INT": 18}, 12, 2, 30, 28, ["INT"], 3,
+                         weapon={"damage_dice": "1d6", "modifier": "DEX", "damage_type": "piercing", "range": 80},
+                         combat_style="ranged")
+    wizard.position = Position(40, 0, 0)
+    goblins.position = Position(100, 0, 0)  # away from the heroes
+    stats.update(spells_cast={}, spell_effectiveness=[], combatants=[wizard, goblins])
+    caught = area_members(goblins, {"shape": "sphere", "size": 20, "origin": "point"})
+    assert cast_spell(wizard, "Fireball", goblins, stats)
+    # one Fireball takes out dozens of 7-HP goblins, but no more than it catches
+    assert 200 - caught <= goblins.members < 200 - 20
+
+    # a single big hit kills the member it lands on and no more
+    from mechanics.combat import attack
+    brute = deepcopy(heroes[0])
+    brute.weapon = dict(brute.weapon, damage_dice="10d12")
+    goblins.ac = 0
+    goblins.hitpoints_current -= 3  # the front goblin is already wounded
+    for _ in range(5):
+        members, hits = goblins.members, stats["damage_dealt"].get(brute.name, 0)
+        attack(brute, goblins, stats, num_attacks=1)
+        assert goblins.members >= members - 1
+        if stats["damage_dealt"].get(brute.name, 0) > hits:
+            assert goblins.members == members - 1 and goblins.hitpoints_current % 7 == 0
+
+    stats = {"damage_dealt": {}, "attack_count": {}, "crit_count": {}, "total_crits": 0, "actions_used": {},
+             "reactions_used": {}, "spells_cast": {}, "spell_effectiveness": [], "initiative_order": {},
+             "turns_survived": {"H0": 0, "H1": 0, "Goblins": 0}, "rounds": 0, "turns_no_damage": 0, "hp_end": {}}
+    for hero in heroes:
+        hero.hitpoints_current = hero.hitpoints_maximum = 30
+    goblins.position = Position(10, 0, 0)
+    result = simulate_combat(heroes + [goblins], stats)
+    assert result["winner"] == "enemies" and result["hp_end"]["Goblins"] > 0
@@ -0,0 +1,512 @@
+from copy import deepcopy
+
+import pandas as pd
+import pytest
+
+from simulation.analysis import analyze_results, ColumnIndex, DAMAGE, ACTIONS, WIN_RATE
+from simulation.bulk_runner import compute_damage_statistics
+
+
+def make_results():
+    return pd.DataFrame({
+        "winner": ["party", "enemies", "party", "party"],
+        "rounds": [3, 5, 4, 2],
+        "damage_dealt_Orc_Chief": [4, 10, 0, 2],
+        "damage_dealt_Hero": [12, 3, 9, 7],
+        "turns_survived_Orc_Chief": [2, 5, 3, 1],
+        "turns_survived_Hero": [3, 5, 4, 2],
+        "actions_used_Orc_Chief_Attack": [2, 4, 3, 1],
+        "actions_used_Hero_Dodge": [1, 0, 0, 1],
+    })
+
+
+def test_column_index_splits_entity_names_with_underscores():
+    index = ColumnIndex(make_results().columns)
+    assert index.family("actions_used_")["Orc_Chief"] == {"Attack": "actions_used_Orc_Chief_Attack"}
+
+
+def test_analyze_results_matches_legacy_helpers_and_skips_unrequested():
+    df = make_results()
+    results = analyze_results(df, [DAMAGE, ACTIONS, WIN_RATE])
+    assert results["damage_dealt"] == compute_damage_statistics(df)
+    assert results["actions_used"]["Orc_Chief"]["Attack"] == 2.5
+    assert results["Win Rate (%)"][0] == 75
+    assert "hp_end" not in results and "regression_features" not in results
+
+
+def write_text(text, output_path, options=None):
+    with open(output_path, "a") as f:
+        f.write(text)
+
+
+def test_render_artifacts_reuses_unchanged_outputs(tmp_path):
+    from utils.report_jobs import ArtifactJob, render_artifacts
+    fig, report = str(tmp_path / "fig.txt"), str(tmp_path / "report.txt")
+    cache = str(tmp_path / "cache.json")
+
+    def jobs(text):
+        return [
+            ArtifactJob(report, write_text, {"text": "report", "output_path": report}, depends_on=[fig]),
+            ArtifactJob(fig, write_text, {"text": text, "output_path": fig}),
+        ]
+
+    first = render_artifacts(jobs("a"), max_workers=0, cache_path=cache)
+    assert first["rendered"] == [fig, report]
+    assert render_artifacts(jobs("a"), max_workers=0, cache_path=cache)["reused"] == [fig, report]
+    # a changed figure also invalidates the report that embeds it
+    assert render_artifacts(jobs("b"), max_workers=0, cache_path=cache)["rendered"] == [fig, report]
+
+    # equal arguments hash alike whatever their order; embedded files that are
+    # not jobs count by their contents, not their path
+    logo = tmp_path / "logo.txt"
+    logo.write_text("v1")
+
+    def page(options):
+        return [ArtifactJob(report, write_text, {"text": "report", "output_path": report, "options": options},
+                            depends_on=[str(logo)])]
+
+    assert render_artifacts(page({"a": 0.1, "b": [1, 2]}), max_workers=0, cache_path=cache)["rendered"] == [report]
+    assert render_artifacts(page({"b": [1, 2], "a": 0.1}), max_workers=0, cache_path=cache)["reused"] == [report]
+    logo.write_text("v2")
+    assert render_artifacts(page({"a": 0.1, "b": [1, 2]}), max_workers=0, cache_path=cache)["rendered"] == [report]
+
+
+def make_duel(party_ac=10):
+    from characters.party_member import PartyMember
+    from characters.enemy import Enemy
+    from mechanics.combat import assign_default_actions
+    from mechanics.position import Position
+    weapon = {"damage_dice": "1d4", "modifier": "STR", "damage_type": "slashing", "range": 5}
+    # 3 HP creatures never drop below the flee threshold, so every duel ends
+    p = PartyMember("P", "F", "", 1, {"STR": 12}, party_ac, 1, 30, 3, [], 2, [], [], "Medium", weapon, "melee")
+    e = Enemy("E", {"STR": 12}, 12, 1, 30, 3, [], 2, [], [], "Medium", dict(weapon), "melee")
+    for c, x in ((p, 0), (e, 5)):
+        assign_default_actions(c)
+        c.position = Position(x, 0, 0)
+    return [p, e]
+
+
+def test_common_random_numbers_cancel_for_identical_variants():
+    from simulation.comparison import compare_scenarios
+    table = compare_scenarios({"a": make_duel(), "b": make_duel()}, 40, antithetic=True)
+    assert (table["difference"] == 0).all()
+    better = compare_scenarios({"a": make_duel(), "ac": make_duel(party_ac=18)}, 60)
+    win = better[better["metric"] == "party_win"].iloc[0]
+    assert win["difference"] > 0 and win["variance_reduction"] > 1
+
+    # a variant deep-copied from the base and then re-armed rolls its own weapon
+    base = make_duel()
+    variant = deepcopy(base)
+    variant[0].weapon = dict(variant[0].weapon, damage_dice="2d12")
+    armed = compare_scenarios({"base": base, "2d12": variant}, 40)
+    assert armed[armed["metric"] == "party_win"].iloc[0]["difference"] > 0
+
+
+def test_markov_solver_matches_monte_carlo():
+    from simulation.markov import solve_encounter
+    from simulation.bulk_runner import run_bulk_simulations
+    exact = solve_encounter(make_duel())
+    assert abs(exact["party_win_probability"] + exact["enemy_win_probability"] - 1) < 1e-9
+    n = 600
+    df = run_bulk_simulations(make_duel(), n, seed=3)
+    p = exact["party_win_probability"]
+    assert abs((df["winner"] == "party").mean() - p) < 4 * (p * (1 - p) / n) ** 0.5
+
+
+def test_adventuring_day_carries_state_and_shares_prefixes():
+    from simulation.adventuring_day import run_adventuring_day, summarize_days, long_rest, snapshot_party
+    party, enemy = make_duel()
+    encounters = [[enemy], [deepcopy(enemy)], [deepcopy(enemy)]]
+    days = run_adventuring_day([party], encounters, num_days=10, branching=(3, 2), rests=(None, "long"), seed=1)
+    assert abs(days["weight"].sum() - 1) < 1e-9
+    assert days.attrs["combats"] < 60 * 3
+    summary = summarize_days(days)
+    assert 0 <= summary["survival_probability"] <= 1
+    assert (days.loc[~days["survived"], "hp_end_P"] == 0).all()
+
+    party.hitpoints_current = 1
+    assert long_rest([party], snapshot_party([party]))[0][0] == party.hitpoints_maximum
+
+
+def test_build_optimizer_spends_budget_on_contenders():
+    from simulation.optimizer import build_grid, optimize_builds
+    party, enemy = make_duel()
+    weapons = {
+        "Blowgun": {"damage_dice": "1d1", "modifier": "STR", "damage_type": "piercing", "range": 5},
+        "Greataxe": {"damage_dice": "1d12", "modifier": "STR", "damage_type": "slashing", "range": 5},
+        "Maul": {"damage_dice": "2d6", "modifier": "STR", "damage_type": "bludgeoning", "range": 5},
+    }
+    table = optimize_builds(build_grid(party, weapons=weapons), [party], [enemy], budget=600, initial=30)
+    assert table.iloc[-1]["build"] == "Blowgun"
+    assert table.iloc[-1]["combats"] < table.iloc[0]["combats"]
+    assert table.attrs["combats"] <= 600
+
+
+def test_calibration_brackets_target_win_rate():
+    from simulation.calibration import calibrate_encounter
+    party, enemy = make_duel()
+    result = calibrate_encounter([party], [enemy], target=50, knob="hitpoints", low=1, high=12,
+                                 tolerance=8, batch=60, max_combats=2000)
+    rates = result["probes"]
+    assert result["combats"] <= 2000
+    assert result["enemies"][0].hitpoints_maximum == result["value"]
+    assert abs(result["win_rate"] - 50) == min(abs(rate - 50) for rate, _ in rates.values())
+    # monotone knob: more enemy HP never helps the party by much
+    assert rates[min(rates)][0] >= rates[max(rates)][0]
+
+
+def test_results_store_aggregates_match_dataframe(tmp_path):
+    from simulation.analysis import ROUNDS, HP_END, SURVIVAL_CURVE, DAMAGE_DISTRIBUTION, WIN_INDICATOR
+    from simulation.bulk_runner import run_bulk_simulations
+    from simulation.results_store import analyze_store
+    metrics = [WIN_RATE, WIN_INDICATOR, ROUNDS, DAMAGE, HP_END, SURVIVAL_CURVE, DAMAGE_DISTRIBUTION]
+    df = run_bulk_simulations(make_duel(), 50, seed=5).fillna({"damage_dealt_P": 0, "damage_dealt_E": 0})
+    store = run_bulk_simulations(make_duel(), 50, seed=5, store_path=str(tmp_path / "store"))
+    assert len(store) == 50
+    expected = analyze_results(df, metrics)
+    actual = analyze_store(store, metrics, chunk_size=7)
+    assert actual["Win Rate (%)"][0] == expected["Win Rate (%)"][0]
+    assert abs(actual["win_indicator"]["std"] - expected["win_indicator"]["std"]) < 1e-9
+    assert actual["rounds"] == expected["rounds"]
+    assert actual["damage_dealt"] == expected["damage_dealt"]
+    assert actual["hp_end"] == expected["hp_end"]
+    curves = actual["Probability Distributions"]["Survival Curve"]
+    assert curves == expected["Probability Distributions"]["Survival Curve"]
+    dist, expected_dist = (r["Probability Distributions"]["Damage Distribution"] for r in (actual, expected))
+    assert abs(dist["Standard Deviation"] - expected_dist["Standard Deviation"]) < 1e-9
+
+
+def test_design_regression_matches_in_memory_logit(tmp_path):
+    import numpy as np
+    import statsmodels.api as sm
+    from simulation.bulk_runner import run_bulk_simulations
+    from simulation.results_store import ResultsStore
+    from utils.regressionanalysis import DesignRegression
+    path = str(tmp_path / "design")
+    for ac in (8, 12, 16, 20):
+        run_bulk_simulations(make_duel(party_ac=ac), 60, seed=ac, store_path=path)
+    store = ResultsStore(path)
+    assert len(store) == 240 and "party_ac" in store.design
+
+    regression = DesignRegression(path, chunk_size=37)
+    fit = regression.fit()
+    assert fit["converged"] and fit["dropped"] == [f for f in store.design if f != "party_ac"]
+    y = (np.asarray(store.column("winner")) == 1).astype(float)
+    x = sm.add_constant(np.asarray(store.column("design_party_ac"), dtype=float))
+    expected = sm.Logit(y, x).fit(disp=0)
+    assert abs(fit["coefficients"]["party_ac"] - expected.params[1]) < 1e-6
+    assert abs(fit["std_errors"]["party_ac"] - expected.bse[1]) < 1e-6
+    summary = regression.summary()
+    assert summary["Odds Ratios"]["party_ac"] > 1 and summary["Model Summary"]["Combats"] == 240
+
+    # a store written before design inputs were stored still takes new rows, without them
+    import json
+    import os
+    old_path = str(tmp_path / "old")
+    run_bulk_simulations(make_duel(), 10, seed=1, store_path=old_path)
+    header_path = os.path.join(old_path, "header.json")
+    with open(header_path) as f:
+        header = json.load(f)
+    del header["design"]
+    header["columns"] = [c for c in header["columns"] if not c["name"].startswith("design_")]
+    with open(header_path, "w") as f:
+        json.dump(header, f)
+    run_bulk_simulations(make_duel(), 10, seed=2, store_path=old_path)
+    old_store = ResultsStore(old_path)
+    assert len(old_store) == 20 and old_store.design == []
+
+
+def test_checkpointed_run_resumes_with_identical_results(tmp_path):
+    import random
+    from simulation.bulk_runner import run_bulk_simulations
+    import json
+    from simulation.bulk_runner import get_run_aggregates
+    random.seed(11)
+    uninterrupted = run_bulk_simulations(make_duel(), 30)
+    winners = dict(get_run_aggregates().winners)
+    random.seed(11)
+    run_bulk_simulations(make_duel(), 20, checkpoint_path=str(tmp_path), checkpoint_every=7)
+    random.seed(99)  # the restored RNG state must win over whatever state we come back with
+    resumed = run_bulk_simulations(make_duel(), 30, checkpoint_path=str(tmp_path), checkpoint_every=7)
+    pd.testing.assert_frame_equal(resumed, uninterrupted)
+    assert get_run_aggregates().combats == 30 and get_run_aggregates().winners == winners
+    with pytest.raises(ValueError):
+        run_bulk_simulations(make_duel(party_ac=15), 30, checkpoint_path=str(tmp_path))
+
+    # checkpoints in the old format are refused outright
+    state_path = tmp_path / "state.json"
+    state = json.loads(state_path.read_text())
+    del state["version"], state["aggregates"]
+    state_path.write_text(json.dumps(state))
+    with pytest.raises(ValueError, match="older format"):
+        run_bulk_simulations(make_duel(), 40, checkpoint_path=str(tmp_path))
+
+    # resuming into a store that already held another run's rows keeps them
+    store, checkpoint = str(tmp_path / "store"), str(tmp_path / "store_checkpoint")
+    run_bulk_simulations(make_duel(), 5, seed=1, store_path=store)
+    run_bulk_simulations(make_duel(), 12, seed=2, store_path=store, checkpoint_path=checkpoint, checkpoint_every=5)
+    assert len(run_bulk_simulations(make_duel(), 12, seed=2, store_path=store, checkpoint_path=checkpoint)) == 17
+
+
+def test_streaming_aggregates_merge_like_one_pass_and_report_spells():
+    import numpy as np
+    from simulation.aggregates import QuantileSketch, RunAggregates, RunningStats
+    from simulation.bulk_runner import compute_spell_effectiveness, get_run_aggregates, run_bulk_simulations
+    values = np.random.default_rng(0).gamma(2.0, 10.0, 3000)
+    whole, parts = RunningStats(), [RunningStats(), RunningStats()]
+    sketch, sketch_parts = QuantileSketch(), [QuantileSketch(), QuantileSketch()]
+    for i, x in enumerate(values):
+        whole.add(x)
+        parts[i % 2].add(x)
+        sketch_parts[i % 2].add(x)
+    merged = parts[0].merge(parts[1])
+    assert merged.count == 3000 and abs(merged.mean - values.mean()) < 1e-9
+    assert abs(merged.variance - values.var(ddof=1)) < 1e-6 and abs(whole.variance - merged.variance) < 1e-6
+    sketch = sketch_parts[0].merge(sketch_parts[1])
+    for q in (0.1, 0.5, 0.9):
+        exact = np.quantile(values, q)
+        assert abs(sketch.quantile(q) - exact) <= 0.02 * exact + 0.5
+
+    df = run_bulk_simulations(make_duel(), 60, seed=6)
+    run = get_run_aggregates()
+    assert run.combats == 60 and run.winners.get("party", 0) == (df["winner"] == "party").sum()
+    assert run.metrics["rounds"].stats.total == df["rounds"].sum()
+    edges, counts = run.metrics["rounds"].histogram.binned(max_bins=5)
+    assert sum(counts) == 60 and len(edges) == len(counts) + 1 <= 6
+    halves = RunAggregates()
+    for seed_start in (0, 30):
+        run_bulk_simulations(make_duel(), 30, seed=6, start=seed_start)
+        halves.merge(get_run_aggregates())
+    assert halves.metrics["rounds"].histogram.counts == run.metrics["rounds"].histogram.counts
+    assert abs(halves.entities["P"]["damage_dealt"].stats.mean - df["damage_dealt_P"].fillna(0).mean()) < 1e-9
+
+    records = [
+        {"spell": "Fire Bolt", "success": True, "effect_type": "damage", "amount": 7},
+        {"spell": "Fire Bolt", "success": False, "effect_type": None, "amount": 0},
+        {"spell": "Fire Bolt", "success": True, "effect_type": "damage", "amount": 10},
+        {"spell": "Cure Wounds", "success": True, "effect_type": "healing", "amount": 6},
+    ]
+    report = compute_spell_effectiveness(records)
+    assert report["Fire Bolt"]["total_damage"] == 17 and report["Fire Bolt"]["avg_damage_when_hit"] == 17 / 3
+    assert report["Cure Wounds"]["avg_healing_per_cast"] == 6 and abs(report["Fire Bolt"]["success_rate"] - 200 / 3) < 1e-9
+
+
+def test_event_log_replays_combats_without_changing_them(tmp_path):
+    from mechanics import event_log
+    from mechanics.event_log import EventLogReader
+    from simulation.bulk_runner import run_bulk_simulations
+    from simulation.replay import combat_outcomes, replay
+    path = str(tmp_path / "log")
+    plain = run_bulk_simulations(make_duel(), 25, seed=8, start=100)
+    logged = run_bulk_simulations(make_duel(), 25, seed=8, start=100, event_log_path=path)
+    pd.testing.assert_frame_equal(logged, plain)
+    assert event_log.active is None
+
+    reader = EventLogReader(path)
+    assert reader.combats() == list(range(100, 125))
+    attacks = reader.select(combat=104)
+    assert (attacks["kind"] == event_log.ATTACK).sum() == logged["attack_count_P"].fillna(0)[4] + \
+        logged["attack_count_E"].fillna(0)[4]
+    assert combat_outcomes(path) == list(zip(range(100, 125), logged["rounds"], logged["winner"]))
+
+    steps = list(replay(path, 104))
+    state = steps[-1][1]
+    assert {name: c["hp"] for name, c in state.creatures.items()} == {"P": logged["hp_end_P"][4], "E": logged["hp_end_E"][4]}
+    assert state.winner == logged["winner"][4]
+    only_e = [event for event, _, _ in replay(path, 104, entity="E")]
+    assert only_e and all("E" in (e["actor"], e["target"]) or e["kind"] in ("combat_start", "combat_end") for e in only_e)
+
+    # a later run appends to the log, and a troop volley is one attack record
+    run_bulk_simulations(make_duel(), 5, seed=9, start=200, event_log_path=path)
+    reader = EventLogReader(path)
+    assert reader.combats() == list(range(100, 125)) + list(range(200, 205))
+    assert combat_outcomes(path)[:25] == list(zip(range(100, 125), logged["rounds"], logged["winner"]))
+    from characters.troop import Troop
+    from mechanics.combat import assign_default_actions
+    from mechanics.mass_combat import volley
+    from mechanics.position import Position
+    p, _ = make_duel()
+    goblins = Troop("Goblins", 20, {"STR": 10, "DEX": 14}, 13, 2, 30, 7, [], 2, weapon=dict(p.weapon))
+    assign_default_actions(goblins)
+    goblins.position = Position(10, 0, 0)
+    stats = {"attack_count": {}, "crit_count": {}, "total_crits": 0, "damage_dealt": {}}
+    with event_log.EventLog(path) as log:
+        log.begin(300)
+        previous = event_log.activate(log)
+        try:
+            volley(goblins, p, 12, stats)
+        finally:
+            event_log.activate(previous)
+    (record,) = [e for e in EventLogReader(path).events(300) if e["kind"] == "attack"]
+    assert (record["label"], record["a"], record["c"]) == (event_log.VOLLEY, 12, stats["crit_count"]["Goblins"])
+
+
+def test_distributed_run_survives_lost_worker_and_merges_once():
+    import multiprocessing
+    from multiprocessing.connection import Client
+    from simulation.bulk_runner import run_bulk_simulations
+    from simulation.distributed import Coordinator, run_worker, summarize_results
+    scenarios = {"duel": make_duel(), "armoured": make_duel(party_ac=16)}
+    coordinator = Coordinator(scenarios, 40, seed=4, job_size=15).start()
+    try:
+        # a worker that takes a job and vanishes
+        lost = Client(coordinator.address, authkey=coordinator.authkey)
+        lost.send(("hello", "lost"))
+        assert lost.recv()[0] == "job"
+        lost.close()
+        workers = [multiprocessing.Process(target=run_worker, args=(coordinator.address, coordinator.authkey))
+                   for _ in range(3)]
+        for w in workers:
+            w.start()
+        summaries = coordinator.wait(timeout=60)
+        for w in workers:
+            w.join(10)
+    finally:
+        coordinator.close()
+    assert coordinator.retries >= 1
+    # no shared default key: a public listener or a worker without a key is refused
+    with pytest.raises(ValueError):
+        Coordinator(scenarios, 10, address=("0.0.0.0", 0))
+    with pytest.raises(ValueError):
+        run_worker(("127.0.0.1", 1))
+    for name, entities in scenarios.items():
+        expected = summarize_results(run_bulk_simulations(entities, 40, seed=4), ["P", "E"])
+        aggregates = summaries[name].pop("aggregates")
+        assert summaries[name] == expected
+        assert aggregates.combats == 40 and aggregates.metrics["rounds"].stats.total == expected["rounds_sum"]
+
+
+def test_service_streams_progress_and_caches_results(monkeypatch):
+    import asyncio
+    import json
+    from simulation.service import SimulationService, handle_connection
+
+    weapon = {"damage_dice": "1d4", "modifier": "STR", "damage_type": "slashing", "range": 5}
+    entity = {"ability_scores": {"STR": 12}, "ac": 10, "hp": 3, "weapon": weapon}
+    payload = {
+        "party": [dict(entity, name="P", position=[0, 0, 0])],
+        "enemies": [dict(entity, name="E", ac=12, position=[5, 0, 0])],
+        "num_simulations": 40,
+        "seed": 2,
+    }
+
+    async def scenario():
+        service = SimulationService(max_workers=2, chunk_size=10)
+        server = await asyncio.start_server(lambda r, w: handle_connection(service, r, w), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+
+        async def post():
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            body = json.dumps(payload).encode()
+            writer.write(b"POST /simulate HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+            await writer.drain()
+            data = await reader.read()
+            writer.close()
+            return [json.loads(line) for line in data.split(b"\r\n\r\n", 1)[1].splitlines()]
+
+        try:
+            first = await post()
+            second = await post()
+        finally:
+            server.close()
+            service.close()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert [m["progress"] for m in first[:-1]] == [10, 20, 30, 40]
+    assert not first[-1]["cached"] and second == [{"result": first[-1]["result"], "cached": True}]
+    assert first[-1]["result"]["combats"] == 40
+
+    # results of an older engine are never served from the cache
+    from mechanics import combat
+    from simulation.service import request_key
+    key = request_key(payload)
+    monkeypatch.setattr(combat, "ENGINE_VERSION", combat.ENGINE_VERSION + 1)
+    assert request_key(payload) != key
+
+    # the in-memory cache keeps only the most recently used results
+    service = SimulationService(max_workers=1, max_cached=2)
+    try:
+        for key in ("a", "b"):
+            service._store(key, {"key": key})
+        assert service._cached("a") == {"key": "a"}
+        service._store("c", {"key": "c"})
+        assert list(service.cache) == ["a", "c"] and service._cached("b") is None
+    finally:
+        service.close()
+
+    # the service and its workers never import the tkinter GUI
+    import subprocess
+    import sys
+    code = "import sys, simulation.service; sys.exit('main' in sys.modules or 'tkinter' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
+
+
+def test_run_pipeline_reuses_cached_scenario_and_tops_up(tmp_path, monkeypatch):
+    import main
+    monkeypatch.chdir(tmp_path)
+    party, enemy = make_duel()
+    first, _ = main.run_pipeline([party], [enemy], 30, reports="none")
+    party, enemy = make_duel()
+    again, _ = main.run_pipeline([party], [enemy], 30, reports="none")
+    assert again["Win Rate (%)"] == first["Win Rate (%)"]
+    assert len(pd.read_csv("combat_stats.csv")) == 30
+
+    party, enemy = make_duel()
+    main.run_pipeline([party], [enemy], 45, reports="none")
+    history = pd.read_csv("combat_stats.csv")
+    assert len(history) == 45 and list(history["combat_nbr"]) == list(range(1, 46))
+
+    # a cache hit still analyses the current history, which other scenarios add to
+    party, enemy = make_duel()
+    before, _ = main.run_pipeline([party], [enemy], 45, reports="none")
+    party, enemy = make_duel(party_ac=18)
+    main.run_pipeline([party], [enemy], 20, reports="none")
+    party, enemy = make_duel()
+    after, _ = main.run_pipeline([party], [enemy], 45, reports="none")
+    assert after["Win Rate (%)"] == before["Win Rate (%)"]
+    history_mean = "Party Win % Mean"
+    assert after["Monte Carlo Analysis"][history_mean] != before["Monte Carlo Analysis"][history_mean]
+
+    from simulation.scenario_cache import ScenarioCache
+    cache = ScenarioCache(main.SCENARIO_CACHE, max_entries=1)
+    assert len(cache.entries()) == 2
+    cache.evict()
+    assert len(cache.entries()) == 1
+    # draws survive a reload of the history, so win rates agree between sessions
+    history = pd.read_csv("combat_stats.csv")
+    history.loc[0, "winner"] = "draw"
+    history.to_csv("combat_stats.csv", index=False)
+    reloaded = main._load_history("combat_stats.csv")
+    assert len(reloaded) == len(history) and (reloaded["winner"] == "draw").sum() == 1
+
+
+def test_gui_reruns_hit_the_scenario_cache_until_the_seed_changes(tmp_path, monkeypatch):
+    import main
+
+    class Field:
+        def __init__(self, value):
+            self.value = value
+
+        def get(self):
+            return self.value
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "build_party_member", lambda form: make_duel()[0])
+    monkeypatch.setattr(main, "build_enemy", lambda form: make_duel()[1])
+    monkeypatch.setattr(main.messagebox, "showinfo", lambda *args: None)
+    monkeypatch.setattr(main.messagebox, "showerror", lambda title, message: pytest.fail(message))
+    monkeypatch.setattr(main, "_finish_reports", lambda results, jobs, reports: (results, jobs))
+    app = main.CombatApp.__new__(main.CombatApp)
+    app.party_forms, app.enemy_forms = [None], [None]
+    app.num_simulations, app.seed = Field("20"), Field("0")
+
+    app.run_simulation()
+    app.run_simulation()  # same scenario and seed: nothing new is played
+    assert len(pd.read_csv("combat_stats.csv")) == 20
+    app.num_simulations = Field("30")
+    app.run_simulation()  # a larger count only plays the missing combats
+    assert len(pd.read_csv("combat_stats.csv")) == 30
+    app.seed = Field("1")
+    app.run_simulation()
+    assert len(pd.read_csv("combat_stats.csv")) == 60
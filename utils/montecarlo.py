@@ -2,13 +2,25 @@ import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from fpdf import FPDF
+from simulation.analysis import WIN_INDICATOR, analyze_results
+from simulation.results_store import ResultsStore, is_results_store
+from utils.report_jobs import ArtifactJob
 
 class MonteCarloSimulation:
-    def __init__(self, data_path, num_simulations=10000):
-        """Initialize the Monte Carlo Simulation class."""
+    # aggregates this analysis needs from simulation.analysis.analyze_results
+    REQUIRED_METRICS = (WIN_INDICATOR,)
+
+    def __init__(self, data_path, num_simulations=10000, seed=None):
+        """Initialize the Monte Carlo Simulation class.
+
+        A fixed seed makes identical aggregates produce identical results, so
+        cached plots and reports can be reused.
+        """
         self.data_path = data_path
         self.num_simulations = num_simulations
+        self.seed = seed
         self.df = None
+        self.aggregates = None
         self.results = []
     
     def load_data(self):
@@ -27,7 +39,10 @@ class MonteCarloSimulation:
         The simulation models the **party win percentage**; results are clipped to
         [0,100] and the complementary enemy win percentage is implicit.
         """
-        if 'Win Percentage' not in self.df.columns:
+        if self.aggregates is not None and WIN_INDICATOR in self.aggregates:
+            win_percentage_mean = self.aggregates[WIN_INDICATOR]["mean"]
+            win_percentage_std = self.aggregates[WIN_INDICATOR]["std"]
+        elif 'Win Percentage' not in self.df.columns:
             # derive win percentage from winner field if available
             if 'winner' in self.df.columns:
                 win_pct = (self.df['winner'] == 'party').astype(int) * 100
@@ -39,98 +54,131 @@ class MonteCarloSimulation:
             win_percentage_mean = self.df['Win Percentage'].mean()
             win_percentage_std = self.df['Win Percentage'].std()
 
-        simulated_results = np.random.normal(win_percentage_mean, win_percentage_std, self.num_simulations)
+        rng = np.random.default_rng(self.seed)
+        simulated_results = rng.normal(win_percentage_mean, win_percentage_std, self.num_simulations)
         # clip to valid percentage range
         simulated_results = np.clip(simulated_results, 0, 100)
         self.results = simulated_results
     
     def plot_simulation_results(self):
         """Plots the Monte Carlo simulation results."""
-        plt.figure(figsize=(8, 6))
-        plt.hist(self.results, bins=50, alpha=0.75, density=True)
-        plt.title("Monte Carlo Simulation Results")
-        plt.xlabel("Simulated Win Percentage")
-        plt.ylabel("Frequency")
-        plt.grid(True)
-        # use a file name that matches what the visualization module expects
-        plt.savefig("monte_carlo_plot.png")
+        plot_monte_carlo_results(self.results, "monte_carlo_plot.png")
     
     def generate_pdf_report(self, output_path="MonteCarlo_Report.pdf"):
         """Generates a PDF report with the simulation results."""
-        pdf = FPDF()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.add_page()
-        
-        # title
-        pdf.set_font("Arial", "B", 16)
-        pdf.cell(200, 10, "Monte Carlo Simulation Report", ln=True, align='C')
-        pdf.ln(10)
-
-        def add_section(title):
-            pdf.set_font("Arial", "B", 14)
-            pdf.cell(0, 10, title, ln=True)
-            pdf.ln(5)
-        def add_text(txt):
-            pdf.set_font("Arial", "", 12)
-            pdf.multi_cell(0, 10, txt)
-            pdf.ln(5)
-        def add_table(data):
-            pdf.set_font("Arial", "B", 12)
-            colw = 90
-            pdf.cell(colw, 10, "Metric", border=1)
-            pdf.cell(colw, 10, "Value", border=1)
-            pdf.ln()
-            pdf.set_font("Arial", "", 10)
-            for k, v in data.items():
-                pdf.cell(colw, 10, str(k), border=1)
-                pdf.cell(colw, 10, str(v), border=1)
-                pdf.ln()
-            pdf.ln(5)
+        write_monte_carlo_report(self.summary(), "monte_carlo_plot.png", output_path)
 
-        add_section("Simulation Statistics")
+    def summary(self):
+        """Summary statistics of the simulated party win percentages."""
         # compute confidence interval using percentiles in case of extreme values
         ci_lower = np.percentile(self.results, 2.5)
         ci_upper = np.percentile(self.results, 97.5)
-        add_table({
-            "Party Win % Mean": f"{np.mean(self.results):.2f}%",
-            "Std Dev": f"{np.std(self.results):.2f}%",
-            "Min Party Win %": f"{np.min(self.results):.2f}%",
-            "Max Party Win %": f"{np.max(self.results):.2f}%",
-            "Average Enemy Win %": f"{100 - np.mean(self.results):.2f}%",
-            "95% Confidence Interval": f"{ci_lower:.2f}% - {ci_upper:.2f}%"
-        })
-        pdf.image("monte_carlo_plot.png", x=10, w=180)
-        pdf.output(output_path)
+        return {
+            "Party Win % Mean": np.mean(self.results),
+            "Std Dev": np.std(self.results),
+            "Min Party Win %": np.min(self.results),
+            "Max Party Win %": np.max(self.results),
+            "Average Enemy Win %": 100 - np.mean(self.results),
+            "95% Confidence Interval": (ci_lower, ci_upper)
+        }
+
+    def artifact_jobs(self, image_path="monte_carlo_plot.png", report_path="MonteCarlo_Report.pdf"):
+        """Plot and PDF for utils.report_jobs.render_artifacts."""
+        return [
+            ArtifactJob(image_path, plot_monte_carlo_results, {"results": self.results, "output_path": image_path}),
+            ArtifactJob(report_path, write_monte_carlo_report,
+                        {"summary": self.summary(), "image_path": image_path, "output_path": report_path},
+                        depends_on=[image_path]),
+        ]
     
-    def run_analysis(self, df=None):
+    def run_analysis(self, df=None, aggregates=None, render=True):
         """Executes the full Monte Carlo simulation pipeline.
 
-        If a DataFrame is passed directly, use it instead of reading the CSV file.
+        If precomputed aggregates (from simulation.analysis.analyze_results) are
+        passed, they are used directly; otherwise a DataFrame passed directly is
+        used instead of reading the CSV file.  A data_path pointing at a
+        results store (simulation.results_store) is reduced chunk by chunk.  With render=False the plot and
+        PDF are left to artifact_jobs().
         """
-        if df is not None:
-            self.df = df
+        if aggregates is None and df is None and is_results_store(self.data_path):
+            # too large for a DataFrame: reduce the memory-mapped columns chunk by chunk
+            aggregates = analyze_results(ResultsStore(self.data_path), self.REQUIRED_METRICS) or {}
+        if aggregates is not None:
+            self.aggregates = aggregates
+            if not aggregates.get(WIN_INDICATOR, {}).get("n"):
+                print("Monte Carlo Analysis: no results available, skipping simulation.")
+                return
         else:
-            self.load_data()
+            if df is not None:
+                self.df = df
+            else:
+                self.load_data()
 
-        if self.df is None or self.df.empty:
-            print("Monte Carlo Analysis: data file is empty, skipping simulation.")
-            return
+            if self.df is None or self.df.empty:
+                print("Monte Carlo Analysis: data file is empty, skipping simulation.")
+                return
         self.run_simulation()
         # results may be nan if std or mean could not be calculated
         if self.results is None or len(self.results) == 0 or np.all(np.isnan(self.results)):
             print("Monte Carlo Analysis: insufficient data for simulation results, skipping plots/reports.")
             return None
-        self.plot_simulation_results()
-        self.generate_pdf_report()
+        if render:
+            self.plot_simulation_results()
+            self.generate_pdf_report()
         # return a summary dict suitable for inclusion in the master report
-        ci_lower = np.percentile(self.results, 2.5)
-        ci_upper = np.percentile(self.results, 97.5)
-        return {
-            "Party Win % Mean": np.mean(self.results),
-            "Std Dev": np.std(self.results),
-            "Min Party Win %": np.min(self.results),
-            "Max Party Win %": np.max(self.results),
-            "Average Enemy Win %": 100 - np.mean(self.results),
-            "95% Confidence Interval": (ci_lower, ci_upper)
-        }
+        return self.summary()
+
+
+def plot_monte_carlo_results(results, output_path="monte_carlo_plot.png"):
+    """Plots simulated win percentages and saves them as an image file."""
+    plt.figure(figsize=(8, 6))
+    plt.hist(results, bins=50, alpha=0.75, density=True)
+    plt.title("Monte Carlo Simulation Results")
+    plt.xlabel("Simulated Win Percentage")
+    plt.ylabel("Frequency")
+    plt.grid(True)
+    # use a file name that matches what the visualization module expects
+    plt.savefig(output_path)
+    plt.close()
+
+
+def write_monte_carlo_report(summary, image_path, output_path="MonteCarlo_Report.pdf"):
+    """Generates a PDF report from a MonteCarloSimulation summary."""
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+    
+    # title
+    pdf.set_font("Arial", "B", 16)
+    pdf.cell(200, 10, "Monte Carlo Simulation Report", ln=True, align='C')
+    pdf.ln(10)
+
+    def add_section(title):
+        pdf.set_font("Arial", "B", 14)
+        pdf.cell(0, 10, title, ln=True)
+        pdf.ln(5)
+    def add_table(data):
+        pdf.set_font("Arial", "B", 12)
+        colw = 90
+        pdf.cell(colw, 10, "Metric", border=1)
+        pdf.cell(colw, 10, "Value", border=1)
+        pdf.ln()
+        pdf.set_font("Arial", "", 10)
+        for k, v in data.items():
+            pdf.cell(colw, 10, str(k), border=1)
+            pdf.cell(colw, 10, str(v), border=1)
+            pdf.ln()
+        pdf.ln(5)
 
+    add_section("Simulation Statistics")
+    ci_lower, ci_upper = summary["95% Confidence Interval"]
+    add_table({
+        "Party Win % Mean": f"{summary['Party Win % Mean']:.2f}%",
+        "Std Dev": f"{summary['Std Dev']:.2f}%",
+        "Min Party Win %": f"{summary['Min Party Win %']:.2f}%",
+        "Max Party Win %": f"{summary['Max Party Win %']:.2f}%",
+        "Average Enemy Win %": f"{summary['Average Enemy Win %']:.2f}%",
+        "95% Confidence Interval": f"{ci_lower:.2f}% - {ci_upper:.2f}%"
+    })
+    pdf.image(image_path, x=10, w=180)
+    pdf.output(output_path)
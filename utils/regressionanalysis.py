@@ -1,13 +1,21 @@
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
+from scipy.special import expit
+from scipy.stats import norm
 
 import matplotlib.pyplot as plt
 
 from statsmodels.stats.outliers_influence import variance_inflation_factor
 from fpdf import FPDF
+from simulation.analysis import REGRESSION_FEATURES, regression_features
+from simulation.results_store import CHUNK_SIZE, DESIGN_PREFIX, PARTY_CODE, ResultsStore
+from utils.report_jobs import ArtifactJob
 
 class RegressionAnalysis:
+    # aggregates this analysis needs from simulation.analysis.analyze_results
+    REQUIRED_METRICS = (REGRESSION_FEATURES,)
+
     def __init__(self, data_path):
         """Initialize with dataset path."""
         self.data_path = data_path
@@ -16,32 +24,7 @@ class RegressionAnalysis:
     
     def load_data(self):
         """Loads data from CSV and prepares derived fields for regression."""
-        self.df = pd.read_csv(self.data_path)
-        # compute a numeric win percentage column if missing
-        if 'Win Percentage' not in self.df.columns and 'winner' in self.df.columns:
-            self.df['Win Percentage'] = (self.df['winner'] == 'party').astype(int) * 100
-
-        # derive aggregate features needed for regression
-        # total damage across all entities
-        damage_cols = [c for c in self.df.columns if c.startswith('damage_dealt_')]
-        if damage_cols:
-            self.df['Damage Dealt'] = self.df[damage_cols].sum(axis=1)
-
-        # initiative: minimum initiative order (earliest actor)
-        init_cols = [c for c in self.df.columns if c.startswith('initiative_order_')]
-        if init_cols:
-            self.df['Initiative'] = self.df[init_cols].min(axis=1)
-
-        # turns survived: average of all characters
-        turn_cols = [c for c in self.df.columns if c.startswith('turns_survived_')]
-        if turn_cols:
-            self.df['Turns Survived'] = self.df[turn_cols].mean(axis=1)
-
-        # drop any rows missing the core features or target
-        required = ['Turns Survived', 'Initiative', 'Damage Dealt', 'Win Percentage']
-        existing = [c for c in required if c in self.df.columns]
-        if existing:
-            self.df.dropna(subset=existing, inplace=True)
+        self.df = regression_features(pd.read_csv(self.data_path))
     
     def fit_regression(self):
         """Fits multiple linear regression."""
@@ -69,79 +52,51 @@ class RegressionAnalysis:
     
     def plot_residuals(self):
         """Generates residuals plot."""
-        residuals = self.results.resid
-        plt.figure(figsize=(8, 6))
-        plt.hist(residuals, bins=30, edgecolor='black', alpha=0.7)
-        plt.axvline(x=0, color='red', linestyle='--', linewidth=1)
-        plt.title("Residuals Distribution")
-        plt.xlabel("Residuals")
-        plt.ylabel("Frequency")
-        plt.savefig("residuals_plot.png")
+        plot_residuals_histogram(self.results.resid, "residuals_plot.png")
     
     def generate_pdf_report(self, output_path="Regression_Report.pdf"):
         """Generates a PDF report with results using formatted sections and tables."""
-        pdf = FPDF()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.add_page()
-
-        def add_section(title):
-            pdf.set_font("Arial", "B", 14)
-            pdf.cell(0, 10, title, ln=True)
-            pdf.ln(5)
-        def add_text(txt):
-            pdf.set_font("Arial", "", 12)
-            pdf.multi_cell(0, 10, txt)
-            pdf.ln(5)
-        def add_table(data):
-            pdf.set_font("Arial", "B", 12)
-            colw = 90
-            pdf.cell(colw, 10, "Metric", border=1)
-            pdf.cell(colw, 10, "Value", border=1)
-            pdf.ln()
-            pdf.set_font("Arial", "", 10)
-            for k, v in data.items():
-                pdf.cell(colw, 10, str(k), border=1)
-                pdf.cell(colw, 10, str(v), border=1)
-                pdf.ln()
-            pdf.ln(5)
-
-        add_section("Regression Analysis Report")
-
-        # model summary coefficients
-        coeffs = self.results.params if self.results is not None else {}
-        add_section("Coefficients")
-        coeff_dict = {str(k): round(float(v), 4) for k, v in coeffs.items()}
-        add_table(coeff_dict)
-
-        # r-squared and other stats
+        write_regression_report(self.summary(), "residuals_plot.png", output_path)
+
+    def summary(self):
+        """Coefficients, model statistics and VIF of the fitted model."""
+        summary = {}
         if self.results is not None:
-            stats_data = {
+            # coefficients
+            summary["Coefficients"] = self.results.params.to_dict()
+            # key statistics
+            summary["Model Summary"] = {
                 "R-squared": round(self.results.rsquared, 4),
                 "Adj. R-squared": round(self.results.rsquared_adj, 4),
                 "F-statistic": round(self.results.fvalue, 4) if hasattr(self.results, 'fvalue') else '',
                 "Prob (F-statistic)": round(self.results.f_pvalue, 4) if hasattr(self.results, 'f_pvalue') else ''
             }
-            add_section("Model Summary")
-            add_table(stats_data)
-
-        # VIF
-        add_section("Variance Inflation Factor (VIF)")
-        vif_data = self.calculate_vif()
-        vif_dict = {row['Feature']: round(row['VIF'], 4) for _, row in vif_data.iterrows()}
-        add_table(vif_dict)
-
-        # residuals plot
-        add_section("Residuals Distribution")
-        pdf.image("residuals_plot.png", x=10, w=180)
+            # VIF
+            vif = self.calculate_vif()
+            summary["VIF"] = {row['Feature']: round(row['VIF'], 4) for _, row in vif.iterrows()}
+        return summary
 
-        pdf.output(output_path)
+    def artifact_jobs(self, summary=None, image_path="residuals_plot.png", report_path="Regression_Report.pdf"):
+        """Residual plot and PDF for utils.report_jobs.render_artifacts."""
+        summary = summary if summary is not None else self.summary()
+        return [
+            ArtifactJob(image_path, plot_residuals_histogram,
+                        {"residuals": np.asarray(self.results.resid), "output_path": image_path}),
+            ArtifactJob(report_path, write_regression_report,
+                        {"summary": summary, "image_path": image_path, "output_path": report_path},
+                        depends_on=[image_path]),
+        ]
     
-    def run_analysis(self, df=None):
+    def run_analysis(self, df=None, aggregates=None, render=True):
         """Executes full regression analysis pipeline.
 
-        Can optionally accept a DataFrame directly, bypassing CSV loading.
+        Can optionally accept a DataFrame directly, or the aggregates computed
+        by simulation.analysis.analyze_results, bypassing CSV loading.  With
+        render=False the plot and PDF are left to artifact_jobs().
         """
-        if df is not None:
+        if aggregates is not None:
+            self.df = aggregates.get(REGRESSION_FEATURES)
+        elif df is not None:
             self.df = df
         else:
             self.load_data()
@@ -153,26 +108,234 @@ class RegressionAnalysis:
             print(f"Regression Analysis: missing required columns {required - set(self.df.columns)}, skipping.")
             return
         self.fit_regression()
-        self.plot_residuals()
-        self.generate_pdf_report()
         # prepare a summary that can be merged into other reports
-        summary = {}
-        if self.results is not None:
-            # coefficients
-            coeffs = self.results.params.to_dict()
-            summary["Coefficients"] = coeffs
-            # key statistics
-            stats_data = {
-                "R-squared": round(self.results.rsquared, 4),
-                "Adj. R-squared": round(self.results.rsquared_adj, 4),
-                "F-statistic": round(self.results.fvalue, 4) if hasattr(self.results, 'fvalue') else '',
-                "Prob (F-statistic)": round(self.results.f_pvalue, 4) if hasattr(self.results, 'f_pvalue') else ''
-            }
-            summary["Model Summary"] = stats_data
-            # VIF
-            vif = self.calculate_vif()
-            vif_dict = {row['Feature']: round(row['VIF'], 4) for _, row in vif.iterrows()}
-            summary["VIF"] = vif_dict
+        summary = self.summary()
+        if render:
+            self.plot_residuals()
+            write_regression_report(summary, "residuals_plot.png", "Regression_Report.pdf")
         return summary
 
 
+def fit_logistic_irls(store, features, chunk_size=CHUNK_SIZE, max_iter=25, tol=1e-8, ridge=1e-9):
+    """Logistic regression of party wins on store columns, one pass over the store per iteration.
+
+    A first pass gets the features' means and standard deviations; features
+    that never vary are dropped and the rest are standardised.  Each IRLS
+    (Newton) iteration then accumulates X'WX and the score chunk by chunk,
+    so memory does not grow with the number of rows.
+
+    Returns a dict with the coefficients (log-odds per unit of each input),
+    their standard errors, the log-likelihoods of the model and of the
+    intercept-only model, the iterations run and the dropped features.
+    """
+    n = 0
+    wins = 0
+    sums = np.zeros(len(features))
+    squares = np.zeros(len(features))
+    for chunk in store.iter_chunks(["winner"] + list(features), chunk_size):
+        x = np.column_stack([chunk[f].astype(np.float64) for f in features])
+        n += len(x)
+        wins += int(np.count_nonzero(chunk["winner"] == PARTY_CODE))
+        sums += x.sum(axis=0)
+        squares += np.square(x).sum(axis=0)
+    if n == 0:
+        raise ValueError("Results store is empty")
+    if wins in (0, n):
+        raise ValueError("Every combat in the store has the same outcome; nothing to regress")
+    mean = sums / n
+    sd = np.sqrt(np.maximum(squares / n - mean ** 2, 0))
+    varying = sd > 1e-9 * np.maximum(np.abs(mean), 1)
+    kept = [f for f, v in zip(features, varying) if v]
+    mean, sd = mean[varying], sd[varying]
+
+    rate = wins / n
+    null_ll = wins * np.log(rate) + (n - wins) * np.log(1 - rate)
+    beta = np.zeros(len(kept) + 1)
+    beta[0] = np.log(rate / (1 - rate))
+    converged = False
+    for iteration in range(1, max_iter + 1):
+        hessian = np.zeros((len(beta), len(beta)))
+        score = np.zeros(len(beta))
+        ll = 0.0
+        for chunk in store.iter_chunks(["winner"] + kept, chunk_size):
+            z = np.column_stack([np.ones(len(chunk["winner"]))] +
+                                [(chunk[f].astype(np.float64) - m) / s for f, m, s in zip(kept, mean, sd)])
+            y = (chunk["winner"] == PARTY_CODE).astype(np.float64)
+            eta = z @ beta
+            p = expit(eta)
+            hessian += z.T @ (z * (p * (1 - p))[:, None])
+            score += z.T @ (y - p)
+            ll += float(y @ eta - np.logaddexp(0, eta).sum())
+        step = np.linalg.solve(hessian + ridge * np.eye(len(beta)), score)
+        beta += step
+        if np.max(np.abs(step)) < tol:
+            converged = True
+            break
+
+    # back from standardised inputs to the inputs' own units
+    transform = np.eye(len(beta))
+    transform[0, 1:] = -mean / sd
+    transform[1:, 1:] = np.diag(1 / sd)
+    coefficients = transform @ beta
+    covariance = transform @ np.linalg.inv(hessian + ridge * np.eye(len(beta))) @ transform.T
+    names = ["const"] + kept
+    return {
+        "coefficients": dict(zip(names, coefficients)),
+        "std_errors": dict(zip(names, np.sqrt(np.diag(covariance)))),
+        "standardized": dict(zip(kept, beta[1:])),
+        "log_likelihood": ll,
+        "null_log_likelihood": null_ll,
+        "n": n,
+        "iterations": iteration,
+        "converged": converged,
+        "dropped": [f for f, v in zip(features, varying) if not v],
+    }
+
+
+class DesignRegression:
+    """Logistic regression of party wins on scenario inputs stored in a results store.
+
+    Unlike RegressionAnalysis, which regresses on combat outcomes (turns
+    survived, damage dealt) that follow from winning, the inputs here are
+    the design parameters varied between runs (see
+    simulation.results_store.design_inputs), so the coefficients say how the
+    odds of a party win change with each input.  Run every variant of the
+    encounter into the same store, then fit it with fit_logistic_irls.
+    """
+
+    def __init__(self, store_path, features=None, chunk_size=CHUNK_SIZE):
+        self.store_path = store_path
+        self.features = features
+        self.chunk_size = chunk_size
+        self.results = None
+
+    def fit(self):
+        store = ResultsStore(self.store_path)
+        features = self.features if self.features is not None else store.design
+        columns = [f"{DESIGN_PREFIX}{f}" for f in features]
+        fit = fit_logistic_irls(store, columns, self.chunk_size)
+        for key in ("coefficients", "std_errors", "standardized"):
+            fit[key] = {k[len(DESIGN_PREFIX):] if k.startswith(DESIGN_PREFIX) else k: v for k, v in fit[key].items()}
+        fit["dropped"] = [f[len(DESIGN_PREFIX):] for f in fit["dropped"]]
+        self.results = fit
+        return fit
+
+    def summary(self):
+        """Coefficients, odds ratios, p-values and fit statistics."""
+        fit = self.results
+        if fit is None:
+            return {}
+        z = {k: fit["coefficients"][k] / se for k, se in fit["std_errors"].items() if se > 0}
+        return {
+            "Coefficients": {k: round(float(v), 6) for k, v in fit["coefficients"].items()},
+            "Odds Ratios": {k: round(float(np.exp(v)), 4) for k, v in fit["coefficients"].items() if k != "const"},
+            "Std. Errors": {k: round(float(v), 6) for k, v in fit["std_errors"].items()},
+            "P-values": {k: round(float(2 * norm.sf(abs(v))), 4) for k, v in z.items()},
+            "Model Summary": {
+                "Combats": fit["n"],
+                "Log-Likelihood": round(fit["log_likelihood"], 4),
+                "Pseudo R-squared (McFadden)": round(float(1 - fit["log_likelihood"] / fit["null_log_likelihood"]), 4),
+                "Iterations": fit["iterations"],
+                "Converged": fit["converged"],
+            },
+            "Constant Inputs": list(fit["dropped"]),
+        }
+
+    def artifact_jobs(self, summary=None, image_path="design_effects.png", report_path="Design_Regression_Report.pdf"):
+        """Effect plot and PDF for utils.report_jobs.render_artifacts."""
+        summary = summary if summary is not None else self.summary()
+        return [
+            ArtifactJob(image_path, plot_standardized_effects,
+                        {"effects": dict(self.results["standardized"]), "output_path": image_path}),
+            ArtifactJob(report_path, write_regression_report,
+                        {"summary": summary, "image_path": image_path, "output_path": report_path,
+                         "image_title": "Effect of One Standard Deviation (log-odds)"},
+                        depends_on=[image_path]),
+        ]
+
+    def run_analysis(self, render=True):
+        """Fits the model and returns its summary; with render the plot and PDF are written too."""
+        self.fit()
+        summary = self.summary()
+        if render:
+            for job in self.artifact_jobs(summary):
+                job.run()
+        return summary
+
+
+def plot_standardized_effects(effects, output_path="design_effects.png"):
+    """Bar chart of the log-odds change per standard deviation of each input."""
+    names = list(effects)
+    plt.figure(figsize=(8, 6))
+    plt.barh(names, [effects[n] for n in names], edgecolor='black', alpha=0.7)
+    plt.axvline(x=0, color='red', linestyle='--', linewidth=1)
+    plt.title("Party Win Log-Odds per Standard Deviation")
+    plt.xlabel("Log-odds change")
+    plt.savefig(output_path, bbox_inches='tight')
+    plt.close()
+
+
+def plot_residuals_histogram(residuals, output_path="residuals_plot.png"):
+    """Plots the residual distribution and saves it as an image file."""
+    plt.figure(figsize=(8, 6))
+    plt.hist(residuals, bins=30, edgecolor='black', alpha=0.7)
+    plt.axvline(x=0, color='red', linestyle='--', linewidth=1)
+    plt.title("Residuals Distribution")
+    plt.xlabel("Residuals")
+    plt.ylabel("Frequency")
+    plt.savefig(output_path)
+    plt.close()
+
+
+def write_regression_report(summary, image_path, output_path="Regression_Report.pdf",
+                            image_title="Residuals Distribution"):
+    """Generates a PDF report from a RegressionAnalysis or DesignRegression summary."""
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+
+    def add_section(title):
+        pdf.set_font("Arial", "B", 14)
+        pdf.cell(0, 10, title, ln=True)
+        pdf.ln(5)
+    def add_table(data):
+        pdf.set_font("Arial", "B", 12)
+        colw = 90
+        pdf.cell(colw, 10, "Metric", border=1)
+        pdf.cell(colw, 10, "Value", border=1)
+        pdf.ln()
+        pdf.set_font("Arial", "", 10)
+        for k, v in data.items():
+            pdf.cell(colw, 10, str(k), border=1)
+            pdf.cell(colw, 10, str(v), border=1)
+            pdf.ln()
+        pdf.ln(5)
+
+    add_section("Regression Analysis Report")
+
+    # model summary coefficients
+    add_section("Coefficients")
+    coeff_dict = {str(k): round(float(v), 4) for k, v in summary.get("Coefficients", {}).items()}
+    add_table(coeff_dict)
+
+    # r-squared and other stats
+    if "Model Summary" in summary:
+        add_section("Model Summary")
+        add_table(summary["Model Summary"])
+
+    # design regression extras
+    for section in ("Odds Ratios", "P-values"):
+        if section in summary:
+            add_section(section)
+            add_table(summary[section])
+
+    # VIF
+    if "VIF" in summary or "Odds Ratios" not in summary:
+        add_section("Variance Inflation Factor (VIF)")
+        add_table(summary.get("VIF", {}))
+
+    # residuals plot
+    add_section(image_title)
+    pdf.image(image_path, x=10, w=180)
+
+    pdf.output(output_path)
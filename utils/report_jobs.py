@@ -0,0 +1,177 @@
+"""Parallel, content-cached rendering of report figures and PDFs.
+
+Each artifact (a PNG or a PDF) is described by an ArtifactJob: the module
+level function that renders it, the keyword arguments it is rendered from
+and the artifacts it embeds.  render_artifacts hashes those inputs (the
+keyword arguments in a canonical form, embedded files that are not jobs by
+their contents), skips any artifact whose file already exists with the same
+hash, and renders the rest in worker processes, figures first and the PDFs that embed them after.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+REPORT_CACHE = ".report_cache.json"
+
+
+def _canonical(value):
+    """JSON-able form of a job argument that is equal exactly for equal values.
+
+    Dicts are sorted by key, floats written exactly (float.hex), arrays and
+    pandas objects reduced to a hash of their data; other objects are
+    described by their type and attributes, never by their identity.
+    """
+    if value is None or isinstance(value, (bool, str)):
+        return value
+    if isinstance(value, (int, np.integer)) and not isinstance(value, np.bool_):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return {"float": float(value).hex()}
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if isinstance(value, dict):
+        items = [[_canonical(k), _canonical(v)] for k, v in value.items()]
+        return {"dict": sorted(items, key=lambda kv: json.dumps(kv[0], sort_keys=True))}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return {"set": sorted((_canonical(v) for v in value), key=lambda v: json.dumps(v, sort_keys=True))}
+    if isinstance(value, np.ndarray):
+        data = np.ascontiguousarray(value)
+        if data.dtype == object:
+            return {"array": [_canonical(v) for v in data.ravel().tolist()], "shape": list(data.shape)}
+        return {"array": hashlib.sha256(data.tobytes()).hexdigest(), "dtype": data.dtype.str, "shape": list(data.shape)}
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        hashed = pd.util.hash_pandas_object(value, index=True).to_numpy()
+        columns = list(value.columns) if isinstance(value, pd.DataFrame) else [value.name]
+        return {"pandas": hashlib.sha256(hashed.tobytes()).hexdigest(), "columns": _canonical(columns)}
+    if hasattr(value, "__dict__"):
+        return {"object": f"{type(value).__module__}.{type(value).__qualname__}", "attrs": _canonical(vars(value))}
+    return {"object": f"{type(value).__module__}.{type(value).__qualname__}", "repr": repr(value)}
+
+
+def _file_digest(path):
+    """Hash of a file's contents, or of its absence."""
+    h = hashlib.sha256()
+    if not os.path.exists(path):
+        return f"missing:{path}"
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ArtifactJob:
+    """One file to render: ``render(**kwargs)`` writes ``output_path``."""
+
+    def __init__(self, output_path, render, kwargs, depends_on=()):
+        self.output_path = output_path
+        self.render = render
+        self.kwargs = kwargs
+        self.depends_on = tuple(depends_on)
+
+    def run(self):
+        """Renders the artifact in the current process."""
+        self.render(**self.kwargs)
+        return self.output_path
+
+    def digest(self, dependency_digests=()):
+        """Hash of the renderer, its inputs and the artifacts it embeds."""
+        h = hashlib.sha256()
+        h.update(f"{self.render.__module__}.{self.render.__qualname__}".encode())
+        h.update(json.dumps(_canonical(self.kwargs), sort_keys=True).encode())
+        for dep in dependency_digests:
+            h.update(dep.encode())
+        return h.hexdigest()
+
+
+def _run_job(job):
+    return job.run()
+
+
+def _load_manifest(cache_path):
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+    return {}
+
+
+def _save_manifest(cache_path, manifest):
+    if not cache_path:
+        return
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, cache_path)
+
+
+def _stages(jobs):
+    """Splits jobs into dependency levels; a job runs after everything it embeds."""
+    by_path = {job.output_path: job for job in jobs}
+    level = {}
+
+    def depth(job, seen=()):
+        if job.output_path in level:
+            return level[job.output_path]
+        if job.output_path in seen:
+            raise ValueError(f"Circular artifact dependency on {job.output_path}")
+        deps = [by_path[d] for d in job.depends_on if d in by_path]
+        level[job.output_path] = 1 + max((depth(d, seen + (job.output_path,)) for d in deps), default=-1)
+        return level[job.output_path]
+
+    stages = {}
+    for job in jobs:
+        stages.setdefault(depth(job), []).append(job)
+    return [stages[k] for k in sorted(stages)]
+
+
+def render_artifacts(jobs, max_workers=None, cache_path=REPORT_CACHE):
+    """Renders every job whose inputs changed since the file was last written.
+
+    Args:
+        jobs: iterable of ArtifactJob.
+        max_workers: size of the process pool; 0 renders in this process.
+        cache_path: JSON manifest of output path -> input hash (None disables caching).
+
+    Returns:
+        Dictionary with the "rendered" and "reused" output paths.
+    """
+    jobs = list(jobs)
+    manifest = _load_manifest(cache_path)
+    digests = {}
+    rendered, reused = [], []
+
+    pool = ProcessPoolExecutor(max_workers=max_workers) if max_workers != 0 and len(jobs) > 1 else None
+    try:
+        for stage in _stages(jobs):
+            pending = []
+            for job in stage:
+                # embedded files that are not rendered here count by their contents
+                digest = job.digest([digests[d] if d in digests else _file_digest(d) for d in job.depends_on])
+                digests[job.output_path] = digest
+                if manifest.get(job.output_path) == digest and os.path.exists(job.output_path):
+                    reused.append(job.output_path)
+                else:
+                    pending.append(job)
+
+            if pool is not None and len(pending) > 1:
+                for path in pool.map(_run_job, pending):
+                    rendered.append(path)
+            else:
+                for job in pending:
+                    rendered.append(job.run())
+
+            for job in pending:
+                manifest[job.output_path] = digests[job.output_path]
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    _save_manifest(cache_path, manifest)
+    return {"rendered": rendered, "reused": reused}
@@ -2,6 +2,30 @@ from fpdf import FPDF
 import pandas as pd
 import os
 import numpy as np
+from simulation import analysis
+
+# aggregates generate_combat_report renders, requested from analysis.analyze_results
+REPORT_METRICS = (
+    analysis.WIN_RATE, analysis.ROUNDS, analysis.DAMAGE, analysis.DAMAGE_PER_ATTACK,
+    analysis.CRITS, analysis.TURNS_NO_DAMAGE, analysis.HP_END, analysis.TURNS_SURVIVED,
+    analysis.ACTIONS, analysis.MOVEMENT, analysis.DAMAGE_DISTRIBUTION, analysis.SURVIVAL_CURVE,
+)
+
+# figures generate_combat_report embeds when they exist
+DISTRIBUTION_IMAGES = ["damage_distribution.png", "turns_survived_distribution.png", "rounds_distribution.png",
+                       "survival_curve.png"]
+MONTE_CARLO_IMAGE = "monte_carlo_plot.png"
+
+
+def combat_report_job(results, output_path="combat_simulation_report.pdf"):
+    """Combat report job for utils.report_jobs.render_artifacts."""
+    from utils.report_jobs import ArtifactJob
+    # raw per-combat series only feed the figures, not the report itself
+    report_results = {k: v for k, v in results.items() if k not in ("damage_values", "round_values")}
+    return ArtifactJob(output_path, generate_combat_report,
+                       {"results": report_results, "output_path": output_path},
+                       depends_on=DISTRIBUTION_IMAGES + [MONTE_CARLO_IMAGE])
+
 
 def generate_combat_report(results, output_path):
     """Generates a structured PDF report from combat simulation results."""
@@ -133,7 +157,7 @@ def generate_combat_report(results, output_path):
             elif isinstance(val, dict):
                 add_table(val)
         # include histogram images if generated
-        for img in ["damage_distribution.png", "turns_survived_distribution.png", "rounds_distribution.png", "survival_curve.png"]:
+        for img in DISTRIBUTION_IMAGES:
             add_image(img)
 
     # Monte Carlo Analysis
@@ -153,7 +177,7 @@ def generate_combat_report(results, output_path):
                 val = round(float(v), 2)
                 monte_carlo_fixed[str(k)] = f"{val}%" if is_pct else val
         add_table(monte_carlo_fixed)
-        add_image("monte_carlo_plot.png")
+        add_image(MONTE_CARLO_IMAGE)
 
     # Regression Analysis
     if "Regression Analysis" in results and results["Regression Analysis"]: